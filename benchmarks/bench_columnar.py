@@ -0,0 +1,75 @@
+"""SEARCH on the columnar snapshot against the SQL path.
+
+Usage: python benchmarks/bench_columnar.py [sizes ...]
+
+"sql" is DatabaseThread.handle_search, "columnar" ColumnarSnapshot.search
+on the same data (with numpy when it is installed, the stdlib masks
+otherwise). Both build the same result dicts; neither goes through the
+request queue. The load column is the snapshot's startup cost, "routed"
+tells whether DatabaseThread.search would use the snapshot (prefers()).
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from server.columnar import ColumnarSnapshot
+from server.database_thread import DatabaseThread
+
+sys.path.insert(0, os.path.dirname(__file__))
+from bench_fts import timed
+
+ROOMS = ["Salon", "Chambre", "Cuisine", "Bureau", "Entree", "Salle de bain", "Grenier", "Cave"]
+TYPES = ["chaise", "table", "lit", "armoire", "canape", "lampe", "etagere", "commode", "bureau", "tapis"]
+COLORS = ["Rouge", "Vert", "Bleu", "Noir", "Blanc", "Chene"]
+EMPTY = {"type": None, "room": None, "color": None, "name": None}
+QUERIES = [
+    ("room", {"room": "Salon"}, {}),
+    ("room+type+color", {"room": "Salon", "type": "canape", "color": "Bleu"}, {}),
+    ("price<50", {}, {"ranges": {"price": (None, 50)}}),
+    ("type, x<=80, top 20", {"type": "table"}, {"ranges": {"x_dimension": (None, 80)}, "order_by": "price", "top_k": 20}),
+    ("all, page by -price", {}, {"order_by": "-price", "limit": 50}),
+]
+
+
+def populate(database, rows):
+    for table, names in (("rooms", ROOMS), ("types", TYPES), ("colors", COLORS)):
+        for name in names:
+            getattr(database, "add_" + table[:-1])(name)
+    rng = random.Random(0)
+    database.cursor.executemany(
+        "INSERT INTO fournitures (name, room, type, color, x_dimension, y_dimension, image_path, price) VALUES (?, ?, ?, ?, ?, ?, 'None', ?)",
+        ((f"item{i}", rng.randint(1, len(ROOMS)), rng.randint(1, len(TYPES)), rng.randint(1, len(COLORS)),
+          rng.randint(20, 300), rng.randint(20, 300), rng.randint(5, 3000)) for i in range(rows)),
+    )
+    database.conn.commit()
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100000, 1000000]
+    print(f"{'rows':>8}{'load s':>8}{'query':>22}{'matches':>9}{'sql ms':>10}{'columnar ms':>13}{'routed':>8}")
+    for rows in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            database_thread = DatabaseThread(db_name=os.path.join(tmp, "bench.db"))
+            populate(database_thread.database, rows)
+            database_thread.dimension_cache.load(database_thread.database)
+            snapshot = ColumnarSnapshot()
+            started = time.perf_counter()
+            snapshot.load(database_thread.database)
+            load = time.perf_counter() - started
+            for label, filters, options in QUERIES:
+                data = dict(options, filters=dict(EMPTY, **filters), filter_on={key: key in filters for key in EMPTY})
+                expected = database_thread.handle_search(data)
+                assert snapshot.supports(data)
+                matches = len(expected if isinstance(expected, list) else expected["results"])
+                sql_ms = timed(lambda: database_thread.handle_search(data), repeat=3)
+                columnar_ms = timed(lambda: snapshot.search(data, database_thread.dimension_cache), repeat=3)
+                print(f"{rows:>8}{load:>8.1f}{label:>22}{matches:>9}{sql_ms:>10.1f}{columnar_ms:>13.1f}{'yes' if snapshot.prefers(data) else 'no':>8}")
+            database_thread.database.close()
+
+
+if __name__ == "__main__":
+    main()
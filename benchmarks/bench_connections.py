@@ -0,0 +1,86 @@
+"""Compare the threaded and asyncio server modes under many idle connections.
+
+Usage: python benchmarks/bench_connections.py [connections ...]
+
+A server is started in a child process for each mode. The benchmark opens the
+requested number of connections, makes each of them issue one request so the
+server really holds per-connection state, then reads the server's resident
+memory and thread count from /proc.
+"""
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+PORT = 10050
+
+
+def start_server(mode, db_name):
+    code = (
+        "from server.server import Server;"
+        f"Server(port={PORT}, new_database=True, db_name={db_name!r}, mode={mode!r}, backlog=4096).start()"
+    )
+    process = subprocess.Popen(
+        [sys.executable, "-c", code], cwd=ROOT,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", PORT)).close()
+            return process
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError(f"{mode} server did not start")
+
+
+def proc_status(pid):
+    status = {}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            status[key] = value.strip()
+    return int(status["VmRSS"].split()[0]), int(status["Threads"])
+
+
+def run(mode, connections):
+    with tempfile.TemporaryDirectory() as tmp:
+        process = start_server(mode, os.path.join(tmp, "bench.db"))
+        sockets = []
+        try:
+            rss_before, _ = proc_status(process.pid)
+            started = time.perf_counter()
+            for _ in range(connections):
+                sock = socket.create_connection(("127.0.0.1", PORT))
+                sock.sendall(json.dumps({"command": "DISCONNECT"}).encode("utf-8"))
+                sock.recv(4096)
+                sockets.append(sock)
+            elapsed = time.perf_counter() - started
+            rss_after, threads = proc_status(process.pid)
+            return rss_before, rss_after, threads, elapsed
+        finally:
+            for sock in sockets:
+                sock.close()
+            process.kill()
+            process.wait()
+
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [100, 1000, 2000]
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    print(f"{'mode':<10}{'conns':>8}{'rss KiB':>12}{'KiB/conn':>10}{'threads':>9}{'setup s':>9}")
+    for connections in counts:
+        for mode in ("threaded", "asyncio"):
+            rss_before, rss_after, threads, elapsed = run(mode, connections)
+            per_connection = (rss_after - rss_before) / connections
+            print(f"{mode:<10}{connections:>8}{rss_after:>12}{per_connection:>10.1f}{threads:>9}{elapsed:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
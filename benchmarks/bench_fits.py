@@ -0,0 +1,70 @@
+"""Limited FITS latency ordered by price, against the number of fitting rows.
+
+Usage: python benchmarks/bench_fits.py [rows]
+
+The catalog holds rows tables of 100 to 300 by 100 to 300, plus a number
+of 20 by 20 ones; FITS asks for a 50 by 50 space, so only those fit.
+"index" walks the (type, price) index checking the space on each row,
+"rtree" takes the fitting rows from the R-tree and sorts them;
+"search_details" is what it picks after probing the R-tree for
+FITS_PROBE_LIMIT rows. The second page goes through the keyset.
+"""
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from server import database as database_module
+from server.database import Database
+
+sys.path.insert(0, os.path.dirname(__file__))
+from bench_fts import timed
+
+FILTERS = {"type": "Table", "room": None, "color": None, "name": None}
+FILTER_ON = {"type": True, "room": False, "color": False, "name": False}
+FITS = (50, 50, True)
+LIMIT = 11
+
+
+def populate(database, rows, fitting, rng):
+    database.add_room("Salon")
+    database.add_type("Table")
+    database.add_color("Rouge")
+    database.cursor.executemany(
+        "INSERT INTO fournitures (name, room, type, color, x_dimension, y_dimension, image_path, price) VALUES (?, 1, 1, 1, ?, ?, 'None', ?)",
+        [(f"table{i}", rng.randint(100, 300), rng.randint(100, 300), rng.randint(1, 10000)) for i in range(rows)],
+    )
+    database.cursor.executemany(
+        "INSERT INTO fournitures (name, room, type, color, x_dimension, y_dimension, image_path, price) VALUES (?, 1, 1, 1, 20, 20, 'None', ?)",
+        [(f"small{i}", rng.randint(1, 10000)) for i in range(fitting)],
+    )
+    database.conn.commit()
+
+
+def pages(database):
+    first = database.search_details(FILTERS, FILTER_ON, limit=LIMIT, order_by="price", fits=FITS)
+    last = first[-1]
+    database.search_details(FILTERS, FILTER_ON, limit=LIMIT, order_by="price", fits=FITS, after_id=last[0], after_value=last[8])
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 300_000
+    probe_limit = database_module.FITS_PROBE_LIMIT
+    print(f"{'fitting':>8}{'index ms':>11}{'rtree ms':>11}{'search_details ms':>19}")
+    for fitting in (3, 100, 1000, 10_000, 100_000):
+        with tempfile.TemporaryDirectory() as tmp:
+            database = Database(os.path.join(tmp, "bench.db"))
+            populate(database, rows, fitting, random.Random(0))
+            times = []
+            for limit in (0, rows + fitting + 1, probe_limit):
+                database_module.FITS_PROBE_LIMIT = limit
+                times.append(timed(lambda: pages(database)))
+            database_module.FITS_PROBE_LIMIT = probe_limit
+            database.close()
+        print(f"{fitting:>8}" + "".join(f"{ms:>{width}.2f}" for ms, width in zip(times, (11, 11, 19))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Name search latency: LIKE against the FTS5 name index.
+
+Usage: python benchmarks/bench_fts.py [sizes ...]
+
+"like" is the substring search callers had to build themselves
+(name LIKE '%word%'), which scans every row. "fts" is the SEARCH "text"
+path: a prefix match on the FTS5 index, and "ranked" the same match
+ordered by relevance (the default for text searches without a limit).
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from server.database import Database
+
+WORDS = ["canape", "chaise", "table", "lampe", "armoire", "bureau", "lit", "etagere",
+         "fauteuil", "commode", "buffet", "tabouret", "miroir", "tapis", "banc", "console"]
+ADJECTIVES = ["bleu", "rouge", "vert", "noir", "blanc", "chene", "noyer", "metal",
+              "velours", "cuir", "rotin", "verre", "design", "vintage", "scandinave", "industriel"]
+FILTERS = {"type": None, "room": None, "color": None, "name": None}
+FILTER_ON = {"type": False, "room": False, "color": False, "name": False}
+
+
+def populate(database, rows):
+    database.add_room("Salon")
+    database.add_type("meuble")
+    database.add_color("Rouge")
+    rng = random.Random(0)
+    # The FTS triggers index every row as it is inserted
+    database.cursor.executemany(
+        "INSERT INTO fournitures (name, room, type, color, x_dimension, y_dimension, image_path, price) VALUES (?, 1, 1, 1, 50, 50, 'None', 10)",
+        ((f"{rng.choice(WORDS)} {rng.choice(ADJECTIVES)} {rng.choice(ADJECTIVES)} {i}",) for i in range(rows)),
+    )
+    database.conn.commit()
+
+
+def timed(function, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100000, 1000000]
+    print(f"{'rows':>8}{'query':>22}{'matches':>9}{'like ms':>10}{'fts ms':>10}{'ranked ms':>11}")
+    for rows in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            database = Database(os.path.join(tmp, "bench.db"))
+            populate(database, rows)
+            for word, like in (("fauteuil velours", "%fauteuil velours%"), ("vinta", "%vinta%"), ("tabouret 12345", "%tabouret%12345%")):
+                filters = dict(FILTERS, name=like)
+                filter_on = dict(FILTER_ON, name=True)
+                matches = len(database.search_details(FILTERS, FILTER_ON, text=word))
+                like_ms = timed(lambda: database.search_details(filters, filter_on))
+                fts_ms = timed(lambda: database.search_details(FILTERS, FILTER_ON, text=word))
+                ranked_ms = timed(lambda: database.search_details(FILTERS, FILTER_ON, text=word, order_by="rank"))
+                print(f"{rows:>8}{word:>22}{matches:>9}{like_ms:>10.2f}{fts_ms:>10.2f}{ranked_ms:>11.2f}")
+            database.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Typo-tolerant name search with the in-memory trigram index.
+
+Usage: python benchmarks/bench_fuzzy.py [sizes ...]
+
+For each catalog size: time to build the index from the database (what
+DatabaseThread does at startup), its footprint as reported by stats()
+and as measured by tracemalloc, and the latency of misspelled queries.
+"like" is the best the old path could do with a typo: a LIKE on a
+correctly spelled fragment, which still scans every row.
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from server.database import Database
+from server.trigram_index import TrigramIndex
+
+sys.path.insert(0, os.path.dirname(__file__))
+from bench_fts import FILTER_ON, FILTERS, populate, timed
+
+QUERIES = [("fauteil velour", "%fauteuil velours%"), ("scandinav tabouret", "%tabouret scandinave%"), ("armiore", "%armoire%")]
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000, 1000000]
+    print(f"{'rows':>8}{'build s':>9}{'index MB':>10}{'traced MB':>11}{'query':>20}{'fuzzy ms':>10}{'like ms':>10}")
+    for rows in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            database = Database(os.path.join(tmp, "bench.db"))
+            populate(database, rows)
+            index = TrigramIndex()
+            started = time.perf_counter()
+            index.load(database)
+            build = time.perf_counter() - started
+            # A second build under tracemalloc, which slows it down a lot
+            tracemalloc.start()
+            traced_index = TrigramIndex()
+            traced_index.load(database)
+            traced = tracemalloc.get_traced_memory()[0] / 2 ** 20
+            tracemalloc.stop()
+            del traced_index
+            size = index.stats()["bytes"] / 2 ** 20
+            for fuzzy, like in QUERIES:
+                assert index.search(fuzzy), fuzzy
+                fuzzy_ms = timed(lambda: index.search(fuzzy, 1000))
+                like_ms = timed(lambda: database.search_details(dict(FILTERS, name=like), dict(FILTER_ON, name=True)))
+                print(f"{rows:>8}{build:>9.1f}{size:>10.1f}{traced:>11.1f}{fuzzy:>20}{fuzzy_ms:>10.2f}{like_ms:>10.2f}")
+            database.close()
+
+
+if __name__ == "__main__":
+    main()
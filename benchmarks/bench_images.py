@@ -0,0 +1,110 @@
+"""Server peak memory while clients download images of growing size.
+
+Usage: python benchmarks/bench_images.py [size_mb ...]
+
+For each image size a fresh threaded server is started in a child process,
+CLIENTS connections download the image concurrently, and the server's peak
+resident memory (VmHWM) is read from /proc. With sendfile the peak should
+not grow with the image size.
+"""
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+PORT = 10051
+CLIENTS = 8
+
+
+def start_server(db_name):
+    code = f"from server.server import Server; Server(port={PORT}, new_database=True, db_name={db_name!r}).start()"
+    process = subprocess.Popen(
+        [sys.executable, "-c", code], cwd=ROOT,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", PORT)).close()
+            return process
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError("server did not start")
+
+
+def request(sock, data):
+    sock.sendall(json.dumps(data).encode("utf-8"))
+    return json.loads(sock.recv(4096).decode("utf-8"))
+
+
+def setup_fourniture(image_path):
+    sock = socket.create_connection(("127.0.0.1", PORT))
+    request(sock, {"command": "AUTHENTICATE", "username": "admin", "password": "admin"})
+    for table, name in (("rooms", "Salon"), ("types", "rendu"), ("colors", "Blanc")):
+        request(sock, {"command": "SET", "table": table, "name": name})
+    fourniture_id = request(sock, {
+        "command": "SET", "table": "fournitures", "name": "render", "room": "Salon",
+        "type": "rendu", "color": "Blanc", "x_dimension": 1, "y_dimension": 1,
+        "image_path": image_path, "price": 1,
+    })["id"]
+    sock.close()
+    return fourniture_id
+
+
+def download(fourniture_id):
+    sock = socket.create_connection(("127.0.0.1", PORT))
+    sock.sendall(json.dumps({"command": "GET", "table": "fournitures", "id": fourniture_id}).encode("utf-8"))
+    # The unframed protocol may deliver the start of the image together with
+    # the JSON response. json.dumps output is ASCII, so latin-1 keeps byte
+    # offsets intact.
+    data = sock.recv(4096)
+    response, end = json.JSONDecoder().raw_decode(data.decode("latin-1"))
+    remaining = response["image_weight"] - (len(data) - end)
+    buffer = bytearray(256 * 1024)
+    while remaining:
+        received = sock.recv_into(buffer, min(len(buffer), remaining))
+        if not received:
+            raise ConnectionError("server closed the connection")
+        remaining -= received
+    sock.close()
+
+
+def peak_rss(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1])
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1, 16, 64]
+    print(f"{'image MB':>9}{'clients':>9}{'peak rss KiB':>14}{'seconds':>9}")
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            image_path = os.path.join(tmp, "image.bin")
+            with open(image_path, "wb") as f:
+                for _ in range(size):
+                    f.write(os.urandom(1024 * 1024))
+            process = start_server(os.path.join(tmp, "bench.db"))
+            try:
+                fourniture_id = setup_fourniture(image_path)
+                started = time.perf_counter()
+                threads = [threading.Thread(target=download, args=(fourniture_id,)) for _ in range(CLIENTS)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                elapsed = time.perf_counter() - started
+                print(f"{size:>9}{CLIENTS:>9}{peak_rss(process.pid):>14}{elapsed:>9.2f}")
+            finally:
+                process.kill()
+                process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Catalog loading: IMPORT against one SET per row.
+
+Usage: python benchmarks/bench_import.py [rows]
+
+The same generated JSONL catalog is loaded into a fresh database with
+DatabaseThread.import_catalog (validated in the caller's thread, names
+resolved once per chunk, executemany in IMPORT_CHUNK_SIZE row
+transactions) and with one fourniture SET per row, as a client looping
+over the file would do. SET is only timed on the first 10,000 rows.
+"""
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from server.database_thread import DatabaseThread
+
+ROOMS = ["Salon", "Chambre", "Cuisine", "Bureau"]
+TYPES = ["chaise", "table", "canape", "lit", "armoire"]
+COLORS = ["Rouge", "Bleu", "Vert", "Noir"]
+SET_ROWS = 10_000
+
+
+def catalog(count):
+    return [{
+        "name": f"item-{i}", "room": ROOMS[i % len(ROOMS)], "type": TYPES[i % len(TYPES)],
+        "color": COLORS[i % len(COLORS)], "x_dimension": 30 + i % 170, "y_dimension": 30 + i % 90,
+        "image_path": "None", "price": i % 1000,
+    } for i in range(count)]
+
+
+def fresh(db_name):
+    if os.path.exists(db_name):
+        os.remove(db_name)
+    database_thread = DatabaseThread(db_name=db_name, new_database=True)
+    database_thread.start()
+    return database_thread
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    rows = catalog(count)
+    data = "".join(json.dumps(row) + "\n" for row in rows).encode()
+    with tempfile.TemporaryDirectory() as tmp:
+        db_name = os.path.join(tmp, "bench.db")
+
+        database_thread = fresh(db_name)
+        started = time.perf_counter()
+        response = database_thread.import_catalog(io.BytesIO(data), "jsonl", create=True)
+        import_rate = response["imported"] / (time.perf_counter() - started)
+        database_thread.stop()
+        database_thread.database.close()
+
+        database_thread = fresh(db_name)
+        for table, names in (("rooms", ROOMS), ("types", TYPES), ("colors", COLORS)):
+            for name in names:
+                database_thread.request("SET", {"table": table, "name": name})
+        started = time.perf_counter()
+        for row in rows[:SET_ROWS]:
+            database_thread.request("SET", dict(row, table="fournitures"))
+        set_rate = min(count, SET_ROWS) / (time.perf_counter() - started)
+        database_thread.stop()
+        database_thread.database.close()
+
+    print(f"{'rows':>10}{'IMPORT rows/s':>16}{'SET rows/s':>14}{'1M rows IMPORT':>16}{'1M rows SET':>14}")
+    print(f"{count:>10}{import_rate:>16.0f}{set_rate:>14.0f}{1e6 / import_rate:>15.0f}s{1e6 / set_rate:>13.0f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""PLACE latency against the number of items.
+
+Usage: python benchmarks/bench_place.py [counts ...]
+
+Items are random footprints of 30 to 200 by 30 to 120, placed with
+rotation in a room sized to hold about all of them. "grid" is place() with
+its SpatialHash, "pairwise" the same placement with every new item tested
+against every placed one. "tests" counts the rectangle overlap tests of
+each, "fill" is the share of the floor covered.
+"""
+import os
+import random
+import statistics
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from server.placement import SpatialHash, place
+
+sys.path.insert(0, os.path.dirname(__file__))
+from bench_fts import timed
+
+
+class PairwiseIndex:
+    def __init__(self):
+        self.rectangles = []
+        self.tests = 0
+
+    def insert(self, x, y, width, depth):
+        self.rectangles.append((x, y, x + width, y + depth))
+
+    def collides(self, x, y, width, depth):
+        right, top = x + width, y + depth
+        for rectangle in self.rectangles:
+            self.tests += 1
+            left, bottom, other_right, other_top = rectangle
+            if x < other_right and left < right and y < other_top and bottom < top:
+                return rectangle
+        return None
+
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [50, 100, 200, 500, 1000]
+    rng = random.Random(0)
+    print(f"{'items':>6}{'placed':>8}{'fill':>7}{'grid ms':>10}{'tests':>10}{'pairwise ms':>13}{'tests':>11}")
+    for count in counts:
+        items = [(id, rng.randint(30, 200), rng.randint(30, 120)) for id in range(count)]
+        area = sum(x_dimension * y_dimension for id, x_dimension, y_dimension in items)
+        width = depth = int(area ** 0.5)
+        placements, unplaced = place(width, depth, items, rotate=True)
+        fill = sum(p["width"] * p["depth"] for p in placements) / (width * depth)
+        grid_ms = timed(lambda: place(width, depth, items, rotate=True), repeat=3)
+        pairwise_ms = timed(lambda: place(width, depth, items, rotate=True, index=PairwiseIndex()), repeat=1)
+        # One more run of each to count the overlap tests
+        grid = SpatialHash(statistics.median(max(x_dimension, y_dimension) for id, x_dimension, y_dimension in items))
+        place(width, depth, items, rotate=True, index=grid)
+        pairwise = PairwiseIndex()
+        place(width, depth, items, rotate=True, index=pairwise)
+        print(f"{count:>6}{len(placements):>8}{fill:>7.0%}{grid_ms:>10.1f}{grid.tests:>10}{pairwise_ms:>13.1f}{pairwise.tests:>11}")
+
+
+if __name__ == "__main__":
+    main()
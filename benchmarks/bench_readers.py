@@ -0,0 +1,106 @@
+"""Read and write throughput of DatabaseThread with 1, 4 and 16 readers.
+
+Usage: python benchmarks/bench_readers.py [rows] [seconds]
+
+Client threads issue GET and SEARCH requests while one writer keeps adding
+rooms, the way admin writes interleave with kiosk traffic.
+
+On one core, 20000 rows, 5 s per run (python benchmarks/bench_readers.py 20000 5):
+
+ readers     reads/s    writes/s
+  writer         477          30
+       1         274        2215
+       4         400         236
+      16         516          20
+
+Reads do not scale with readers here: there is one core to share, and
+the Python work around each query holds the GIL. Without readers, writes wait behind the 16 clients'
+reads in the one queue. One reader frees the writer but halves reads.
+Four keep reads near the writer-only rate with writes about 8x higher,
+which is why Server defaults to 4. At 16, the reader threads win the
+GIL from the writer and writes fall back below the writer-only rate.
+"""
+import contextlib
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from server.database import Database
+from server.database_thread import DatabaseThread
+
+CLIENTS = 16
+
+
+def populate(db_name, rows):
+    database = Database(db_name)
+    for name in ("Salon", "Chambre", "Cuisine", "Bureau"):
+        database.add_room(name)
+    for name in ("chaise", "table", "canape"):
+        database.add_type(name)
+    for name in ("Rouge", "Bleu"):
+        database.add_color(name)
+    database.cursor.executemany(
+        "INSERT INTO fournitures (name, room, type, color, x_dimension, y_dimension, image_path, price) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        [(f"item{i}", i % 4 + 1, i % 3 + 1, i % 2 + 1, 50 + i % 150, 40 + i % 90, "None", 10 + i % 990) for i in range(rows)],
+    )
+    database.conn.commit()
+    database.close()
+
+
+def run(db_name, readers, rows, seconds):
+    database_thread = DatabaseThread(db_name=db_name, readers=readers)
+    database_thread.start()
+    deadline = time.perf_counter() + seconds
+    counts = [0] * CLIENTS
+    filter_on = {"type": True, "room": False, "color": True, "name": False}
+
+    def client(index):
+        rng = random.Random(index)
+        while time.perf_counter() < deadline:
+            if rng.random() < 0.9:
+                database_thread.request("GET", {"table": "fournitures", "id": rng.randint(1, rows)})
+            else:
+                filters = {"type": "canape", "room": None, "color": "Rouge", "name": None}
+                database_thread.request("SEARCH", {"filters": filters, "filter_on": filter_on})
+            counts[index] += 1
+
+    writes = [0]
+
+    def writer():
+        while time.perf_counter() < deadline:
+            database_thread.request("SET", {"table": "rooms", "name": f"room-{readers}-{writes[0]}"})
+            writes[0] += 1
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(CLIENTS)]
+    threads.append(threading.Thread(target=writer))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    database_thread.stop()
+    return sum(counts) / seconds, writes[0] / seconds
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 3
+    with tempfile.TemporaryDirectory() as tmp:
+        db_name = os.path.join(tmp, "bench.db")
+        populate(db_name, rows)
+        results = []
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            for readers in (0, 1, 4, 16):
+                results.append((readers, run(db_name, readers, rows, seconds)))
+    print(f"{'readers':>8}{'reads/s':>12}{'writes/s':>12}")
+    for readers, (reads, writes) in results:
+        label = "writer" if readers == 0 else str(readers)
+        print(f"{label:>8}{reads:>12.0f}{writes:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""SEARCH latency against result-set size, before and after the joined query.
+
+Usage: python benchmarks/bench_search.py [sizes ...]
+
+"before" replays the old handle_search: Database.search followed by one
+room, type and color lookup per row. "after" is the current handle_search,
+which resolves the names in a single joined query.
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from server.database import Database
+from server.database_thread import DatabaseThread
+
+FILTERS = {"type": None, "room": "Salon", "color": None, "name": None}
+FILTER_ON = {"type": False, "room": True, "color": False, "name": False}
+
+
+def populate(database, rows):
+    database.add_room("Salon")
+    database.add_room("Cave")
+    database.add_type("chaise")
+    database.add_color("Rouge")
+    database.cursor.executemany(
+        "INSERT INTO fournitures (name, room, type, color, x_dimension, y_dimension, image_path, price) VALUES (?, 1, 1, 1, 50, 50, 'None', 10)",
+        [(f"item{i}",) for i in range(rows)],
+    )
+    database.cursor.execute("INSERT INTO fournitures (name, room, type, color, x_dimension, y_dimension, image_path, price) VALUES ('other', 2, 1, 1, 50, 50, 'None', 10)")
+    database.conn.commit()
+
+
+def search_before(database):
+    results = []
+    for result in database.search(FILTERS, FILTER_ON):
+        color = database.get_color_by_id(result[4])
+        type = database.get_type_by_id(result[3])
+        room = database.get_room_by_id(result[2])
+        results.append({
+            "id": result[0], "name": result[1], "room": room[1], "type": type[1],
+            "color": color[1], "x_dimension": result[6], "y_dimension": result[7],
+            "image_path": result[5], "price": result[8],
+        })
+    return results
+
+
+def timed(function, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100, 1000, 10000, 50000]
+    print(f"{'rows':>8}{'before ms':>12}{'after ms':>12}{'speedup':>10}")
+    for rows in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            database_thread = DatabaseThread(db_name=os.path.join(tmp, "bench.db"))
+            populate(database_thread.database, rows)
+            data = {"filters": FILTERS, "filter_on": FILTER_ON}
+            assert len(database_thread.handle_search(data)) == rows
+            before = timed(lambda: search_before(database_thread.database))
+            after = timed(lambda: database_thread.handle_search(data))
+            database_thread.database.close()
+        print(f"{rows:>8}{before:>12.2f}{after:>12.2f}{before / after:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""SUGGEST latency against catalog size, and the LIKE search it replaces.
+
+Usage: python benchmarks/bench_suggest.py [sizes ...]
+
+"suggest" is DatabaseThread.suggest, answered from memory in the calling
+thread. "like" is the per-keystroke SEARCH the kiosk used to send
+(name LIKE 'prefix%'), run directly on the database, so without the
+queueing it would add behind other requests.
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from server.database_thread import DatabaseThread
+
+sys.path.insert(0, os.path.dirname(__file__))
+from bench_fts import FILTER_ON, FILTERS, populate, timed
+
+PREFIXES = ["f", "fau", "fauteuil v", "tabouret sc", "zz"]
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000, 1000000]
+    print(f"{'rows':>8}{'load s':>8}{'prefix':>14}{'suggest ms':>12}{'like ms':>10}")
+    for rows in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_name = os.path.join(tmp, "bench.db")
+            database_thread = DatabaseThread(db_name=db_name)
+            populate(database_thread.database, rows)
+            started = time.perf_counter()
+            database_thread.suggestions.load(database_thread.database, database_thread.dimension_cache)
+            load = time.perf_counter() - started
+            for prefix in PREFIXES:
+                data = {"prefix": prefix, "limit": 10}
+                suggest_ms = timed(lambda: database_thread.suggest(data), repeat=50)
+                filters = dict(FILTERS, name=prefix + "%")
+                filter_on = dict(FILTER_ON, name=True)
+                like_ms = timed(lambda: database_thread.database.search_details(filters, filter_on, limit=10))
+                print(f"{rows:>8}{load:>8.1f}{prefix:>14}{suggest_ms:>12.3f}{like_ms:>10.2f}")
+            database_thread.database.close()
+
+
+if __name__ == "__main__":
+    main()
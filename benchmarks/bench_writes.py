@@ -0,0 +1,63 @@
+"""Write throughput of DatabaseThread with and without group commit.
+
+Usage: python benchmarks/bench_writes.py [seconds]
+
+1 to 64 client threads keep sending fourniture SETs, each waiting for its
+response like a connection does. "single" commits every write on its own,
+"group" drains up to 256 queued writes into one transaction (no added
+delay: a batch is whatever queued up during the previous commit).
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from server.database_thread import DatabaseThread
+
+CONCURRENCY = [1, 4, 16, 64]
+MODES = {"single": {}, "group": {"batch_size": 256}}
+
+
+def run(db_name, clients, seconds, options):
+    database_thread = DatabaseThread(db_name=db_name, new_database=True, **options)
+    database_thread.start()
+    for table, name in (("rooms", "Salon"), ("types", "chaise"), ("colors", "Rouge")):
+        database_thread.request("SET", {"table": table, "name": name})
+    deadline = time.perf_counter() + seconds
+    counts = [0] * clients
+
+    def client(index):
+        while time.perf_counter() < deadline:
+            database_thread.request("SET", {
+                "table": "fournitures", "name": f"chaise-{index}-{counts[index]}", "room": "Salon", "type": "chaise",
+                "color": "Rouge", "x_dimension": 45, "y_dimension": 50, "image_path": "None", "price": 80,
+            })
+            counts[index] += 1
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    database_thread.stop()
+    database_thread.database.close()
+    return sum(counts) / elapsed
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 3
+    print(f"{'clients':>8}" + "".join(f"{mode + ' w/s':>14}" for mode in MODES))
+    with tempfile.TemporaryDirectory() as tmp:
+        db_name = os.path.join(tmp, "bench.db")
+        for clients in CONCURRENCY:
+            rates = [run(db_name, clients, seconds, options) for options in MODES.values()]
+            print(f"{clients:>8}" + "".join(f"{rate:>14.0f}" for rate in rates))
+
+
+if __name__ == "__main__":
+    main()
@@ -5,9 +5,9 @@ class Authenticator:
         self.is_admin = False
 
     def authenticate(self, username, password):
-        self.database_thread.request_queue.put(
-            ("AUTHENTICATE", {"username": username, "password": password})
-        )
-        self.is_authenticated = self.database_thread.response_queue.get()
-        self.database_thread.request_queue.put(("IS_ADMIN", {"username": username}))
-        self.is_admin = self.database_thread.response_queue.get()
\ No newline at end of file
+        futures = self.database_thread.submit_many([
+            ("AUTHENTICATE", {"username": username, "password": password}),
+            ("IS_ADMIN", {"username": username}),
+        ])
+        self.is_authenticated, is_admin = self.database_thread.gather(futures)
+        self.is_admin = self.is_authenticated and is_admin
\ No newline at end of file
@@ -0,0 +1,162 @@
+import threading
+from collections import Counter, OrderedDict
+
+DIMENSION_TABLES = ("rooms", "types", "colors")
+FACET_FIELDS = ("room", "type", "color")
+
+
+class DimensionCache:
+    # Bidirectional name <-> id maps for the small lookup tables, two dict
+    # entries per room, type or color. It is authoritative: a miss means the
+    # name or id does not exist, so a rolled back insert must be removed
+    # again (DatabaseThread.undoable).
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ids = {table: {} for table in DIMENSION_TABLES}
+        self.names = {table: {} for table in DIMENSION_TABLES}
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, database):
+        rows = {
+            "rooms": database.get_rooms(),
+            "types": database.get_types(),
+            "colors": database.get_colors(),
+        }
+        with self.lock:
+            for table in DIMENSION_TABLES:
+                self.ids[table] = {name: id for id, name in rows[table]}
+                self.names[table] = {id: name for id, name in rows[table]}
+
+    def add(self, table, id, name):
+        with self.lock:
+            self.ids[table][name] = id
+            self.names[table][id] = name
+
+    def remove(self, table, name):
+        with self.lock:
+            id = self.ids[table].pop(name, None)
+            if id is not None:
+                self.names[table].pop(id, None)
+        return id
+
+    def _count(self, value):
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def get_id(self, table, name):
+        return self._count(self.ids[table].get(name))
+
+    def get_name(self, table, id):
+        try:
+            id = int(id)
+        except (TypeError, ValueError):
+            return self._count(None)
+        return self._count(self.names[table].get(id))
+
+    def items(self, table):
+        with self.lock:
+            return sorted(self.names[table].items())
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": {table: len(self.ids[table]) for table in DIMENSION_TABLES},
+        }
+
+
+class FacetCounts:
+    # Number of fournitures per room, type and color id over the whole
+    # catalog, one Counter entry per id: unfiltered facets cost no query.
+    # Counts only move by deltas, so every add has its remove as its undo.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {field: Counter() for field in FACET_FIELDS}
+
+    @staticmethod
+    def count_rows(rows):
+        # Folds Database.facet_counts rows into one Counter per field
+        counts = {field: Counter() for field in FACET_FIELDS}
+        for room, type, color, count in rows:
+            counts["room"][room] += count
+            counts["type"][type] += count
+            counts["color"][color] += count
+        return counts
+
+    def load(self, database):
+        counts = self.count_rows(database.facet_counts())
+        with self.lock:
+            self.counts = counts
+
+    def add(self, room, type, color, delta=1):
+        with self.lock:
+            for field, id in zip(FACET_FIELDS, (room, type, color)):
+                self.counts[field][id] += delta
+                if self.counts[field][id] <= 0:
+                    del self.counts[field][id]
+
+    def remove(self, room, type, color):
+        self.add(room, type, color, -1)
+
+    def snapshot(self):
+        with self.lock:
+            return {field: dict(counts) for field, counts in self.counts.items()}
+
+
+class SearchCache:
+    # Bounded LRU of serialized SEARCH responses keyed on the normalized
+    # filter set. Every catalog write bumps the generation; an entry is only
+    # served if it was computed in the current generation, so a result that
+    # raced with a write is never returned.
+    def __init__(self, max_entries=1024, max_bytes=32 * 1024 * 1024):
+        self.lock = threading.Lock()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != self.generation:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, generation, payload):
+        size = len(payload)
+        with self.lock:
+            if generation != self.generation or size > self.max_bytes or self.max_entries <= 0:
+                return
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.bytes -= len(old[1])
+            self.entries[key] = (generation, payload)
+            self.bytes += size
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.bytes -= len(evicted)
+
+    def invalidate(self):
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "generation": self.generation,
+        }
@@ -1,27 +1,218 @@
 import cmd
 import json
+import os
 import socket
+import tempfile
 import sys
+from collections import deque
+
+from server.parser import CHUNK_SIZE, FrameDecoder, MessageDecoder, encode_frame
 
 class Client:
-    def __init__(self, host="127.0.0.1", port=10004):
+    def __init__(self, host="127.0.0.1", port=10004, framed=False):
         self.host = host
         self.port = port
         self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.client_socket.connect((host, self.port))
+        self.framed = False
+        self.message_decoder = MessageDecoder()
+        self.decoder = FrameDecoder()
+        self.pending = {}
+        self.next_request_id = 1
+        self.last_request_id = None
+        if framed:
+            self.negotiate("framed")
+
+    def negotiate(self, protocol):
+        response = self.send_request({"command": "HELLO", "protocol": protocol})
+        self.framed = response.get("protocol") == "framed"
+        return response
 
     def send_request(self, request):
         print(f"Sending request: {request}")
+        if self.framed:
+            request_id = self.send_frame(request)
+            return json.loads(self.recv_frame(request_id))
         self.client_socket.send(json.dumps(request).encode('utf-8'))
-        response = self.client_socket.recv(4096).decode('utf-8')
-        return json.loads(response)
-    
+        return self.recv_response()
+
+    def recv_response(self):
+        # Unframed responses have no length: read until a whole JSON value
+        # has arrived. Whatever follows it (the start of an image) stays in
+        # the decoder for iter_image.
+        while True:
+            response = self.message_decoder.next_message()
+            if response is not None:
+                return json.loads(response)
+            chunk = self.client_socket.recv(CHUNK_SIZE)
+            if not chunk:
+                raise ConnectionError("Connection closed by server")
+            self.message_decoder.feed(chunk)
+
+    def send_requests(self, requests):
+        # Pipeline several requests on a framed connection: everything is
+        # sent first, then the responses are collected by request id.
+        if not self.framed:
+            return [self.send_request(request) for request in requests]
+        request_ids = [self.send_frame(request) for request in requests]
+        return [json.loads(self.recv_frame(request_id)) for request_id in request_ids]
+
+    def send_frame(self, request):
+        request_id = self.next_request_id
+        self.next_request_id += 1
+        self.last_request_id = request_id
+        self.client_socket.sendall(encode_frame(request_id, json.dumps(request)))
+        return request_id
+
+    def recv_frame(self, request_id):
+        frames = self.pending.setdefault(request_id, deque())
+        while not frames:
+            data = self.client_socket.recv(CHUNK_SIZE)
+            if not data:
+                raise ConnectionError("Connection closed by server")
+            for frame_id, payload in self.decoder.feed(data):
+                self.pending.setdefault(frame_id, deque()).append(payload)
+        payload = frames.popleft()
+        if not frames:
+            del self.pending[request_id]
+        return payload
+
+    def send_image_file(self, image_path, remote_path=None):
+        # Streams the file from disk instead of loading it in memory
+        image_weight = os.path.getsize(image_path)
+        request = {
+            "command": "RECIEVE_IMAGE",
+            "image_path": remote_path or image_path,
+            "image_weight": image_weight
+        }
+        with open(image_path, "rb") as f:
+            if self.framed:
+                request_id = self.send_frame(request)
+                while True:
+                    chunk = f.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    self.client_socket.sendall(encode_frame(request_id, chunk))
+                return json.loads(self.recv_frame(request_id))
+            self.client_socket.sendall(json.dumps(request).encode('utf-8'))
+            self.client_socket.sendfile(f)
+        return self.recv_response()
+
+    def import_catalog(self, path, create=False):
+        # Streams a .csv or .jsonl catalog like send_image_file
+        format = "csv" if path.endswith(".csv") else "jsonl"
+        request = {"command": "IMPORT", "format": format, "size": os.path.getsize(path), "create": create}
+        with open(path, "rb") as f:
+            if self.framed:
+                request_id = self.send_frame(request)
+                while True:
+                    chunk = f.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    self.client_socket.sendall(encode_frame(request_id, chunk))
+                return json.loads(self.recv_frame(request_id))
+            self.client_socket.sendall(json.dumps(request).encode('utf-8'))
+            self.client_socket.sendfile(f)
+        return self.recv_response()
+
+    def send_image(self, image_path, image_data):
+        request = {
+            "command": "RECIEVE_IMAGE",
+            "image_path": image_path,
+            "image_weight": len(image_data)
+        }
+        if self.framed:
+            request_id = self.send_frame(request)
+            for start in range(0, len(image_data), CHUNK_SIZE):
+                self.client_socket.sendall(encode_frame(request_id, image_data[start:start + CHUNK_SIZE]))
+            return json.loads(self.recv_frame(request_id))
+        self.client_socket.sendall(json.dumps(request).encode('utf-8'))
+        self.client_socket.sendall(image_data)
+        return self.recv_response()
+
+    def iter_image(self, image_weight):
+        # Yields the image in chunks as it arrives. On the unframed protocol
+        # a single buffer is reused, so the caller must consume each chunk
+        # before asking for the next one.
+        received = 0
+        buffer = bytearray(CHUNK_SIZE)
+        view = memoryview(buffer)
+        while received < image_weight:
+            if self.framed:
+                chunk = self.recv_frame(self.last_request_id)
+            elif self.message_decoder.buffer:
+                chunk = self.message_decoder.take(image_weight - received)
+            else:
+                size = self.client_socket.recv_into(buffer, min(CHUNK_SIZE, image_weight - received))
+                if not size:
+                    raise ConnectionError("Connection closed by server")
+                chunk = view[:size]
+            received += len(chunk)
+            print(received, "/", image_weight, "bytes received\n")
+            yield chunk
+
     def recv_image(self, image_weight):
-        image_data = b""
-        while len(image_data) < image_weight:
-            image_data += self.client_socket.recv(4096)
-            print(len(image_data), "/", image_weight, "bytes received\n")
-        return image_data
+        image_data = bytearray()
+        for chunk in self.iter_image(image_weight):
+            image_data += chunk
+        return bytes(image_data)
+
+    def download_image(self, image_weight, image_path):
+        directory = os.path.dirname(os.path.abspath(image_path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".download-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in self.iter_image(image_weight):
+                    f.write(chunk)
+            os.replace(temp_path, image_path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def iter_search(self, query, chunk_size=200, order_by=None):
+        # Yields the results one by one; pages are streamed as frames on a
+        # framed connection and requested with a cursor otherwise.
+        if self.framed:
+            request_id = self.send_frame({"command": "SEARCH", "query": query, "stream": True, "limit": chunk_size, "order_by": order_by})
+            while True:
+                page = json.loads(self.recv_frame(request_id))
+                if "results" not in page:
+                    raise ValueError(page.get("MESSAGE"))
+                yield from page["results"]
+                if page["done"]:
+                    return
+        cursor = None
+        while True:
+            page = self.send_request({"command": "SEARCH", "query": query, "limit": chunk_size, "cursor": cursor, "order_by": order_by})
+            if "results" not in page:
+                raise ValueError(page.get("MESSAGE"))
+            yield from page["results"]
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return
+
+    def iter_export(self, gzip=False):
+        # Yields the catalog as it arrives, in JSONL chunks (gzipped if asked)
+        if not self.framed:
+            raise ValueError("EXPORT requires the framed protocol")
+        request_id = self.send_frame({"command": "EXPORT", "gzip": gzip})
+        header = json.loads(self.recv_frame(request_id))
+        if header.get("MESSAGE") != "Export started":
+            raise ValueError(header.get("MESSAGE"))
+        while True:
+            chunk = self.recv_frame(request_id)
+            if not chunk:
+                return
+            yield chunk
+
+    def export_catalog(self, path, gzip=False):
+        # Written chunk by chunk: the catalog is never held in memory
+        size = 0
+        with open(path, "wb") as f:
+            for chunk in self.iter_export(gzip):
+                f.write(chunk)
+                size += len(chunk)
+        return size
 
     def close(self):
         self.client_socket.close()
@@ -94,6 +285,22 @@ class CLI(cmd.Cmd):
         response = self.client.send_request(request)
         print(response["MESSAGE"])
 
+    def do_update_fourniture(self, arg):
+        "Update fields of a fourniture: update_fourniture id field=value ... (e.g. price=90 room=Salon)"
+        args = arg.split()
+        try:
+            id = int(args[0])
+            fields = dict(pair.split("=", 1) for pair in args[1:])
+        except (IndexError, ValueError):
+            print("Usage: update_fourniture id field=value ...")
+            return
+        for field in ("x_dimension", "y_dimension", "price"):
+            if field in fields:
+                fields[field] = float(fields[field])
+        request = {"command": "UPDATE", "table": "fournitures", "id": id, "fields": fields}
+        response = self.client.send_request(request)
+        print(response["MESSAGE"])
+
     def do_get_fourniture(self, arg):
         "Get fourniture details: get_fourniture id"
         args = arg.split()
@@ -108,9 +315,7 @@ class CLI(cmd.Cmd):
         if response.get("image_path"):
             image_weight = response.get("image_weight")
             if image_weight:
-                image_data = self.client.recv_image(image_weight)
-                with open("received_image.png", "wb") as f:
-                    f.write(image_data)
+                self.client.download_image(image_weight, "received_image.png")
                 print("Image received and saved as 'received_image.png'")
 
     def do_delete_fourniture(self, arg):
@@ -125,16 +330,123 @@ class CLI(cmd.Cmd):
         print(response["MESSAGE"])
 
     def do_search(self, arg):
-        "Search for fournitures: search key1=value1 key2=value2 ..."
+        "Search for fournitures: search key1=value1 key2=value2 ... [min_price=0 max_price=800 order_by=-price top_k=10]"
         args = arg.split()
         query = {}
+        request = {"command": "SEARCH", "query": query}
         for arg in args:
             key, value = arg.split('=')
-            query[key] = value
-        request = {"command": "SEARCH", "query": query}
+            if key == "order_by":
+                request[key] = value
+            elif key == "top_k":
+                request[key] = int(value)
+            elif key.startswith(("min_", "max_")):
+                query[key] = float(value)
+            else:
+                query[key] = value
         response = self.client.send_request(request)
         print(response)
 
+    def do_fits(self, arg):
+        "Search fournitures fitting in a space: fits width depth [rotate] [key=value ...]"
+        args = arg.split()
+        try:
+            width, depth = float(args[0]), float(args[1])
+        except (IndexError, ValueError):
+            print("Usage: fits width depth [rotate] [key=value ...]")
+            return
+        rotate = "rotate" in args[2:]
+        query = dict(pair.split("=", 1) for pair in args[2:] if "=" in pair)
+        request = {"command": "FITS", "width": width, "depth": depth, "rotate": rotate, "query": query}
+        response = self.client.send_request(request)
+        print(response)
+
+    def do_place(self, arg):
+        "Place fournitures in a room: place width depth id1 id2 ... [rotate]"
+        args = arg.split()
+        try:
+            width, depth = float(args[0]), float(args[1])
+            ids = [int(id) for id in args[2:] if id != "rotate"]
+        except (IndexError, ValueError):
+            print("Usage: place width depth id1 id2 ... [rotate]")
+            return
+        request = {"command": "PLACE", "width": width, "depth": depth, "ids": ids, "rotate": "rotate" in args[2:]}
+        response = self.client.send_request(request)
+        if "MESSAGE" in response:
+            print(response["MESSAGE"])
+            return
+        for placement in response["placements"]:
+            turned = " (rotated)" if placement["rotated"] else ""
+            print(f"{placement['id']}: {placement['width']}x{placement['depth']} at ({placement['x']}, {placement['y']}){turned}")
+        if response["unplaced"]:
+            print(f"Not placed: {response['unplaced']}")
+
+    def do_furnish(self, arg):
+        "Cheapest sets of fournitures for a room: furnish room budget type=count ... [top_k=5]"
+        args = arg.split()
+        try:
+            room, budget = args[0], float(args[1])
+            pairs = dict(pair.split("=", 1) for pair in args[2:])
+            top_k = int(pairs.pop("top_k", 5))
+            types = {type: int(count) for type, count in pairs.items()}
+        except (IndexError, ValueError):
+            print("Usage: furnish room budget type=count ... [top_k=5]")
+            return
+        request = {"command": "FURNISH", "room": room, "budget": budget, "types": types, "top_k": top_k}
+        response = self.client.send_request(request)
+        if "MESSAGE" in response:
+            print(response["MESSAGE"])
+            return
+        for combination in response["combinations"]:
+            items = ", ".join(f"{item['quantity']} x {item['name']}" for item in combination["items"])
+            print(f"{combination['price']}: {items}")
+        if not response["complete"]:
+            print("(time budget exceeded: cheapest combination only)")
+
+    def do_import(self, arg):
+        "Import fournitures from a .csv or .jsonl file: import path [create]"
+        args = arg.split()
+        if not args or not os.path.isfile(args[0]):
+            print("Usage: import path [create]")
+            return
+        response = self.client.import_catalog(args[0], create="create" in args[1:])
+        print(response["MESSAGE"])
+        if "imported" in response:
+            print(f"{response['imported']} imported, {response['error_count']} errors")
+            for error in response["errors"]:
+                print(f"line {error['line']}: {error['MESSAGE']}")
+
+    def do_export(self, arg):
+        "Export the catalog as JSONL (gzipped for a .gz path): export path"
+        args = arg.split()
+        if len(args) != 1:
+            print("Usage: export path")
+            return
+        if not self.client.framed:
+            self.client.negotiate("framed")
+        try:
+            size = self.client.export_catalog(args[0], gzip=args[0].endswith(".gz"))
+        except ValueError as e:
+            print(e)
+            return
+        print(f"{size} bytes written to {args[0]}")
+
+    def do_suggest(self, arg):
+        "Suggest names starting with a prefix: suggest prefix [table]"
+        args = arg.split()
+        if not args:
+            print("Usage: suggest prefix [table]")
+            return
+        request = {"command": "SUGGEST", "prefix": args[0]}
+        if len(args) > 1:
+            request["table"] = args[1]
+        response = self.client.send_request(request)
+        if isinstance(response, dict):
+            print(response["MESSAGE"])
+            return
+        for suggestion in response:
+            print(f"{suggestion['name']} ({suggestion['table']})")
+
     def do_add_room(self, arg):
         "Add a new room: add_room name"
         args = arg.split()
@@ -208,16 +520,8 @@ class CLI(cmd.Cmd):
             print("Usage: send_image image_path")
             return
         image_path = args[0]
-        with open(image_path, "rb") as f:
-            image_data = f.read()
-        request = {
-            "command": "RECIEVE_IMAGE",
-            "image_path": image_path,
-            "image_weight": len(image_data)
-        }
-        self.client.send_request(request)
-        self.client.client_socket.sendall(image_data)
-        print("Image sent successfully")
+        response = self.client.send_image_file(image_path)
+        print(response["MESSAGE"])
 
     def do_get_room(self, arg):
         "Get room details: get_room [id]"
@@ -267,6 +571,11 @@ class CLI(cmd.Cmd):
         response = self.client.send_request(request)
         print(response)
 
+    def do_stats(self, arg):
+        "Show server cache statistics (admin): stats"
+        response = self.client.send_request({"command": "STATS"})
+        print(response)
+
 if __name__ == "__main__":
-    client = Client()
+    client = Client(framed="--framed" in sys.argv)
     CLI(client).cmdloop()
\ No newline at end of file
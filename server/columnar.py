@@ -0,0 +1,281 @@
+import heapq
+import math
+import operator
+import threading
+from array import array
+from itertools import compress
+
+from .database import FOURNITURE_FIELDS, RANGE_FIELDS, parse_order
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+CODED_FIELDS = ("room", "type", "color")
+
+# Room, type and color ids are dictionary encoded on one byte, code 0 never
+# being used. A catalog with more distinct values than that cannot be
+# snapshotted and SEARCH stays on SQL.
+MAX_CODES = 255
+
+# bytes.translate tables turning a code column into a 0/1 mask
+MATCH_CODE = [bytes(256)] + [bytes(256)[:code] + b"\x01" + bytes(256)[code + 1:] for code in range(1, MAX_CODES + 1)]
+
+# Tombstones are compacted away once they outnumber the live rows
+COMPACT_MIN_DEAD = 1024
+
+
+def to_value(value):
+    # Columns are doubles so that a missing price can be NaN
+    if value != value:
+        return None
+    return int(value) if value.is_integer() else value
+
+
+class ColumnarSnapshot:
+    # Copy of the fournitures table kept in memory as one array per column,
+    # for SEARCH without SQL. A filter set is evaluated as a 0/1 mask per
+    # condition, combined in C: with numpy as boolean arrays over zero-copy
+    # views of the columns; without it the code columns are turned into
+    # masks with bytes.translate and the masks ANDed as big integers. Columns
+    # take 36 bytes per row, on top of the id -> position dict and the name
+    # and image path strings. Rows are appended in id order and deletes
+    # leave a tombstone in the alive mask, so a rolled back delete cannot be
+    # put back in place: the snapshot is reloaded instead.
+    def __init__(self, use_numpy=None):
+        self.lock = threading.Lock()
+        self.use_numpy = numpy is not None if use_numpy is None else use_numpy
+        self.reset()
+
+    def reset(self):
+        self.ids = array("q")
+        self.codes = {field: array("B") for field in CODED_FIELDS}
+        # field -> {id: code} and, by code, the ids back
+        self.encodings = {field: {} for field in CODED_FIELDS}
+        self.decodings = {field: [None] for field in CODED_FIELDS}
+        self.numbers = {field: array("d") for field in RANGE_FIELDS}
+        self.names = []
+        self.image_paths = []
+        self.alive = bytearray()
+        self.positions = {}
+        self.dead = 0
+        self.usable = True
+
+    def load(self, database):
+        with self.lock:
+            self.reset()
+            for row in database.iter_fournitures():
+                self._append(*row)
+
+    def _encode(self, field, id):
+        code = self.encodings[field].get(id)
+        if code is None:
+            code = len(self.decodings[field])
+            if code > MAX_CODES:
+                self.usable = False
+                return 0
+            self.encodings[field][id] = code
+            self.decodings[field].append(id)
+        return code
+
+    def _append(self, id, name, room, type, color, x_dimension, y_dimension, image_path, price):
+        self.positions[id] = len(self.ids)
+        self.ids.append(id)
+        for field, value in zip(CODED_FIELDS, (room, type, color)):
+            self.codes[field].append(self._encode(field, value))
+        for field, value in zip(RANGE_FIELDS, (price, x_dimension, y_dimension)):
+            self.numbers[field].append(math.nan if value is None else value)
+        self.names.append(name)
+        self.image_paths.append(image_path)
+        self.alive.append(1)
+
+    def add(self, id, name, room, type, color, x_dimension, y_dimension, image_path, price):
+        with self.lock:
+            self._append(id, name, room, type, color, x_dimension, y_dimension, image_path, price)
+
+    def update(self, id, name, room, type, color, x_dimension, y_dimension, image_path, price):
+        # In place, so that rows stay in id order
+        with self.lock:
+            position = self.positions.get(id)
+            if position is None:
+                return False
+            for field, value in zip(CODED_FIELDS, (room, type, color)):
+                self.codes[field][position] = self._encode(field, value)
+            for field, value in zip(RANGE_FIELDS, (price, x_dimension, y_dimension)):
+                self.numbers[field][position] = math.nan if value is None else value
+            self.names[position] = name
+            self.image_paths[position] = image_path
+        return True
+
+    def remove(self, id):
+        with self.lock:
+            position = self.positions.pop(id, None)
+            if position is None:
+                return False
+            self.alive[position] = 0
+            self.dead += 1
+            if self.dead >= COMPACT_MIN_DEAD and self.dead > len(self.positions):
+                self._compact()
+        return True
+
+    def _compact(self):
+        keep = bytes(self.alive)
+        self.ids = array("q", compress(self.ids, keep))
+        for field in CODED_FIELDS:
+            self.codes[field] = array("B", compress(self.codes[field], keep))
+        for field in RANGE_FIELDS:
+            self.numbers[field] = array("d", compress(self.numbers[field], keep))
+        self.names = list(compress(self.names, keep))
+        self.image_paths = list(compress(self.image_paths, keep))
+        self.alive = bytearray(b"\x01" * len(self.ids))
+        self.positions = {id: position for position, id in enumerate(self.ids)}
+        self.dead = 0
+
+    def supports(self, data):
+        # Name matching (LIKE, full text, fuzzy), FITS and facets stay on SQL
+        filter_on = data["filter_on"]
+        order_by = data.get("order_by")
+        return (
+            self.usable
+            and not filter_on.get("name")
+            and data.get("text") is None
+            and data.get("fuzzy") is None
+            and data.get("fits") is None
+            and not data.get("facets")
+            and (order_by is None or parse_order(order_by)[0] in ("id",) + RANGE_FIELDS)
+        )
+
+    def prefers(self, data):
+        # Whether the snapshot should answer rather than SQL. A page or a
+        # top_k stops early on an index in SQL, where a mask is always a
+        # pass over every row; range masks are only built in C by numpy.
+        return (
+            self.supports(data)
+            and data.get("limit") is None
+            and data.get("top_k") is None
+            and (self.use_numpy or not data.get("ranges"))
+        )
+
+    def _select(self, codes, ranges, column, after):
+        # Positions of the live rows matching every condition, in position
+        # (that is id) order. Rows without a value in the ordered column are
+        # left out; after is the (value, id) key a page starts after, value
+        # being None when ordering on id.
+        if self.use_numpy:
+            return self._select_numpy(codes, ranges, column, after)
+        # Every 0/1 mask is built by C iterators (translate, map over a bound
+        # comparison) and the masks are ANDed as integers
+        size = len(self.alive)
+        mask = int.from_bytes(self.alive, "little")
+
+        def where(predicate, values, *more):
+            return int.from_bytes(bytes(map(predicate, values, *more)), "little")
+
+        for field, code in codes.items():
+            mask &= int.from_bytes(self.codes[field].tobytes().translate(MATCH_CODE[code]), "little")
+        for field, (minimum, maximum) in ranges.items():
+            if minimum is not None:
+                mask &= where(float(minimum).__le__, self.numbers[field])
+            if maximum is not None:
+                mask &= where(float(maximum).__ge__, self.numbers[field])
+        if column != "id":
+            # NaN is the only value not equal to itself
+            mask &= where(operator.eq, self.numbers[column], self.numbers[column])
+        if after is not None:
+            (value, id), descending = after
+            beyond = int(id).__gt__ if descending else int(id).__lt__
+            if column == "id":
+                mask &= where(beyond, self.ids)
+            else:
+                value = float(value)
+                past = where(value.__gt__ if descending else value.__lt__, self.numbers[column])
+                tied = where(value.__eq__, self.numbers[column]) & where(beyond, self.ids)
+                mask &= past | tied
+        return list(compress(range(size), mask.to_bytes(size, "little")))
+
+    def _select_numpy(self, codes, ranges, column, after):
+        mask = numpy.frombuffer(self.alive, dtype=numpy.uint8).astype(bool)
+        for field, code in codes.items():
+            mask &= numpy.frombuffer(self.codes[field], dtype=numpy.uint8) == code
+        for field, (minimum, maximum) in ranges.items():
+            values = numpy.frombuffer(self.numbers[field], dtype=numpy.float64)
+            if minimum is not None:
+                mask &= values >= minimum
+            if maximum is not None:
+                mask &= values <= maximum
+        if column != "id":
+            mask &= ~numpy.isnan(numpy.frombuffer(self.numbers[column], dtype=numpy.float64))
+        if after is not None:
+            (value, id), descending = after
+            ids = numpy.frombuffer(self.ids, dtype=numpy.int64)
+            beyond = ids < id if descending else ids > id
+            if column == "id":
+                mask &= beyond
+            else:
+                values = numpy.frombuffer(self.numbers[column], dtype=numpy.float64)
+                mask &= (values < value if descending else values > value) | ((values == value) & beyond)
+        return numpy.flatnonzero(mask).tolist()
+
+    def search(self, data, dimension_cache):
+        # Same data and response as DatabaseThread.handle_search for the
+        # filter sets supports() accepts. Room, type and color names are
+        # resolved through the DimensionCache.
+        filters, filter_on = data["filters"], data["filter_on"]
+        names = {field: dict(dimension_cache.items(field + "s")) for field in CODED_FIELDS}
+        limit = data.get("limit")
+        count = limit + 1 if limit is not None else data.get("top_k")
+        column, descending = parse_order(data.get("order_by") or "id")
+        after = None
+        if data.get("after_id") is not None:
+            after = ((data.get("after_value"), data["after_id"]), descending)
+        with self.lock:
+            codes = {}
+            for field in CODED_FIELDS:
+                if filter_on.get(field):
+                    code = self.encodings[field].get(dimension_cache.get_id(field + "s", filters[field]))
+                    if code is None:
+                        return [] if limit is None else {"results": [], "more": False}
+                    codes[field] = code
+            positions = self._select(codes, data.get("ranges") or {}, column, after)
+
+            if column == "id":
+                # Rows are appended in id order
+                if descending:
+                    positions.reverse()
+                if count is not None:
+                    positions = positions[:count]
+            else:
+                values = self.numbers[column]
+                keyed = zip(map(values.__getitem__, positions), map(self.ids.__getitem__, positions), positions)
+                if count is not None:
+                    keyed = (heapq.nlargest if descending else heapq.nsmallest)(count, keyed)
+                else:
+                    keyed = sorted(keyed, reverse=descending)
+                positions = [position for value, id, position in keyed]
+            rows = self._rows(positions, names)
+
+        if limit is None:
+            return rows
+        return {"results": rows[:limit], "more": len(rows) > limit}
+
+    def _rows(self, positions, names):
+        # Result dicts built column by column; room, type and color names
+        # are resolved once per code rather than once per row
+        columns = {"id": map(self.ids.__getitem__, positions), "name": map(self.names.__getitem__, positions)}
+        for field in CODED_FIELDS:
+            labels = [names[field].get(id) for id in self.decodings[field]]
+            columns[field] = map(labels.__getitem__, map(self.codes[field].__getitem__, positions))
+        for field in RANGE_FIELDS:
+            columns[field] = map(to_value, map(self.numbers[field].__getitem__, positions))
+        columns["image_path"] = map(self.image_paths.__getitem__, positions)
+        return [dict(zip(FOURNITURE_FIELDS, row)) for row in zip(*(columns[field] for field in FOURNITURE_FIELDS))]
+
+    def stats(self):
+        with self.lock:
+            return {
+                "rows": len(self.positions),
+                "tombstones": self.dead,
+                "usable": self.usable,
+                "numpy": self.use_numpy,
+            }
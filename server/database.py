@@ -1,10 +1,86 @@
+import contextlib
 import sqlite3
 import hashlib
+import os
+import re
+import urllib.parse
+
+from .migrations import migrate
+
+# Furniture rows with their room, type and color names resolved, in the order
+# of FOURNITURE_FIELDS.
+FOURNITURE_FIELDS = ("id", "name", "room", "type", "color", "x_dimension", "y_dimension", "image_path", "price")
+FOURNITURE_JOINS = """FROM fournitures
+    LEFT JOIN rooms ON fournitures.room = rooms.id
+    LEFT JOIN types ON fournitures.type = types.id
+    LEFT JOIN colors ON fournitures.color = colors.id"""
+FOURNITURE_DETAILS = """SELECT fournitures.id, fournitures.name, rooms.name, types.name, colors.name,
+        fournitures.x_dimension, fournitures.y_dimension, fournitures.image_path, fournitures.price
+    """ + FOURNITURE_JOINS
+
+# The fournitures columns a row is written with, room, type and color as ids
+FOURNITURE_COLUMNS = FOURNITURE_FIELDS[1:]
+
+# UPDATE/INSERT ... RETURNING hands back the written rows without a second
+# query; older SQLite re-reads them
+HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+RETURNING_FOURNITURE = " RETURNING id, name, room, type, color, x_dimension, y_dimension, image_path, price"
+
+# Columns SEARCH can bound with min/max and sort on
+RANGE_FIELDS = ("price", "x_dimension", "y_dimension")
+ORDER_FIELDS = ("id", "name") + RANGE_FIELDS
+
+
+# Best text match first, only with a text search
+RANK_ORDER = "rank"
+
+# A limited FITS ordered on a column sorts the fitting rows when fewer than
+# this many fit, and walks the column's index otherwise
+FITS_PROBE_LIMIT = 1000
+
+
+def parse_order(order_by):
+    # "price" -> ("price", False), "-price" -> ("price", True)
+    if order_by == RANK_ORDER:
+        return order_by, False
+    descending = order_by.startswith("-")
+    column = order_by[1:] if descending else order_by
+    if column not in ORDER_FIELDS:
+        raise ValueError(f"Invalid order: {order_by}")
+    return column, descending
+
+
+def fits_box(fits):
+    # The R-tree clause and values selecting the footprints that fit
+    width, depth, rotate = fits
+    if rotate:
+        return "SELECT id FROM fournitures_rtree WHERE max_short <= ? AND max_long <= ?", sorted((width, depth))
+    return "SELECT id FROM fournitures_rtree WHERE max_x <= ? AND max_y <= ?", [width, depth]
+
+
+def fts_query(text):
+    # Every word of the text must start a word of the name ("bl sof"
+    # matches "Blue Sofa"). Words are quoted so FTS5 operators in user
+    # input are taken literally. None when the text has no word.
+    words = re.findall(r"\w+", text)
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
 
 class Database:
-    def __init__(self, db_name="database.db"):
+    def __init__(self, db_name="database.db", read_only=False):
+        self.read_only = read_only
+        self.batching = False
+        if read_only:
+            uri = "file:" + urllib.parse.quote(os.path.abspath(db_name)) + "?mode=ro"
+            self.conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            self.cursor = self.conn.cursor()
+            return
         self.conn = sqlite3.connect(db_name, check_same_thread=False)
         self.cursor = self.conn.cursor()
+        # WAL lets the read-only connections run alongside the writer
+        self.cursor.execute("PRAGMA journal_mode=WAL")
         self.init_db()
 
     def init_db(self):
@@ -55,45 +131,187 @@ class Database:
         )
 
         self.conn.commit()
+        migrate(self.conn)
 
         self.cursor.execute("SELECT * FROM users WHERE username='admin'")
         if not self.cursor.fetchone():
             self.add_user("admin", "admin", True)
 
+    def commit(self):
+        # Inside batch() the changes are left in the open transaction
+        if not self.batching:
+            self.conn.commit()
+
+    @contextlib.contextmanager
+    def batch(self):
+        # Everything done in the block is one transaction, committed on exit
+        # (rolled back if the block raises): the writes share one commit,
+        # and one fsync, instead of paying for one each. A batch() inside
+        # another is part of it.
+        if self.batching:
+            yield
+            return
+        self.conn.commit()
+        self.conn.execute("BEGIN")
+        self.batching = True
+        try:
+            yield
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+        finally:
+            self.batching = False
+
+    @contextlib.contextmanager
+    def savepoint(self):
+        # Undoes the changes of the block alone if it raises, leaving the
+        # rest of the batch() transaction alone
+        self.conn.execute("SAVEPOINT request")
+        try:
+            yield
+        except BaseException:
+            self.conn.execute("ROLLBACK TO request")
+            raise
+        finally:
+            self.conn.execute("RELEASE request")
+
     def get_fourniture(self, id):
         self.cursor.execute("SELECT * FROM fournitures WHERE id=?", (id,))
         return self.cursor.fetchone()
     
+    def get_dimensions(self, ids):
+        # {id: (x_dimension, y_dimension)} for the given ids that exist
+        placeholders = ", ".join("?" * len(ids))
+        self.cursor.execute(f"SELECT id, x_dimension, y_dimension FROM fournitures WHERE id IN ({placeholders})", list(ids))
+        return {id: (x_dimension, y_dimension) for id, x_dimension, y_dimension in self.cursor.fetchall()}
+
+    def get_fourniture_details(self, id):
+        self.cursor.execute(FOURNITURE_DETAILS + " WHERE fournitures.id=?", (id,))
+        return self.cursor.fetchone()
+
+    def iter_fournitures(self):
+        # Rows in the order of FOURNITURE_FIELDS, with ids instead of names,
+        # streamed on their own cursor
+        return self.conn.execute(
+            "SELECT id, name, room, type, color, x_dimension, y_dimension, image_path, price FROM fournitures ORDER BY id"
+        )
+
+    def iter_fourniture_details(self):
+        # FOURNITURE_DETAILS rows in id order, on their own cursor
+        return self.conn.execute(FOURNITURE_DETAILS + " ORDER BY fournitures.id")
+
+    def iter_fourniture_names(self):
+        # Own cursor: the rows are streamed, not fetched at once
+        return self.conn.execute("SELECT id, name FROM fournitures ORDER BY id")
+
     def get_fourniture_by_name(self, name):
         self.cursor.execute("SELECT * FROM fournitures WHERE name=?", (name,))
         return self.cursor.fetchone()
 
     def set_fourniture(self, name, room,type,color, x_dimension, y_dimension, path,price):
+        # Returns the new id: names may repeat, so it cannot be looked up
         self.cursor.execute(
             "INSERT INTO fournitures (name, room, type, color, x_dimension, y_dimension, image_path,price) VALUES (?, ?, ?,?, ?, ?, ?, ?)",
             (name, room, type, color, x_dimension, y_dimension, path,price),
         )
-        self.conn.commit()
+        self.commit()
+        return self.cursor.lastrowid
         
 
+    def insert_fournitures(self, rows):
+        # Bulk set_fourniture: rows are (name, room, type, color,
+        # x_dimension, y_dimension, image_path, price) tuples. Returns the
+        # new rows as iter_fournitures() does. Ids only grow and this is the
+        # only writer, so the new rows are the ones past the current last id.
+        self.cursor.execute("SELECT COALESCE(MAX(id), 0) FROM fournitures")
+        last_id = self.cursor.fetchone()[0]
+        self.cursor.executemany(
+            "INSERT INTO fournitures (name, room, type, color, x_dimension, y_dimension, image_path, price) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        self.commit()
+        self.cursor.execute(
+            "SELECT id, name, room, type, color, x_dimension, y_dimension, image_path, price FROM fournitures WHERE id > ? ORDER BY id",
+            (last_id,),
+        )
+        return self.cursor.fetchall()
+
+    def write_returning(self, statement, params, where, where_params):
+        # Runs an UPDATE or INSERT on fournitures and returns the rows it
+        # wrote as iter_fournitures() does. where selects those rows again
+        # when RETURNING is not available.
+        if HAS_RETURNING:
+            self.cursor.execute(statement + RETURNING_FOURNITURE, params)
+            return self.cursor.fetchall()
+        self.cursor.execute(statement, params)
+        if self.cursor.rowcount == 0:
+            return []
+        if where is None:
+            where, where_params = "id=?", (self.cursor.lastrowid,)
+        self.cursor.execute(
+            "SELECT id, name, room, type, color, x_dimension, y_dimension, image_path, price FROM fournitures WHERE " + where,
+            where_params,
+        )
+        return self.cursor.fetchall()
+
+    def update_fourniture(self, id, fields):
+        # Partial update: fields maps FOURNITURE_COLUMNS to their new value.
+        # Returns the updated row, or None if there is no such fourniture.
+        assignments = ", ".join(f"{column}=?" for column in fields)
+        rows = self.write_returning(
+            f"UPDATE fournitures SET {assignments} WHERE id=?", (*fields.values(), id), "id=?", (id,)
+        )
+        self.commit()
+        return rows[0] if rows else None
+
+    def upsert_fourniture(self, name, room, type, color, x_dimension, y_dimension, path, price):
+        # The fournitures with this (name, room, type, color) get the other
+        # values, or a new one is inserted if there is none. Returns the rows
+        # written and whether the row was inserted.
+        key = (name, room, type, color)
+        rows = self.write_returning(
+            "UPDATE fournitures SET x_dimension=?, y_dimension=?, image_path=?, price=? WHERE name=? AND room=? AND type=? AND color=?",
+            (x_dimension, y_dimension, path, price) + key, "name=? AND room=? AND type=? AND color=?", key,
+        )
+        created = not rows
+        if created:
+            rows = self.write_returning(
+                "INSERT INTO fournitures (name, room, type, color, x_dimension, y_dimension, image_path, price) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                key + (x_dimension, y_dimension, path, price), None, None,
+            )
+        self.commit()
+        return rows, created
+
     def delete_fourniture(self, id):
-        self.cursor.execute("DELETE FROM fournitures WHERE id=?", (id,))
-        self.conn.commit()
-        return self.cursor.rowcount > 0
+        # Returns the deleted row as (id, name, room, type, color), or None
+        # if there was none
+        if HAS_RETURNING:
+            self.cursor.execute("DELETE FROM fournitures WHERE id=? RETURNING id, name, room, type, color", (id,))
+            row = self.cursor.fetchone()
+        else:
+            self.cursor.execute("SELECT id, name, room, type, color FROM fournitures WHERE id=?", (id,))
+            row = self.cursor.fetchone()
+            self.cursor.execute("DELETE FROM fournitures WHERE id=?", (id,))
+        self.commit()
+        return row
     
     
 
     def add_user(self, username, password, is_admin):
+        # False if the username is taken
         hashed_password = hashlib.sha256(password.encode()).hexdigest()
         self.cursor.execute(
-            "INSERT INTO users (username, password, is_admin) VALUES (?, ?, ?)",
+            "INSERT INTO users (username, password, is_admin) VALUES (?, ?, ?) ON CONFLICT(username) DO NOTHING",
             (username, hashed_password, is_admin),
         )
-        self.conn.commit()
+        self.commit()
+        return self.cursor.rowcount > 0
 
     def delete_user(self, username):
         self.cursor.execute("DELETE FROM users WHERE username=?", (username,))
-        self.conn.commit()
+        self.commit()
+        return self.cursor.rowcount > 0
     
     def authenticate_user(self, username, password):
         hashed_password = hashlib.sha256(password.encode()).hexdigest()
@@ -103,29 +321,38 @@ class Database:
         )
         return self.cursor.fetchone() is not None
     
+    def add_name(self, table, name):
+        # Inserts name into rooms, types or colors. Returns its new id, or
+        # None if it is already there: the UNIQUE constraint is the
+        # existence check. Only that conflict is skipped, other constraint
+        # violations (a NULL name) still raise.
+        self.cursor.execute(f"INSERT INTO {table} (name) VALUES (?) ON CONFLICT(name) DO NOTHING", (name,))
+        self.commit()
+        return self.cursor.lastrowid if self.cursor.rowcount > 0 else None
+
+    def remove_name(self, table, name):
+        # Whether there was such a name to delete
+        self.cursor.execute(f"DELETE FROM {table} WHERE name=?", (name,))
+        self.commit()
+        return self.cursor.rowcount > 0
+
     def add_type(self, name):
-        self.cursor.execute("INSERT INTO types (name) VALUES (?)", (name,))
-        self.conn.commit()
+        return self.add_name("types", name)
     
     def add_room(self, name):
-        self.cursor.execute("INSERT INTO rooms (name) VALUES (?)", (name,))
-        self.conn.commit()
+        return self.add_name("rooms", name)
         
     def add_color(self, name):
-        self.cursor.execute("INSERT INTO colors (name) VALUES (?)", (name,))
-        self.conn.commit()
+        return self.add_name("colors", name)
         
     def remove_type(self, name):
-        self.cursor.execute("DELETE FROM types WHERE name=?", (name,))
-        self.conn.commit()
+        return self.remove_name("types", name)
         
     def remove_room(self, name):
-        self.cursor.execute("DELETE FROM rooms WHERE name=?", (name,))
-        self.conn.commit()
+        return self.remove_name("rooms", name)
         
     def remove_color(self, name):
-        self.cursor.execute("DELETE FROM colors WHERE name=?", (name,))
-        self.conn.commit()
+        return self.remove_name("colors", name)
         
     def get_types(self):
         self.cursor.execute("SELECT * FROM types")
@@ -184,7 +411,7 @@ class Database:
     def is_admin(self, username):
         self.cursor.execute("SELECT is_admin FROM users WHERE username=?", (username,))
         result = self.cursor.fetchone()
-        return True if result[0] else False
+        return True if result and result[0] else False
 
     def search(self, filter_value, filter_type):
         request = "SELECT * FROM fournitures"
@@ -220,6 +447,130 @@ class Database:
         
         
 
+    def search_conditions(self, filter_value, filter_type, ranges=None, text=None, ids=None, fits=None, rtree=True):
+        # The joins, WHERE clauses and values of a SEARCH filter set.
+        # ranges maps columns of RANGE_FIELDS to (min, max) bounds, None
+        # meaning open; text is matched against the name index; ids
+        # restricts the search to those fournitures; fits is a (width,
+        # depth, rotate) space the footprint must fit in, rotate allowing the
+        # footprint to be turned by a quarter. rtree=False checks the space on
+        # the columns only, leaving the plan to other indexes.
+        joins = ""
+        where_clauses = []
+        values = []
+        if fits is not None:
+            # The R-tree drives the query through the IN subquery; the real
+            # columns are rechecked (unary + keeps their indexes out of it)
+            # as R-tree coordinates are only 32 bit floats
+            width, depth, rotate = fits
+            if rtree:
+                box, box_values = fits_box(fits)
+                where_clauses.append(f"fournitures.id IN ({box})")
+                values += box_values
+            if rotate:
+                width, depth = sorted((width, depth))
+                where_clauses += [
+                    "MIN(fournitures.x_dimension, fournitures.y_dimension) <= ?",
+                    "MAX(fournitures.x_dimension, fournitures.y_dimension) <= ?",
+                ]
+            else:
+                where_clauses += ["+fournitures.x_dimension <= ?", "+fournitures.y_dimension <= ?"]
+            values += [width, depth]
+        if text is not None:
+            match = fts_query(text)
+            if match is None:
+                raise ValueError(f"Invalid text: {text!r}")
+            joins += " JOIN fournitures_fts ON fournitures_fts.rowid = fournitures.id"
+            where_clauses.append("fournitures_fts MATCH ?")
+            values.append(match)
+        if ids is not None:
+            where_clauses.append(f"fournitures.id IN ({', '.join('?' * len(ids))})")
+            values.extend(ids)
+        for key in filter_value:
+            if filter_type[key] and key != "name":
+                where_clauses.append(f"{key}s.name = ?")
+                values.append(filter_value[key])
+        if filter_value.get("name"):
+            where_clauses.append("fournitures.name LIKE ?")
+            values.append(filter_value["name"])
+        # Ranges stay off their indexes when the R-tree drives the query
+        prefix = "+" if fits is not None and rtree else ""
+        for key, (minimum, maximum) in (ranges or {}).items():
+            if key not in RANGE_FIELDS:
+                raise ValueError(f"Invalid range field: {key}")
+            if minimum is not None:
+                where_clauses.append(f"{prefix}fournitures.{key} >= ?")
+                values.append(minimum)
+            if maximum is not None:
+                where_clauses.append(f"{prefix}fournitures.{key} <= ?")
+                values.append(maximum)
+        return joins, where_clauses, values
+
+    def search_details(self, filter_value, filter_type, limit=None, after_id=None, ranges=None, order_by=None, after_value=None, text=None, ids=None, fits=None):
+        # Filters as in search_conditions. order_by is a column of
+        # ORDER_FIELDS, "-" prefixed for descending; ties are broken on id.
+        # With a limit, rows come after the (after_value, after_id) key of
+        # the previous page (keyset pagination: no OFFSET, every page is an
+        # index seek). order_by RANK_ORDER puts the best text matches first
+        # (no keyset: ranks are not stable between pages). The best first
+        # rows by a column are read off that column's index, checking the
+        # fits space on the way, when many rows fit: that stops after limit
+        # rows, where the R-tree would return every fitting row to be
+        # sorted. When few fit, the R-tree gives them and they are sorted.
+        column, descending = parse_order(order_by or "id")
+        if column == RANK_ORDER and (text is None or after_id is not None):
+            raise ValueError("Rank order needs a text search and cannot be paginated")
+        ordered = column not in ("id", RANK_ORDER)
+        rtree = fits is None or limit is None or not ordered or self.few_fit(fits)
+        joins, where_clauses, values = self.search_conditions(filter_value, filter_type, ranges, text, ids, fits, rtree)
+        request = FOURNITURE_DETAILS + joins
+        # Unary + keeps the column's index from taking over the R-tree plan
+        key = f"+fournitures.{column}" if fits is not None and rtree else f"fournitures.{column}"
+        if ordered:
+            # Rows without a value cannot be placed in the order
+            where_clauses.append(f"{key} IS NOT NULL")
+        if after_id is not None:
+            operator = "<" if descending else ">"
+            if column == "id":
+                where_clauses.append(f"fournitures.id {operator} ?")
+                values.append(after_id)
+            else:
+                where_clauses.append(f"({key}, fournitures.id) {operator} (?, ?)")
+                values.extend((after_value, after_id))
+        if where_clauses:
+            request += " WHERE " + " AND ".join(where_clauses)
+        if column == RANK_ORDER:
+            request += " ORDER BY fournitures_fts.rank, fournitures.id"
+        elif limit is not None or order_by:
+            direction = " DESC" if descending else ""
+            request += f" ORDER BY {key}{direction}"
+            if column != "id":
+                request += f", fournitures.id{direction}"
+        if limit is not None:
+            request += " LIMIT ?"
+            values.append(limit)
+
+        self.cursor.execute(request, values)
+        return self.cursor.fetchall()
+
+    def few_fit(self, fits):
+        # Whether fewer than FITS_PROBE_LIMIT footprints fit, reading at
+        # most that many R-tree entries
+        box, values = fits_box(fits)
+        self.cursor.execute(f"SELECT count(*) FROM ({box} LIMIT ?)", values + [FITS_PROBE_LIMIT])
+        return self.cursor.fetchone()[0] < FITS_PROBE_LIMIT
+
+    def facet_counts(self, filter_value=None, filter_type=None, ranges=None, text=None, fits=None):
+        # (room, type, color, count) for the fournitures matching the filters
+        # (all of them by default), in one grouped pass
+        joins, where_clauses, values = self.search_conditions(filter_value or {}, filter_type or {}, ranges, text, fits=fits)
+        request = "SELECT fournitures.room, fournitures.type, fournitures.color, COUNT(*) " + FOURNITURE_JOINS + joins
+        if where_clauses:
+            request += " WHERE " + " AND ".join(where_clauses)
+        request += " GROUP BY fournitures.room, fournitures.type, fournitures.color"
+        self.cursor.execute(request, values)
+        return self.cursor.fetchall()
+
     def close(self):
         self.conn.close()
 
@@ -1,80 +1,597 @@
+import contextlib
+import csv
 import threading
 import queue
+import time
 import hashlib
+from concurrent.futures import Future
 
-from .database import Database
+from .database import Database, FOURNITURE_COLUMNS, FOURNITURE_FIELDS
+from .cache import DimensionCache, FacetCounts, SearchCache, FACET_FIELDS
+from .trigram_index import TrigramIndex
+from .suggestions import Suggestions, SUGGEST_TABLES
+from .columnar import ColumnarSnapshot
+from .placement import MAX_PLACE_ITEMS, place
+from .importer import IMPORT_CHUNK_SIZE, MAX_IMPORT_ERRORS, iter_rows
+from .exporter import export_chunks
+from .furnish import FURNISH_DEADLINE_MS, MAX_COMBINATIONS, MAX_COUNT, MAX_DEADLINE_MS, MAX_TYPES, solve
 import os
+
+# Commands that never write: with a reader pool they are served by the
+# ReaderThreads in parallel, everything else stays on the single writer.
+READ_COMMANDS = ("GET", "SEARCH", "AUTHENTICATE", "IS_ADMIN", "DIMENSIONS")
+
+# Fuzzy SEARCH: candidates taken from the name index before the other
+# filters apply, and results returned when no top_k is given
+FUZZY_CANDIDATES = 1000
+FUZZY_TOP_K = 20
+FUZZY_MIN_SIMILARITY = 0.3
+
+MAX_SUGGESTIONS = 50
+
+# "sql" runs every SEARCH on the database, "columnar" answers the filter
+# sets it can from an in-memory ColumnarSnapshot
+SEARCH_BACKENDS = ("sql", "columnar")
+
+# Tables whose writes can change a SEARCH result
+CATALOG_TABLES = ("fournitures", "rooms", "types", "colors")
+
+# Commands writing to the catalog tables
+CATALOG_WRITES = ("SET", "DELETE", "UPDATE", "UPSERT")
+
+# Fournitures a bulk UPDATE or UPSERT may write, in one transaction
+MAX_BULK_WRITES = 10_000
+
+class ReaderThread(threading.Thread):
+    def __init__(self, owner, db_name):
+        super().__init__(daemon=True)
+        self.owner = owner
+        self.database = Database(db_name, read_only=True)
+
+    def run(self):
+        while True:
+            request = self.owner.read_queue.get()
+            if request is None:
+                break
+            self.owner.execute(*request, database=self.database)
+        self.database.close()
+
 class DatabaseThread(threading.Thread):
-    def __init__(self, db_name="database.db",new_database=False):
+    def __init__(self, db_name="database.db",new_database=False,readers=0,search_cache_size=1024,search_cache_bytes=32 * 1024 * 1024,name_index_size=2_000_000,search_backend="sql",batch_size=1,batch_delay=0.0):
         super().__init__()
+        if search_backend not in SEARCH_BACKENDS:
+            raise ValueError(f"Unknown search backend: {search_backend}")
+        if batch_size < 1 or batch_delay < 0:
+            raise ValueError("batch_size must be at least 1 and batch_delay positive")
+        # Group commit: up to batch_size queued requests, waiting at most
+        # batch_delay seconds for more, are applied in one transaction
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
         if new_database:
             #Remove the database file
-            try:
-                os.remove(db_name)
-            except FileNotFoundError:
-                pass
+            for path in (db_name, db_name + "-wal", db_name + "-shm"):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
         
         
         
+        self.db_name = db_name
         self.database = Database(db_name)
+        self.dimension_cache = DimensionCache()
+        self.dimension_cache.load(self.database)
+        self.search_cache = SearchCache(search_cache_size, search_cache_bytes)
+        self.name_index = TrigramIndex(name_index_size)
+        self.name_index.load(self.database)
+        self.suggestions = Suggestions()
+        self.suggestions.load(self.database, self.dimension_cache)
+        self.facet_counts = FacetCounts()
+        self.facet_counts.load(self.database)
+        self.snapshot = None
+        if search_backend == "columnar":
+            self.snapshot = ColumnarSnapshot()
+            self.snapshot.load(self.database)
+        # (undo, args) of the in-memory changes made in the current
+        # transaction, see undoable()
+        self.undo_log = []
+        self.undoing = False
         self.request_queue = queue.Queue()
-        self.response_queue = queue.Queue()
+        self.read_queue = queue.Queue()
         self.image_queue = queue.Queue()
+        # An in-memory database cannot be shared between connections
+        if db_name == ":memory:":
+            readers = 0
+        self.readers = [ReaderThread(self, db_name) for _ in range(readers)]
+
+    def start(self):
+        super().start()
+        for reader in self.readers:
+            reader.start()
 
     def run(self):
         while True:
             request = self.request_queue.get()
             if request is None:
                 break
-            command, data = request
-            response = self.handle_request(command, data)
-            self.response_queue.put(response)
+            if self.batch_size == 1:
+                self.execute(*request)
+                continue
+            batch, stop = self.drain(request)
+            self.execute_batch(batch)
+            if stop:
+                break
+
+    def drain(self, request):
+        # The requests queued behind request, up to batch_size, waiting up
+        # to batch_delay for them. Returns them and whether stop() was
+        # found in the queue.
+        batch = [request]
+        deadline = time.monotonic() + self.batch_delay
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                if timeout > 0:
+                    request = self.request_queue.get(timeout=timeout)
+                else:
+                    request = self.request_queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                return batch, True
+            batch.append(request)
+        return batch, False
+
+    def execute_batch(self, batch):
+        # Every request runs in its own savepoint, so a failing one leaves
+        # the others in; callers only get their response once the whole
+        # batch is committed. The in-memory indexes are updated as requests
+        # run, a batch ahead of what readers on other connections see.
+        outcomes = []
+        try:
+            with self.undoable(self.database.batch()):
+                for command, data, future in batch:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    try:
+                        with self.undoable(self.database.savepoint()):
+                            outcomes.append((future, self.handle_request(command, data), None))
+                    except Exception as e:
+                        outcomes.append((future, None, e))
+        except Exception as e:
+            # Including the requests not reached when the batch failed to start
+            for command, data, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        # Results computed before the commit may have been cached by readers
+        # still seeing the previous state
+        if any(command == "IMPORT" or (command in CATALOG_WRITES and data.get("table") in CATALOG_TABLES)
+               for command, data, future in batch):
+            self.search_cache.invalidate()
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def journal(self, undo, *args):
+        # Records how to undo an in-memory change made inside a transaction
+        if self.database.batching and not self.undoing:
+            self.undo_log.append((undo, args))
+
+    @contextlib.contextmanager
+    def undoable(self, transaction):
+        # Runs the block in transaction, a Database.batch() or savepoint():
+        # if it rolls back, the in-memory changes journaled in the block are
+        # undone as well, so the indexes never get ahead of the database
+        mark = len(self.undo_log)
+        try:
+            with transaction:
+                yield
+        except BaseException:
+            self.rollback_memory(mark)
+            raise
+        if not self.database.batching:
+            self.undo_log.clear()
+
+    def rollback_memory(self, mark):
+        entries = self.undo_log[mark:]
+        del self.undo_log[mark:]
+        reload = False
+        self.undoing = True
+        try:
+            for undo, args in reversed(entries):
+                if undo == self.reload_snapshot:
+                    reload = True
+                else:
+                    undo(*args)
+            if reload:
+                self.reload_snapshot()
+        finally:
+            self.undoing = False
+
+    def reload_snapshot(self):
+        # Snapshot rows must stay in id order, which undoing a delete would
+        # not keep: the snapshot is reloaded instead
+        self.snapshot.load(self.database)
+
+    def index_fourniture(self, row):
+        # Adds a new fourniture, as iter_fournitures() gives it, to the
+        # in-memory indexes
+        id, name, room, type, color = row[:5]
+        self.name_index.add(id, name)
+        self.suggestions.add("fournitures", name)
+        self.facet_counts.add(room, type, color)
+        # An undo leaves the snapshot to reload_snapshot()
+        if self.snapshot is not None and not self.undoing:
+            self.snapshot.add(*row)
+            self.journal(self.reload_snapshot)
+        self.journal(self.unindex_fourniture, row)
+
+    def unindex_fourniture(self, row):
+        # row starts with (id, name, room, type, color)
+        id, name, room, type, color = row[:5]
+        self.name_index.remove(id, name)
+        self.suggestions.remove("fournitures", name)
+        self.facet_counts.remove(room, type, color)
+        if self.snapshot is not None and not self.undoing:
+            self.snapshot.remove(id)
+            self.journal(self.reload_snapshot)
+        self.journal(self.index_fourniture, row)
+
+    def index_fournitures(self, rows):
+        # index_fourniture() for many rows, with one merge of the names
+        # into the suggestions
+        for row in rows:
+            id, name, room, type, color = row[:5]
+            self.name_index.add(id, name)
+            self.facet_counts.add(room, type, color)
+            if self.snapshot is not None:
+                self.snapshot.add(*row)
+        self.suggestions.add_many("fournitures", [row[1] for row in rows])
+        if self.snapshot is not None:
+            self.journal(self.reload_snapshot)
+        self.journal(self.unindex_fournitures, rows)
+
+    def unindex_fournitures(self, rows):
+        for row in rows:
+            self.unindex_fourniture(row)
+
+    def reindex_fourniture(self, old, new):
+        # old and new (id, name, room, type, color) of an updated fourniture
+        id = new[0]
+        if old[1] != new[1]:
+            self.name_index.remove(id, old[1])
+            self.name_index.add(id, new[1])
+            self.suggestions.remove("fournitures", old[1])
+            self.suggestions.add("fournitures", new[1])
+        if tuple(old[2:5]) != tuple(new[2:5]):
+            self.facet_counts.remove(*old[2:5])
+            self.facet_counts.add(*new[2:5])
+        self.journal(self.reindex_fourniture, new, old)
+
+    def index_name(self, table, id, name):
+        # A new room, type or color
+        self.dimension_cache.add(table, id, name)
+        self.suggestions.add(table, name)
+        self.journal(self.unindex_name, table, id, name)
+
+    def unindex_name(self, table, id, name):
+        self.dimension_cache.remove(table, name)
+        self.suggestions.remove(table, name)
+        self.journal(self.index_name, table, id, name)
+
+    def execute(self, command, data, future, database=None):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(self.handle_request(command, data, database))
+        except Exception as e:
+            future.set_exception(e)
+
+    def submit(self, command, data):
+        # Each caller gets its own future, so concurrent connections can never
+        # pick up each other's responses.
+        future = Future()
+        if self.readers and command in READ_COMMANDS:
+            self.read_queue.put((command, data, future))
+        else:
+            self.request_queue.put((command, data, future))
+        return future
+
+    def submit_many(self, requests):
+        return [self.submit(command, data) for command, data in requests]
+
+    def request(self, command, data):
+        return self.submit(command, data).result()
 
-    def handle_request(self, command, data):
+    @staticmethod
+    def gather(futures):
+        return [future.result() for future in futures]
+
+    def stats(self):
+        return {
+            "dimension_cache": self.dimension_cache.stats(),
+            "search_cache": self.search_cache.stats(),
+            "name_index": self.name_index.stats(),
+            "suggestions": self.suggestions.stats(),
+            "snapshot": self.snapshot.stats() if self.snapshot is not None else None,
+        }
+
+    def search(self, data):
+        # The columnar snapshot answers in the caller's thread the filter sets
+        # it is faster on; the others are queued as a SQL SEARCH
+        if self.snapshot is not None and self.snapshot.prefers(data):
+            return self.snapshot.search(data, self.dimension_cache)
+        return self.request("SEARCH", data)
+
+    def suggest(self, data):
+        # Served in the caller's thread from memory: never queued
+        prefix = data.get("prefix")
+        table = data.get("table")
+        limit = data.get("limit", 10)
+        if not isinstance(prefix, str):
+            return {"MESSAGE": "Invalid prefix"}
+        if table is not None and table not in SUGGEST_TABLES:
+            return {"MESSAGE": "Invalid table"}
+        if not isinstance(limit, int) or isinstance(limit, bool) or not 0 < limit <= MAX_SUGGESTIONS:
+            return {"MESSAGE": f"Invalid limit (1 to {MAX_SUGGESTIONS})"}
+        tables = (table,) if table else SUGGEST_TABLES
+        return self.suggestions.suggest(prefix, tables, limit)
+
+    def place(self, data):
+        # Only the dimensions are read on the database threads: the
+        # placement itself runs in the caller's thread
+        width, depth = data.get("width"), data.get("depth")
+        ids = data.get("ids")
+        rotate = data.get("rotate", False)
+        if not all(isinstance(value, (int, float)) and not isinstance(value, bool) and value > 0 for value in (width, depth)):
+            return {"MESSAGE": "Invalid room dimensions"}
+        if (not isinstance(ids, list) or not 0 < len(ids) <= MAX_PLACE_ITEMS
+                or not all(isinstance(id, int) and not isinstance(id, bool) for id in ids)):
+            return {"MESSAGE": f"Invalid ids (1 to {MAX_PLACE_ITEMS})"}
+        if not isinstance(rotate, bool):
+            return {"MESSAGE": "Invalid rotate"}
+        dimensions = self.request("DIMENSIONS", {"ids": sorted(set(ids))})
+        missing = sorted(set(ids) - dimensions.keys())
+        if missing:
+            return {"MESSAGE": f"Fournitures not found: {missing}"}
+        placements, unplaced = place(width, depth, [(id, *dimensions[id]) for id in ids], rotate)
+        return {"placements": placements, "unplaced": unplaced}
+
+    def furnish(self, data):
+        # The candidates of every type are read with one price ordered
+        # SEARCH each, which only reads top_k rows off the (type, price)
+        # index: the cheapest combinations never use a pricier candidate.
+        # The combinations are then searched in the caller's thread.
+        room, types, budget = data.get("room"), data.get("types"), data.get("budget")
+        top_k = data.get("top_k", 5)
+        deadline_ms = data.get("deadline_ms", FURNISH_DEADLINE_MS)
+        width, depth = data.get("width"), data.get("depth")
+        if not isinstance(room, str):
+            return {"MESSAGE": "Invalid room"}
+        if (not isinstance(types, dict) or not 0 < len(types) <= MAX_TYPES
+                or not all(isinstance(count, int) and not isinstance(count, bool) and 0 < count <= MAX_COUNT for count in types.values())):
+            return {"MESSAGE": f"Invalid types (up to {MAX_TYPES} types, 1 to {MAX_COUNT} of each)"}
+        if not isinstance(budget, (int, float)) or isinstance(budget, bool) or budget < 0:
+            return {"MESSAGE": "Invalid budget"}
+        if not isinstance(top_k, int) or isinstance(top_k, bool) or not 0 < top_k <= MAX_COMBINATIONS:
+            return {"MESSAGE": f"Invalid top_k (1 to {MAX_COMBINATIONS})"}
+        if not isinstance(deadline_ms, int) or isinstance(deadline_ms, bool) or not 0 < deadline_ms <= MAX_DEADLINE_MS:
+            return {"MESSAGE": f"Invalid deadline_ms (1 to {MAX_DEADLINE_MS})"}
+        fits = None
+        if width is not None or depth is not None:
+            if not all(isinstance(value, (int, float)) and not isinstance(value, bool) and value > 0 for value in (width, depth)):
+                return {"MESSAGE": "Invalid room dimensions"}
+            fits = (width, depth, True)
+        deadline = time.monotonic() + deadline_ms / 1000
+
+        filter_on = {"room": True, "type": True, "color": False, "name": False}
+        futures = self.submit_many([("SEARCH", {
+            "filters": {"room": room, "type": type, "color": None, "name": None}, "filter_on": filter_on,
+            "order_by": "price", "top_k": top_k, "fits": fits,
+        }) for type in types])
+        fournitures = {}
+        groups = []
+        for results, count in zip(self.gather(futures), types.values()):
+            candidates = []
+            for fourniture in results:
+                fournitures[fourniture["id"]] = fourniture
+                candidates.append(((fourniture["price"], fourniture["x_dimension"] * fourniture["y_dimension"]), fourniture["id"]))
+            # SQL orders by price then id: ties go to the smaller footprint
+            candidates.sort()
+            groups.append((candidates, count))
+        combinations, complete = solve(groups, budget, top_k, deadline)
+        response = []
+        for (price, area), ids in combinations:
+            items = []
+            for id in dict.fromkeys(ids):
+                items.append(dict(fournitures[id], quantity=ids.count(id)))
+            response.append({"price": price, "items": items})
+        return {"combinations": response, "complete": complete}
+
+    def import_catalog(self, f, format, create=False):
+        # Rows are parsed and validated in the caller's thread and sent to
+        # the writer IMPORT_CHUNK_SIZE at a time, the next chunk being parsed
+        # while the previous one is written
+        imported = 0
+        errors = []
+        error_count = 0
+
+        def collect(future, chunk):
+            nonlocal imported, error_count
+            try:
+                response = future.result()
+            except Exception as e:
+                # The chunk was rolled back: none of its rows is in
+                response = {"imported": 0, "errors": [{"line": line, "MESSAGE": f"Import failed: {e}"} for line, row in chunk]}
+            imported += response["imported"]
+            error_count += len(response["errors"])
+            errors.extend(response["errors"][:MAX_IMPORT_ERRORS - len(errors)])
+
+        pending = None
+        chunk = []
+        try:
+            for line, row in iter_rows(f, format):
+                if isinstance(row, ValueError):
+                    error_count += 1
+                    if len(errors) < MAX_IMPORT_ERRORS:
+                        errors.append({"line": line, "MESSAGE": str(row)})
+                    continue
+                chunk.append((line, row))
+                if len(chunk) == IMPORT_CHUNK_SIZE:
+                    if pending is not None:
+                        collect(*pending)
+                    pending = (self.submit("IMPORT", {"rows": chunk, "create": create}), chunk)
+                    chunk = []
+        except (UnicodeDecodeError, csv.Error) as e:
+            # The rest of the file cannot be read: the rows before it stay in
+            error_count += 1
+            errors.append({"line": None, "MESSAGE": f"Unreadable file: {e}"})
+        finally:
+            if pending is not None:
+                collect(*pending)
+        if chunk:
+            collect(self.submit("IMPORT", {"rows": chunk, "create": create}), chunk)
+        return {"MESSAGE": "Import finished", "imported": imported, "error_count": error_count, "errors": errors}
+
+    def export(self, compress=False):
+        # Generator of the whole catalog as JSONL chunks (see export_chunks),
+        # read on its own read-only connection: the writer is never held,
+        # and the export sees the catalog as it was when it started.
+        if self.db_name == ":memory:":
+            raise ValueError("An in-memory database cannot be exported")
+        database = Database(self.db_name, read_only=True)
+        try:
+            yield from export_chunks(database.iter_fourniture_details(), compress)
+        finally:
+            database.close()
+
+    def handle_import(self, data):
+        # One chunk of validated IMPORT rows, as (line, row) pairs. Room,
+        # type and color names are resolved once per distinct name, and
+        # created if asked; the rows are inserted with one executemany, and
+        # the chunk is a single transaction, rolled back with the names it
+        # created if anything fails.
+        rows, create = data["rows"], data["create"]
+        errors = []
+        with self.undoable(self.database.batch()):
+            ids = {}
+            for position, table in enumerate(("rooms", "types", "colors"), 1):
+                ids[table] = {}
+                for name in {row[position] for line, row in rows}:
+                    id = self.dimension_cache.get_id(table, name)
+                    if id is None and create:
+                        id = self.handle_set({"table": table, "name": name})["id"]
+                    ids[table][name] = id
+            values = []
+            for line, row in rows:
+                room_id, type_id, color_id = ids["rooms"][row[1]], ids["types"][row[2]], ids["colors"][row[3]]
+                if room_id is None:
+                    errors.append({"line": line, "MESSAGE": "Room not found"})
+                elif type_id is None:
+                    errors.append({"line": line, "MESSAGE": "Type not found"})
+                elif color_id is None:
+                    errors.append({"line": line, "MESSAGE": "Color not found"})
+                else:
+                    values.append((row[0], room_id, type_id, color_id) + row[4:])
+            inserted = self.database.insert_fournitures(values)
+            self.index_fournitures(inserted)
+        if inserted:
+            self.search_cache.invalidate()
+        return {"imported": len(inserted), "errors": errors}
+
+    def handle_request(self, command, data, database=None):
+        database = database or self.database
         if command == "GET":
-            return self.handle_get(data)
+            return self.handle_get(data, database)
 
         elif command == "SET":
-            return self.handle_set(data)
+            response = self.handle_set(data)
+            self.catalog_changed(data)
+            return response
         elif command == "DELETE":
-            return self.handle_delete(data)
+            response = self.handle_delete(data)
+            self.catalog_changed(data)
+            return response
         elif command == "AUTHENTICATE":
-            return self.database.authenticate_user(data["username"], data["password"])
+            return database.authenticate_user(data["username"], data["password"])
         elif command == "IS_ADMIN":
-            return self.database.is_admin(data["username"])
+            return database.is_admin(data["username"])
         elif command == "SEARCH":
-            return self.handle_search(data)
+            return self.handle_search(data, database)
+        elif command in ("UPDATE", "UPSERT"):
+            response = self.handle_bulk(command, data)
+            self.catalog_changed(data)
+            return response
+        elif command == "IMPORT":
+            return self.handle_import(data)
+        elif command == "DIMENSIONS":
+            return database.get_dimensions(data["ids"])
             
         else:
             return "Invalid command"
         
-    def handle_search(self, data):
+    def catalog_changed(self, data):
+        if data.get("table") in CATALOG_TABLES:
+            self.search_cache.invalidate()
+
+    def handle_search(self, data, database=None):
+        database = database or self.database
         filters = data.get("filters", "")
         filter_on = data.get("filter_on", "")
         if filters:
-            
-            results_list = self.database.search(filters, filter_on)
-            print(results_list)
-            results_dict = []
-            for result in results_list:
-                color = self.database.get_color_by_id(result[4])
-                type = self.database.get_type_by_id(result[3])
-                room = self.database.get_room_by_id(result[2])
-                fourniture = {
-                    "id": result[0],
-                    "name": result[1],
-                    "room": room[1],
-                    "type": type[1],
-                    "color": color[1],
-                    "x_dimension": result[6],
-                    "y_dimension": result[7],
-                    "image_path": result[5],
-                    "price": result[8]
-                }
-                results_dict.append(fourniture)
-   
-            return results_dict
-        
+            limit = data.get("limit")
+            options = {
+                "ranges": data.get("ranges"), "order_by": data.get("order_by"),
+                "text": data.get("text"), "fits": data.get("fits"),
+            }
+            if data.get("fuzzy") is not None:
+                return self.handle_fuzzy_search(data, database, options)
+            if limit is None:
+                results_list = database.search_details(filters, filter_on, data.get("top_k"), **options)
+                response = [dict(zip(FOURNITURE_FIELDS, result)) for result in results_list]
+            else:
+                # One extra row tells whether there is a next page
+                results_list = database.search_details(filters, filter_on, limit + 1, data.get("after_id"),
+                                                       after_value=data.get("after_value"), **options)
+                results = [dict(zip(FOURNITURE_FIELDS, result)) for result in results_list[:limit]]
+                response = {"results": results, "more": len(results_list) > limit}
+            if data.get("facets"):
+                if isinstance(response, list):
+                    response = {"results": response}
+                response["facets"] = self.handle_facets(data, database)
+            return response
+
+    def handle_facets(self, data, database):
+        # Room, type and color counts of the matching fournitures. Without
+        # any filter they come from the incrementally kept FacetCounts,
+        # otherwise from a single grouped query.
+        filter_on = data["filter_on"]
+        if any(filter_on.values()) or data.get("ranges") or data.get("text") is not None or data.get("fits"):
+            rows = database.facet_counts(data["filters"], filter_on, data.get("ranges"), data.get("text"), data.get("fits"))
+            counts = FacetCounts.count_rows(rows)
+        else:
+            counts = self.facet_counts.snapshot()
+        facets = {}
+        for field in FACET_FIELDS:
+            names = dict(self.dimension_cache.items(field + "s"))
+            facets[field] = {names[id]: count for id, count in counts[field].items() if id in names}
+        return facets
+
+    def handle_fuzzy_search(self, data, database, options):
+        # The name index ranks the candidates, SQL applies the other filters
+        candidates = self.name_index.search(data["fuzzy"], FUZZY_CANDIDATES, FUZZY_MIN_SIMILARITY)
+        if not candidates:
+            return []
+        rank = {id: position for position, (id, similarity) in enumerate(candidates)}
+        similarity = dict(candidates)
+        results_list = database.search_details(data["filters"], data["filter_on"], ids=list(rank), **options)
+        results = [dict(zip(FOURNITURE_FIELDS, result), similarity=round(similarity[result[0]], 3)) for result in results_list]
+        results.sort(key=lambda result: rank[result["id"]])
+        return results[:data.get("top_k") or FUZZY_TOP_K]
+
     def handle_set(self, data):
         
         table = data.get("table")
@@ -82,9 +599,9 @@ class DatabaseThread(threading.Thread):
         
         
         if table == "fournitures":
-            room_id = self.database.get_room_by_name(data["room"])
-            type_id = self.database.get_type_by_name(data["type"])
-            color_id = self.database.get_color_by_name(data["color"])
+            room_id = self.dimension_cache.get_id("rooms", data["room"])
+            type_id = self.dimension_cache.get_id("types", data["type"])
+            color_id = self.dimension_cache.get_id("colors", data["color"])
             # name_already_exists = self.database.get_fourniture_by_name(data["name"])
             if room_id is None:
                 return {"MESSAGE": "Room not found"}
@@ -95,153 +612,219 @@ class DatabaseThread(threading.Thread):
             # if name_already_exists:
             #     return {"MESSAGE": "Fourniture name already exists"}
             else:
-                self.database.set_fourniture(data["name"], room_id[0], type_id[0], color_id[0], data["x_dimension"], data["y_dimension"], data["image_path"],data["price"])
-                return {"MESSAGE": "Fourniture set successfully","id": self.database.get_fourniture_by_name(data["name"])[0]}
+                id = self.database.set_fourniture(data["name"], room_id, type_id, color_id, data["x_dimension"], data["y_dimension"], data["image_path"],data["price"])
+                self.index_fourniture((id, data["name"], room_id, type_id, color_id,
+                                       data["x_dimension"], data["y_dimension"], data["image_path"], data["price"]))
+                return {"MESSAGE": "Fourniture set successfully","id": id}
             
         elif table == "rooms":
-            room_already_exists = self.database.get_room_by_name(data["name"])
-            if room_already_exists:
+            # The UNIQUE constraint makes the insert its own existence check
+            room_id = self.database.add_room(data["name"])
+            if room_id is None:
                 return {"MESSAGE": "Room already exists"}
             else:
-                self.database.add_room(data["name"])
-                return {"MESSAGE": "Room added successfully", "id": self.database.get_room_by_name(data["name"])[0]}
+                self.index_name("rooms", room_id, data["name"])
+                return {"MESSAGE": "Room added successfully", "id": room_id}
         elif table == "types":
-            type_already_exists = self.database.get_type_by_name(data["name"])
-            if type_already_exists:
+            # The UNIQUE constraint makes the insert its own existence check
+            type_id = self.database.add_type(data["name"])
+            if type_id is None:
                 return {"MESSAGE": "Type already exists"}
             else:
-                self.database.add_type(data["name"])
-                return {"MESSAGE": "Type added successfully", "id": self.database.get_type_by_name(data["name"])[0]}
+                self.index_name("types", type_id, data["name"])
+                return {"MESSAGE": "Type added successfully", "id": type_id}
         elif table == "colors":
-            color_already_exists = self.database.get_color_by_name(data["name"])
-            if color_already_exists:
+            # The UNIQUE constraint makes the insert its own existence check
+            color_id = self.database.add_color(data["name"])
+            if color_id is None:
                 return {"MESSAGE": "Color already exists"}
             else:
-                self.database.add_color(data["name"])
-                return {"MESSAGE": "Color added successfully", "id": self.database.get_color_by_name(data["name"])[0]}
+                self.index_name("colors", color_id, data["name"])
+                return {"MESSAGE": "Color added successfully", "id": color_id}
         elif table == "users":
-            already_exists = self.database.get_user_by_name(data["username"])
-            if already_exists:
+            if not self.database.add_user(data["username"], data["password"], data["is_admin"]):
                 return {"MESSAGE": "User already exists"}
             else:
-                self.database.add_user(data["username"], data["password"], data["is_admin"])
                 return {"MESSAGE": "User added successfully"}
             
     def handle_delete(self, data):
         table = data.get("table")
         if table == "fournitures":
-            return (
-                "Fourniture deleted successfully"
-                if self.database.delete_fourniture(data["id"])
-                else "Fourniture not found"
-            )
+            fourniture = self.database.delete_fourniture(data["id"])
+            if fourniture:
+                self.unindex_fourniture(fourniture)
+                return "Fourniture deleted successfully"
+            return "Fourniture not found"
         elif table == "rooms":
-            if self.database.get_room_by_name(data["name"]):
-                self.database.remove_room(data["name"])
+            id = self.dimension_cache.get_id("rooms", data["name"])
+            if self.database.remove_room(data["name"]):
+                self.unindex_name("rooms", id, data["name"])
                 return "Room deleted successfully"
             else:
                 return "Room not found"
             
         elif table == "types":
-            if self.database.get_type_by_name(data["name"]):
-                self.database.remove_type(data["name"])
+            id = self.dimension_cache.get_id("types", data["name"])
+            if self.database.remove_type(data["name"]):
+                self.unindex_name("types", id, data["name"])
                 return "Type deleted successfully"
             else:
                 return "Type not found"
         elif table == "colors":
-            if self.database.get_color_by_name(data["name"]):
-                self.database.remove_color(data["name"])
+            id = self.dimension_cache.get_id("colors", data["name"])
+            if self.database.remove_color(data["name"]):
+                self.unindex_name("colors", id, data["name"])
                 return "Color deleted successfully"
             else:
                 return "Color not found"
         elif table == "users":
-            if self.database.get_user_by_name(data["username"]):
-                self.database.delete_user(data["username"])
+            if self.database.delete_user(data["username"]):
                 return "User deleted successfully"
             else:
                 return "User not found"
         
         
-    def handle_get(self, data):
+    def fourniture_values(self, fields):
+        # The FOURNITURE_COLUMNS values of a SET-like dict, with the room,
+        # type and color names resolved to ids. Returns them and an error
+        # response, one of them None.
+        values = {}
+        for field, value in fields.items():
+            if field not in FOURNITURE_COLUMNS:
+                return None, {"MESSAGE": f"Invalid field: {field}"}
+            if field in ("room", "type", "color"):
+                value = self.dimension_cache.get_id(field + "s", value)
+                if value is None:
+                    return None, {"MESSAGE": f"{field.capitalize()} not found"}
+            elif field == "name" or field == "image_path":
+                if not isinstance(value, str) or not value:
+                    return None, {"MESSAGE": f"Invalid {field}"}
+            elif value is not None or field != "price":
+                if not isinstance(value, (int, float)) or isinstance(value, bool):
+                    return None, {"MESSAGE": f"Invalid {field}"}
+            values[field] = value
+        return values, None
+
+    def fourniture_written(self, row, old=None, created=False):
+        # Brings the in-memory indexes up to date with row, as returned by
+        # the write. old is the row before an update (as get_fourniture()
+        # returns it), only needed when the name, room, type or color may
+        # have changed.
+        if created:
+            self.index_fourniture(row)
+            return
+        if old is not None:
+            self.reindex_fourniture(old[:5], row[:5])
+        if self.snapshot is not None:
+            self.snapshot.update(*row)
+            self.journal(self.reload_snapshot)
+
+    def fourniture_details(self, row):
+        # A written row as GET returns it
+        fourniture = dict(zip(FOURNITURE_FIELDS, row))
+        for field in ("room", "type", "color"):
+            fourniture[field] = self.dimension_cache.get_name(field + "s", fourniture[field])
+        if fourniture["image_path"] == "None":
+            fourniture["image_path"] = None
+        return fourniture
+
+    def handle_update(self, data):
+        # Partial update of one fourniture: {"id": ..., "fields": {...}},
+        # with room, type and color given by name. Only the written columns
+        # change; the old row is read only if the indexes on the name, room,
+        # type or color need it.
+        id, fields = data.get("id"), data.get("fields")
+        if not isinstance(id, int) or isinstance(id, bool):
+            return {"MESSAGE": "Invalid id"}
+        if not isinstance(fields, dict) or not fields:
+            return {"MESSAGE": "Invalid fields"}
+        values, error = self.fourniture_values(fields)
+        if error:
+            return error
+        old = None
+        if values.keys() & {"name", "room", "type", "color"}:
+            old = self.database.get_fourniture(id)
+            if old is None:
+                return {"MESSAGE": "Fourniture not found"}
+        row = self.database.update_fourniture(id, values)
+        if row is None:
+            return {"MESSAGE": "Fourniture not found"}
+        self.fourniture_written(row, old)
+        return {"MESSAGE": "Fourniture updated successfully", "fourniture": self.fourniture_details(row)}
+
+    def handle_upsert(self, data):
+        # SET keyed on (name, room, type, color): the fournitures with that
+        # key get the dimensions, image and price, or one is created
+        fields = {field: data.get(field) for field in FOURNITURE_COLUMNS}
+        if fields["image_path"] is None:
+            fields["image_path"] = "None"
+        for field in FOURNITURE_COLUMNS[:6]:
+            if fields[field] is None:
+                return {"MESSAGE": f"Missing {field}"}
+        values, error = self.fourniture_values(fields)
+        if error:
+            return error
+        rows, created = self.database.upsert_fourniture(*values.values())
+        for row in rows:
+            self.fourniture_written(row, created=created)
+        return {
+            "MESSAGE": "Fourniture set successfully" if created else "Fourniture updated successfully",
+            "ids": [row[0] for row in rows],
+        }
+
+    def handle_bulk(self, command, data):
+        # UPDATE and UPSERT write one fourniture, or with "items" up to
+        # MAX_BULK_WRITES of them (as the single requests would be given) in
+        # one transaction, answering with one response each
+        if data.get("table") != "fournitures":
+            return {"MESSAGE": "Invalid table"}
+        handle = self.handle_update if command == "UPDATE" else self.handle_upsert
+        items = data.get("items")
+        if items is None:
+            return handle(data)
+        if not isinstance(items, list) or not 0 < len(items) <= MAX_BULK_WRITES:
+            return {"MESSAGE": f"Invalid items (1 to {MAX_BULK_WRITES})"}
+        with self.undoable(self.database.batch()):
+            results = [handle(item) if isinstance(item, dict) else {"MESSAGE": "Invalid item"} for item in items]
+        return {"MESSAGE": f"{len(results)} fournitures written", "results": results}
+
+    def handle_get(self, data, database=None):
+        database = database or self.database
         
         table = data.get("table")
         response = {}
         
         if table == "fournitures":
-            fourniture = self.database.get_fourniture(data["id"])
-            if fourniture[5] !="None":
-                room = self.database.get_room_by_id(fourniture[2])
-                type = self.database.get_type_by_id(fourniture[3])
-                color = self.database.get_color_by_id(fourniture[4])
-                response = {
-                    "id": fourniture[0],
-                    "name": fourniture[1],
-                    "room": room[1],
-                    "type":  type[1],
-                    "color": color[1],
-                    "x_dimension": fourniture[6],
-                    "y_dimension": fourniture[7],
-                    "image_path": fourniture[5],
-                    "price": fourniture[8]
-                }
-                    
-             
-            else:
-                room = self.database.get_room_by_id(fourniture[2])
-                type = self.database.get_type_by_id(fourniture[3])
-                color = self.database.get_color_by_id(fourniture[4])
-                response = {
-                    "id": fourniture[0],
-                    "name": fourniture[1],
-                    "room": room[1],
-                    "type": type[1],
-                    "color": color[1],
-                    "x_dimension": fourniture[6],
-                    "y_dimension": fourniture[7],
-                    "image_path": None,
-                    "price": fourniture[8]
-                }
-                
+            fourniture = database.get_fourniture_details(data["id"])
+            if fourniture is None:
+                return {"MESSAGE": "Fourniture not found"}
+            response = dict(zip(FOURNITURE_FIELDS, fourniture))
+            if response["image_path"] == "None":
+                response["image_path"] = None
 
-        if table == "rooms":
-            if data.get("id"):
-                room = self.database.get_room_by_id(data["id"])
-                if room:
-                    response = {"name": room[1]}
-            else:
-                rooms = self.database.get_rooms()
-                print(rooms)
-                response = [{"id": room[0], "name": room[1]} for room in rooms]
-                
-        if table == "types":
-            if data.get("id"):
-                type = self.database.get_type_by_id(data["id"])
-                if type:
-                    response = {"name": type[1]}
-            else:
-                types = self.database.get_types()
-                response = [{"id": type[0], "name": type[1]} for type in types]
-                
-        if table == "colors":
+        if table in ("rooms", "types", "colors"):
             if data.get("id"):
-                color = self.database.get_color_by_id(data["id"])
-                if color:
-                    response = {"name": color[1]}
+                name = self.dimension_cache.get_name(table, data["id"])
+                if name is not None:
+                    response = {"name": name}
             else:
-                colors = self.database.get_colors()
-                response = [{"id": color[0], "name": color[1]} for color in colors]
+                response = [{"id": id, "name": name} for id, name in self.dimension_cache.items(table)]
         
         if table == "users":
             if data.get("username"):
-                user = self.database.get_user_by_id(data["username"])
+                user = database.get_user_by_id(data["username"])
                 if user:
                     response = {"username": user[1], "is_admin": user[3]}
             else:
-                users = self.database.get_users()
+                users = database.get_users()
                 response = [{"id": user[0], "username": user[1],"password": user[2], "is_admin": user[3]} for user in users]
                 
         return response
 
     def stop(self):
+        for reader in self.readers:
+            self.read_queue.put(None)
+        for reader in self.readers:
+            reader.join()
         self.request_queue.put(None)
         self.join()
\ No newline at end of file
@@ -0,0 +1,28 @@
+import json
+import zlib
+
+from .database import FOURNITURE_FIELDS
+
+# Rows fetched from the export cursor at a time: one chunk of JSONL, and one
+# frame on the connection
+EXPORT_CHUNK_SIZE = 1000
+
+
+def export_chunks(cursor, compress=False, chunk_size=EXPORT_CHUNK_SIZE):
+    # JSONL of the FOURNITURE_FIELDS rows of cursor, as bytes chunks, gzipped
+    # if compress is set. Rows are fetched chunk_size at a time and the
+    # compressor is streamed, so memory does not grow with the catalog.
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        chunk = "".join(json.dumps(dict(zip(FOURNITURE_FIELDS, row))) + "\n" for row in rows).encode("utf-8")
+        if compressor is not None:
+            chunk = compressor.compress(chunk)
+            # Small chunks are buffered by the compressor until it has a block
+            if not chunk:
+                continue
+        yield chunk
+    if compressor is not None:
+        yield compressor.flush()
@@ -0,0 +1,97 @@
+import heapq
+import math
+import time
+from itertools import islice
+
+MAX_COMBINATIONS = 50
+MAX_COUNT = 10
+MAX_TYPES = 10
+
+# Default time budget of a FURNISH request, in milliseconds
+FURNISH_DEADLINE_MS = 200
+MAX_DEADLINE_MS = 2000
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def with_candidate(candidate, options):
+    # Lazily: the merge below only takes the first few of every run
+    (price, area), id = candidate
+    for (rest_price, rest_area), ids in options:
+        yield (price + rest_price, area + rest_area), (id,) + ids
+
+
+def cheapest_multisets(candidates, count, limit, top_k, deadline):
+    # The top_k cheapest ways of taking count of the candidates, the same
+    # one possibly several times (two identical chairs), as (key, ids).
+    # candidates are (key, id) sorted by key, a key being (price, area): the
+    # area breaks price ties in favor of the smaller footprint. limit is
+    # the most the multiset can cost.
+    memo = {}
+
+    def best(count, start):
+        # Multisets of candidates[start:], taken in index order so that
+        # each one is only built once. best(count, i) for every i is reused
+        # by every larger count: that is the memoized table.
+        if count == 0:
+            return [((0, 0), ())]
+        state = (count, start)
+        if state not in memo:
+            if time.monotonic() > deadline:
+                raise DeadlineExceeded
+            runs = []
+            for i in range(start, len(candidates)):
+                price = candidates[i][0][0]
+                # Candidates are sorted: nothing from here on fits the limit
+                if price * count > limit:
+                    break
+                runs.append(with_candidate(candidates[i], best(count - 1, i)))
+            # Every run is sorted, so the top_k come first in the merge
+            memo[state] = [option for option in islice(heapq.merge(*runs), top_k) if option[0][0] <= limit]
+        return memo[state]
+
+    return best(count, 0)
+
+
+def solve(groups, budget, top_k=5, deadline=None):
+    # groups are (candidates, count) pairs, candidates as for
+    # cheapest_multisets. Returns the top_k cheapest combinations taking
+    # count items of every group within budget, as (key, ids) best first,
+    # and whether the search completed. Past the deadline (a
+    # time.monotonic() value) only the cheapest combination is returned,
+    # which needs no search: the cheapest candidate of every group.
+    if deadline is None:
+        deadline = time.monotonic() + FURNISH_DEADLINE_MS / 1000
+    floors = [count * candidates[0][0][0] if candidates else math.inf for candidates, count in groups]
+    if sum(floors) > budget:
+        return [], True
+    try:
+        options = []
+        for (candidates, count), floor in zip(groups, floors):
+            # What the other groups cost at least bounds this one
+            limit = budget - (sum(floors) - floor)
+            options.append(cheapest_multisets(candidates, count, limit, top_k, deadline))
+        combinations = [((0, 0), ())]
+        rest = sum(floors)
+        for group_options, floor in zip(options, floors):
+            rest -= floor
+            merged = []
+            for (price, area), ids in combinations:
+                for (option_price, option_area), option_ids in group_options:
+                    # Options are sorted: the next ones cost even more
+                    if price + option_price + rest > budget:
+                        break
+                    merged.append(((price + option_price, area + option_area), ids + option_ids))
+            if time.monotonic() > deadline:
+                raise DeadlineExceeded
+            combinations = heapq.nsmallest(top_k, merged)
+        return combinations, True
+    except DeadlineExceeded:
+        key, ids = (0, 0), ()
+        for candidates, count in groups:
+            (price, area), id = candidates[0]
+            key = (key[0] + price * count, key[1] + area * count)
+            ids += (id,) * count
+        return [(key, ids)], False
@@ -0,0 +1,85 @@
+import csv
+import io
+import json
+import math
+
+from .search_engine import is_number
+
+IMPORT_FORMATS = ("csv", "jsonl")
+
+# Rows sent to the DatabaseThread per IMPORT request: each chunk is one
+# transaction, and other writes get the writer thread between chunks
+IMPORT_CHUNK_SIZE = 10_000
+
+# Per-row errors reported in the response past which only the count grows
+MAX_IMPORT_ERRORS = 1000
+
+IMPORT_FIELDS = ("name", "room", "type", "color", "x_dimension", "y_dimension", "image_path", "price")
+REQUIRED_FIELDS = IMPORT_FIELDS[:6]
+
+# SQLite integers are 64-bit: larger ones make the insert raise
+MIN_INTEGER, MAX_INTEGER = -2 ** 63, 2 ** 63 - 1
+
+
+def to_number(value):
+    # CSV cells are text: "12" is 12, "12.5" is 12.5. None for anything
+    # SQLite cannot store as a number.
+    if isinstance(value, str):
+        try:
+            value = float(value)
+        except ValueError:
+            return None
+        if math.isfinite(value) and value.is_integer():
+            value = int(value)
+    if not is_number(value) or not math.isfinite(value) or not MIN_INTEGER <= value <= MAX_INTEGER:
+        return None
+    return value
+
+
+def validate_row(row):
+    # A row as a tuple in IMPORT_FIELDS order, or a ValueError saying what
+    # is wrong with it. image_path and price are optional.
+    if not isinstance(row, dict):
+        raise ValueError("Row is not an object")
+    for field in REQUIRED_FIELDS:
+        if row.get(field) in (None, ""):
+            raise ValueError(f"Missing {field}")
+    for field in ("name", "room", "type", "color"):
+        if not isinstance(row[field], str):
+            raise ValueError(f"Invalid {field}")
+    x_dimension, y_dimension = to_number(row["x_dimension"]), to_number(row["y_dimension"])
+    if x_dimension is None or y_dimension is None:
+        raise ValueError("Invalid dimensions")
+    price = row.get("price")
+    if price in (None, ""):
+        price = None
+    else:
+        price = to_number(price)
+        if price is None:
+            raise ValueError("Invalid price")
+    image_path = row.get("image_path") or "None"
+    if not isinstance(image_path, str):
+        raise ValueError("Invalid image_path")
+    return (row["name"], row["room"], row["type"], row["color"], x_dimension, y_dimension, image_path, price)
+
+
+def iter_rows(f, format):
+    # (line, row or ValueError) for every row of a binary file object, line
+    # being the line number in the file (the header is line 1 in CSV)
+    text = io.TextIOWrapper(f, encoding="utf-8", newline="")
+    if format == "csv":
+        reader = csv.DictReader(text)
+        for row in reader:
+            try:
+                yield reader.line_num, validate_row(row)
+            except ValueError as e:
+                yield reader.line_num, e
+        return
+    for line, content in enumerate(text, 1):
+        if not content.strip():
+            continue
+        try:
+            yield line, validate_row(json.loads(content))
+        except ValueError as e:
+            # json.JSONDecodeError is a ValueError too
+            yield line, ValueError("Invalid JSON") if isinstance(e, json.JSONDecodeError) else e
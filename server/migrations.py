@@ -0,0 +1,115 @@
+# Ordered schema migrations applied by Database.init_db.
+#
+# The schema version is stored in the database itself (PRAGMA user_version).
+# Migration N (1-based position in MIGRATIONS) runs once, in its own
+# transaction, on any database whose version is lower than N. Never edit or
+# reorder a migration that has shipped: append a new one instead.
+
+
+def add_lookup_indexes(cursor):
+    # Filtering by room, type or color joins through these foreign keys
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_fournitures_room ON fournitures(room)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_fournitures_type ON fournitures(type)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_fournitures_color ON fournitures(color)")
+
+
+def add_name_and_price_indexes(cursor):
+    # name= lookups use the binary index, name LIKE (case-insensitive by
+    # default in SQLite) can only use a NOCASE one
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_fournitures_name ON fournitures(name)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_fournitures_name_nocase ON fournitures(name COLLATE NOCASE)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_fournitures_price ON fournitures(price)")
+
+
+def add_range_indexes(cursor):
+    # Range filters and ORDER BY on the dimensions. The (type, price) index
+    # serves the common "this type, under this price, cheapest first" query
+    # without a sort; ids ride along in every index as the rowid.
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_fournitures_x_dimension ON fournitures(x_dimension)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_fournitures_y_dimension ON fournitures(y_dimension)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_fournitures_type_price ON fournitures(type, price)")
+
+
+def add_name_fts(cursor):
+    # External content FTS5 index over the names: the text lives in
+    # fournitures only, the triggers keep the index in step with it
+    cursor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS fournitures_fts USING fts5("
+        "name, content='fournitures', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+    )
+    cursor.execute("""CREATE TRIGGER IF NOT EXISTS fournitures_fts_insert AFTER INSERT ON fournitures BEGIN
+        INSERT INTO fournitures_fts(rowid, name) VALUES (new.id, new.name);
+    END""")
+    cursor.execute("""CREATE TRIGGER IF NOT EXISTS fournitures_fts_delete AFTER DELETE ON fournitures BEGIN
+        INSERT INTO fournitures_fts(fournitures_fts, rowid, name) VALUES ('delete', old.id, old.name);
+    END""")
+    cursor.execute("""CREATE TRIGGER IF NOT EXISTS fournitures_fts_update AFTER UPDATE OF name ON fournitures BEGIN
+        INSERT INTO fournitures_fts(fournitures_fts, rowid, name) VALUES ('delete', old.id, old.name);
+        INSERT INTO fournitures_fts(rowid, name) VALUES (new.id, new.name);
+    END""")
+    # Index the rows that predate the table
+    cursor.execute("INSERT INTO fournitures_fts(fournitures_fts) VALUES ('rebuild')")
+
+
+def add_dimension_rtree(cursor):
+    # Footprints as points in an R-tree: (x, y) as is and sorted as (short,
+    # long) side, so that "fits, rotation allowed" is a box query as well.
+    # R-tree coordinates are 32 bit floats: queries recheck the real columns.
+    cursor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS fournitures_rtree USING rtree("
+        "id, min_x, max_x, min_y, max_y, min_short, max_short, min_long, max_long)"
+    )
+    cursor.execute("""CREATE TRIGGER IF NOT EXISTS fournitures_rtree_insert AFTER INSERT ON fournitures BEGIN
+        INSERT INTO fournitures_rtree VALUES (
+            new.id, new.x_dimension, new.x_dimension, new.y_dimension, new.y_dimension,
+            MIN(new.x_dimension, new.y_dimension), MIN(new.x_dimension, new.y_dimension),
+            MAX(new.x_dimension, new.y_dimension), MAX(new.x_dimension, new.y_dimension));
+    END""")
+    cursor.execute("""CREATE TRIGGER IF NOT EXISTS fournitures_rtree_delete AFTER DELETE ON fournitures BEGIN
+        DELETE FROM fournitures_rtree WHERE id = old.id;
+    END""")
+    cursor.execute("""CREATE TRIGGER IF NOT EXISTS fournitures_rtree_update AFTER UPDATE OF x_dimension, y_dimension ON fournitures BEGIN
+        UPDATE fournitures_rtree SET
+            min_x = new.x_dimension, max_x = new.x_dimension, min_y = new.y_dimension, max_y = new.y_dimension,
+            min_short = MIN(new.x_dimension, new.y_dimension), max_short = MIN(new.x_dimension, new.y_dimension),
+            min_long = MAX(new.x_dimension, new.y_dimension), max_long = MAX(new.x_dimension, new.y_dimension)
+        WHERE id = new.id;
+    END""")
+    cursor.execute("""INSERT INTO fournitures_rtree
+        SELECT id, x_dimension, x_dimension, y_dimension, y_dimension,
+            MIN(x_dimension, y_dimension), MIN(x_dimension, y_dimension),
+            MAX(x_dimension, y_dimension), MAX(x_dimension, y_dimension)
+        FROM fournitures""")
+
+
+MIGRATIONS = [
+    add_lookup_indexes,
+    add_name_and_price_indexes,
+    add_range_indexes,
+    add_name_fts,
+    add_dimension_rtree,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn, migrations=MIGRATIONS):
+    version = get_schema_version(conn)
+    for target, migration in enumerate(migrations, start=1):
+        if target <= version:
+            continue
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN")
+            migration(cursor)
+            cursor.execute(f"PRAGMA user_version = {target}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        version = target
+    return version
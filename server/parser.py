@@ -1,8 +1,145 @@
 import json
+import struct
+
+# Framed protocol: every message is prefixed with its payload length and the
+# id of the request it belongs to. Binary payloads (images) are sent as a
+# sequence of frames carrying the same request id.
+FRAME_HEADER = struct.Struct("!II")
+MAX_FRAME_SIZE = 64 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+PROTOCOLS = ("legacy", "framed")
+
+
+class RawJSON(str):
+    # A response that is already serialized, e.g. served from the search cache
+    pass
+
+
+def encode_frame(request_id, payload):
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    return FRAME_HEADER.pack(len(payload), request_id) + payload
+
+
+class FrameDecoder:
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        self.buffer += data
+        frames = []
+        offset = 0
+        while len(self.buffer) - offset >= FRAME_HEADER.size:
+            length, request_id = FRAME_HEADER.unpack_from(self.buffer, offset)
+            if length > MAX_FRAME_SIZE:
+                raise ValueError(f"Frame too large: {length} bytes")
+            start = offset + FRAME_HEADER.size
+            end = start + length
+            if len(self.buffer) < end:
+                break
+            frames.append((request_id, bytes(self.buffer[start:end])))
+            offset = end
+        del self.buffer[:offset]
+        return frames
+
+
+class MessageDecoder:
+    # Splits the unframed (legacy) stream into JSON messages. Messages carry
+    # no length, so the decoder tracks brackets and strings to find where a
+    # value ends. Raw bytes that follow a message (an image) are read with
+    # take(). Scanning resumes where it stopped, so a message split over many
+    # reads is only scanned once.
+    def __init__(self):
+        self.buffer = bytearray()
+        self.reset_scan()
+
+    def reset_scan(self):
+        self.scanned = 0
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+
+    def feed(self, data):
+        self.buffer += data
+
+    def next_message(self):
+        buffer = self.buffer
+        i = self.scanned
+        if self.depth == 0:
+            while i < len(buffer) and buffer[i] in b" \t\r\n":
+                i += 1
+            del buffer[:i]
+            i = 0
+            if not buffer:
+                return None
+            if buffer[0] not in b"{[":
+                # Not a JSON object or array: hand everything over as is
+                message = bytes(buffer)
+                buffer.clear()
+                self.reset_scan()
+                return message
+        while i < len(buffer):
+            c = buffer[i]
+            i += 1
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif c == 0x5C:
+                    self.escape = True
+                elif c == 0x22:
+                    self.in_string = False
+            elif c == 0x22:
+                self.in_string = True
+            elif c == 0x7B or c == 0x5B:
+                self.depth += 1
+            elif c == 0x7D or c == 0x5D:
+                self.depth -= 1
+                if self.depth == 0:
+                    message = bytes(buffer[:i])
+                    del buffer[:i]
+                    self.reset_scan()
+                    return message
+        if len(buffer) > MAX_FRAME_SIZE:
+            raise ValueError(f"Message too large: {len(buffer)} bytes")
+        self.scanned = i
+        return None
+
+    def take(self, size):
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        self.reset_scan()
+        return data
+
 
 class Parser:
     def parse(self, request):
         try:
             return json.loads(request)
-        except json.JSONDecodeError:
-            return None
\ No newline at end of file
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return None
+
+    def dump(self, response):
+        if isinstance(response, RawJSON):
+            return response
+        return json.dumps(response)
+
+    def iter_frames(self, recv, bufsize=CHUNK_SIZE, buffered=b""):
+        decoder = FrameDecoder()
+        yield from decoder.feed(buffered)
+        while True:
+            data = recv(bufsize)
+            if not data:
+                return
+            yield from decoder.feed(data)
+
+    async def aiter_frames(self, reader, bufsize=CHUNK_SIZE, buffered=b""):
+        decoder = FrameDecoder()
+        for frame in decoder.feed(buffered):
+            yield frame
+        while True:
+            data = await reader.read(bufsize)
+            if not data:
+                return
+            for frame in decoder.feed(data):
+                yield frame
@@ -0,0 +1,119 @@
+import bisect
+import math
+import statistics
+
+MAX_PLACE_ITEMS = 1000
+
+
+class SpatialHash:
+    # Uniform grid over the floor: a rectangle is registered in every cell
+    # it covers, so an overlap test only looks at the rectangles sharing a
+    # cell with it instead of all the placed ones. With cells about the size
+    # of an item, that is a handful of rectangles whatever the item count.
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.tests = 0
+
+    def _cells(self, x, y, width, depth):
+        size = self.cell_size
+        for i in range(int(x // size), math.ceil((x + width) / size)):
+            for j in range(int(y // size), math.ceil((y + depth) / size)):
+                yield i, j
+
+    def insert(self, x, y, width, depth):
+        rectangle = (x, y, x + width, y + depth)
+        for cell in self._cells(x, y, width, depth):
+            self.cells.setdefault(cell, []).append(rectangle)
+
+    def collides(self, x, y, width, depth):
+        # Returns a placed rectangle overlapping this one, as (left, bottom,
+        # right, top), or None. Rectangles touching along an edge do not
+        # overlap.
+        right, top = x + width, y + depth
+        for cell in self._cells(x, y, width, depth):
+            for rectangle in self.cells.get(cell, ()):
+                self.tests += 1
+                left, bottom, other_right, other_top = rectangle
+                if x < other_right and left < right and y < other_top and bottom < top:
+                    return rectangle
+        return None
+
+
+def place(width, depth, items, rotate=False, index=None):
+    # Bottom-left placement of (id, x_dimension, y_dimension) items in a
+    # width x depth room. Items go largest first, each at the lowest then
+    # leftmost free corner: the origin or the bottom-right or top-left corner
+    # of an item already placed. rotate also tries every item turned by a
+    # quarter. Returns the placements, as dicts, and the ids left out.
+    # Items that can never fit are left out without being tried; index is
+    # the collision index, a SpatialHash sized after the items by default.
+    fitting = []
+    unplaced = []
+    for item in items:
+        id, x_dimension, y_dimension = item
+        fits = x_dimension <= width and y_dimension <= depth
+        if rotate:
+            fits = fits or (y_dimension <= width and x_dimension <= depth)
+        if fits:
+            fitting.append(item)
+        else:
+            unplaced.append(id)
+    if index is None:
+        sides = [max(x_dimension, y_dimension) for id, x_dimension, y_dimension in fitting]
+        index = SpatialHash(statistics.median(sides) if sides else 1)
+    fitting.sort(key=lambda item: (item[1] * item[2], max(item[1], item[2])), reverse=True)
+
+    # Smallest width and depth among the items from each one on: a corner
+    # with less room than that left is of no use for the rest
+    smallest = []
+    min_width = min_depth = math.inf
+    for id, x_dimension, y_dimension in reversed(fitting):
+        if rotate:
+            x_dimension = y_dimension = min(x_dimension, y_dimension)
+        min_width, min_depth = min(min_width, x_dimension), min(min_depth, y_dimension)
+        smallest.append((min_width, min_depth))
+    smallest.reverse()
+
+    # Free corners, as (y, x), kept sorted: the first one that fits is the
+    # lowest then leftmost. Corners found covered by a placed item are
+    # dropped, so that later items do not test them again.
+    corners = [(0, 0)]
+    placements = []
+    for (id, x_dimension, y_dimension), (min_width, min_depth) in zip(fitting, smallest):
+        covered = set()
+        orientations = [(x_dimension, y_dimension, False)]
+        if rotate and x_dimension != y_dimension:
+            orientations.append((y_dimension, x_dimension, True))
+        best = None
+        for item_width, item_depth, rotated in orientations:
+            for corner in corners:
+                if best is not None and corner >= best[0]:
+                    break
+                y, x = corner
+                if x + item_width > width or y + item_depth > depth:
+                    continue
+                rectangle = index.collides(x, y, item_width, item_depth)
+                if rectangle is None:
+                    best = (corner, item_width, item_depth, rotated)
+                    break
+                left, bottom, right, top = rectangle
+                if left <= x < right and bottom <= y < top:
+                    covered.add(corner)
+        if best is None:
+            unplaced.append(id)
+        else:
+            corner, item_width, item_depth, rotated = best
+            y, x = corner
+            index.insert(x, y, item_width, item_depth)
+            covered.add(corner)
+            for free in ((y, x + item_width), (y + item_depth, x)):
+                i = bisect.bisect_left(corners, free)
+                if i == len(corners) or corners[i] != free:
+                    corners.insert(i, free)
+            placements.append({"id": id, "x": x, "y": y, "width": item_width, "depth": item_depth, "rotated": rotated})
+        corners = [
+            corner for corner in corners
+            if corner not in covered and corner[1] + min_width <= width and corner[0] + min_depth <= depth
+        ]
+    return placements, unplaced
@@ -1,3 +1,37 @@
+import base64
+import binascii
+import json
+
+from server.database import RANGE_FIELDS, RANK_ORDER, fts_query, parse_order
+from server.parser import RawJSON
+from server.trigram_index import trigrams
+
+MAX_PAGE_SIZE = 1000
+STREAM_CHUNK_SIZE = 200
+
+
+def encode_cursor(position):
+    return base64.urlsafe_b64encode(json.dumps(position).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (AttributeError, ValueError, binascii.Error):
+        return None
+    if not isinstance(position, dict) or not isinstance(position.get("id"), int) or isinstance(position["id"], bool):
+        return None
+    # The value is bound straight into the keyset comparison
+    value = position.get("value")
+    if value is not None and not is_number(value) and not isinstance(value, str):
+        return None
+    return position
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
 class SearchEngine:
     def __init__(self, database_thread):
         self.database_thread = database_thread
@@ -5,18 +39,157 @@ class SearchEngine:
         self.filter_type = self.database_thread.database.get_filter()
         for key in self.filter_type:
             self.filter[key] = None
+        self.ranges = {}
+        self.order_by = None
+        self.text = None
+        self.fuzzy = None
+        self.space = None
 
-    def search(self, query):
-        
-        # Take query data and put into filter
+    def set_query(self, query, order_by=None):
+        # Take query data and put into filter. Range bounds are given as
+        # min_<field>/max_<field>, "text" is a full-text name search and
+        # "fuzzy" a typo-tolerant one, ranked by similarity. "fits" is a
+        # {"width", "depth", "rotate"} space the footprint must fit in.
+        # Returns an error response or None.
         self.reset_filters()
         for key, value in query.items():
             if key in self.filter_type :
                 self.set_filter(key, value)
                 self.filter_type[key] = True
-        
-        self.database_thread.request_queue.put(("SEARCH",{"filters" : self.filter,"filter_on":self.filter_type}))
-        return self.database_thread.response_queue.get()
+        for field in RANGE_FIELDS:
+            bounds = (query.get(f"min_{field}"), query.get(f"max_{field}"))
+            if bounds == (None, None):
+                continue
+            if not all(bound is None or is_number(bound) for bound in bounds):
+                return {"MESSAGE": f"Invalid range for {field}"}
+            self.ranges[field] = bounds
+        text = query.get("text")
+        if text is not None:
+            if not isinstance(text, str) or fts_query(text) is None:
+                return {"MESSAGE": "Invalid text"}
+            self.text = text
+        fuzzy = query.get("fuzzy")
+        if fuzzy is not None:
+            if not isinstance(fuzzy, str) or not trigrams(fuzzy):
+                return {"MESSAGE": "Invalid fuzzy"}
+            if order_by is not None:
+                return {"MESSAGE": "Fuzzy results are ordered by similarity"}
+            self.fuzzy = fuzzy
+        fits = query.get("fits")
+        if fits is not None:
+            if not isinstance(fits, dict):
+                return {"MESSAGE": "Invalid fits"}
+            width, depth, rotate = fits.get("width"), fits.get("depth"), fits.get("rotate", False)
+            if not (is_number(width) and is_number(depth) and width > 0 and depth > 0 and isinstance(rotate, bool)):
+                return {"MESSAGE": "Invalid fits"}
+            self.space = (width, depth, rotate)
+        if order_by is not None:
+            try:
+                parse_order(order_by)
+            except (AttributeError, ValueError):
+                return {"MESSAGE": "Invalid order_by"}
+            if order_by == RANK_ORDER and self.text is None:
+                return {"MESSAGE": "Invalid order_by"}
+            self.order_by = order_by
+        return None
+
+    def search(self, query, limit=None, cursor=None, order_by=None, top_k=None, facets=False):
+        error = self.set_query(query, order_by)
+        if error:
+            return error
+        if facets and self.fuzzy is not None:
+            return {"MESSAGE": "Facets are not available for fuzzy search"}
+        if top_k is not None:
+            if limit is not None:
+                return {"MESSAGE": "top_k cannot be combined with limit"}
+            if not self.valid_size(top_k):
+                return {"MESSAGE": f"Invalid top_k (1 to {MAX_PAGE_SIZE})"}
+        if limit is not None:
+            error = self.check_page(limit, cursor)
+            if error:
+                return error
+        elif self.text is not None and self.order_by is None and self.fuzzy is None:
+            self.order_by = RANK_ORDER
+
+        # Only the active filters (and the page) identify the query
+        active = {key: self.filter[key] for key in self.filter if self.filter_type[key]}
+        key = json.dumps([active, self.ranges, self.text, self.fuzzy, self.space, self.order_by, top_k, limit, cursor, bool(facets)], sort_keys=True)
+        search_cache = self.database_thread.search_cache
+        response = search_cache.get(key)
+        if response is not None:
+            return response
+        generation = search_cache.generation
+        if limit is None:
+            results = self.database_thread.search({
+                "filters": self.filter, "filter_on": self.filter_type,
+                "ranges": self.ranges, "order_by": self.order_by, "top_k": top_k, "text": self.text,
+                "fuzzy": self.fuzzy, "fits": self.space, "facets": facets,
+            })
+        else:
+            results = self.fetch_page(limit, cursor, facets)
+        response = RawJSON(json.dumps(results))
+        search_cache.put(key, generation, response)
+        return response
+
+    def fits(self, width, depth, rotate=False, query=None, limit=None, cursor=None, order_by=None, top_k=None, facets=False):
+        # SEARCH restricted to the fournitures fitting in a width x depth
+        # space, turned by a quarter if rotate is set
+        query = dict(query or {}, fits={"width": width, "depth": depth, "rotate": rotate})
+        return self.search(query, limit, cursor, order_by, top_k, facets)
+
+    def valid_size(self, size):
+        return isinstance(size, int) and not isinstance(size, bool) and 0 < size <= MAX_PAGE_SIZE
+
+    def check_page(self, limit, cursor):
+        if not self.valid_size(limit):
+            return {"MESSAGE": f"Invalid limit (1 to {MAX_PAGE_SIZE})"}
+        if self.order_by == RANK_ORDER:
+            return {"MESSAGE": "Rank order cannot be paginated"}
+        if self.fuzzy is not None:
+            return {"MESSAGE": "Fuzzy search cannot be paginated"}
+        if cursor is not None:
+            position = decode_cursor(cursor)
+            # A cursor only continues the order it was issued for
+            if position is None or position.get("order_by") != self.order_by:
+                return {"MESSAGE": "Invalid cursor"}
+        return None
+
+    def fetch_page(self, limit, cursor=None, facets=False):
+        # Uses the filters, ranges and order set by set_query
+        position = decode_cursor(cursor) if cursor else {}
+        page = self.database_thread.search({
+            "filters": self.filter, "filter_on": self.filter_type,
+            "ranges": self.ranges, "order_by": self.order_by, "text": self.text, "fits": self.space,
+            "limit": limit, "after_id": position.get("id"), "after_value": position.get("value"),
+            "facets": facets,
+        })
+        next_cursor = None
+        if page["more"]:
+            last = page["results"][-1]
+            column = parse_order(self.order_by or "id")[0]
+            next_cursor = encode_cursor({"id": last["id"], "value": last[column], "order_by": self.order_by})
+        response = {"results": page["results"], "next_cursor": next_cursor}
+        if facets:
+            response["facets"] = page["facets"]
+        return response
+
+    def stream(self, query, chunk_size=STREAM_CHUNK_SIZE, order_by=None):
+        # Yields the result set one page at a time. Every page is a separate
+        # keyset query, so the database thread is never held for the whole
+        # result and neither end keeps more than one chunk in memory.
+        error = self.set_query(query, order_by) or self.check_page(chunk_size, None)
+        if error:
+            yield dict(error, done=True)
+            return
+        state = (dict(self.filter), dict(self.filter_type), dict(self.ranges), self.order_by, self.text, self.space)
+        cursor = None
+        while True:
+            self.filter, self.filter_type, self.ranges, self.order_by, self.text, self.space = state
+            page = self.fetch_page(chunk_size, cursor)
+            cursor = page["next_cursor"]
+            yield {"results": page["results"], "done": cursor is None}
+            if cursor is None:
+                return
 
     def set_filter(self, filter_key, filter_value):
         self.filter[filter_key] = filter_value
@@ -24,6 +197,11 @@ class SearchEngine:
     def reset_filters(self):
         self.filter = {key: None for key in self.filter_type}
         self.filter_type = {key:False for key in self.filter_type}
-        
+        self.ranges = {}
+        self.order_by = None
+        self.text = None
+        self.fuzzy = None
+        self.space = None
+
     def get_filters(self):
-        return self.filter
\ No newline at end of file
+        return self.filter
@@ -1,151 +1,575 @@
+import asyncio
+import contextlib
 import socket
+import sys
 import threading
 import json
 import os
-from server.parser import Parser
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from server.parser import Parser, MessageDecoder, PROTOCOLS, CHUNK_SIZE, FRAME_HEADER, encode_frame
 from server.database_thread import DatabaseThread
 from server.authenticator import Authenticator
-from server.search_engine import SearchEngine
+from server.search_engine import SearchEngine, STREAM_CHUNK_SIZE
+from server.importer import IMPORT_FORMATS
+
+SERVER_MODES = ("threaded", "asyncio")
+
+# Images are streamed from the file to the socket with sendfile, one frame
+# of at most this size at a time on framed connections.
+IMAGE_FRAME_SIZE = 1024 * 1024
 
 class Server:
-    def __init__(self, host="127.0.0.1", port=10004,new_database=False,db_name="database.db"):
+    def __init__(self, host="127.0.0.1", port=10004,new_database=False,db_name="database.db",mode="threaded",backlog=128,executor_workers=None,readers=4,search_cache_size=1024,search_cache_bytes=32 * 1024 * 1024,search_backend="sql",batch_size=1,batch_delay=0.0):
+        if mode not in SERVER_MODES:
+            raise ValueError(f"Unknown server mode: {mode}")
         self.host = host
         self.port = port
+        self.mode = mode
+        self.backlog = backlog
+        self.executor_workers = executor_workers
         self.parser = Parser()
-        self.database_thread = DatabaseThread(new_database=new_database,db_name=db_name)
+        self.database_thread = DatabaseThread(
+            new_database=new_database,db_name=db_name,readers=readers,
+            search_cache_size=search_cache_size,search_cache_bytes=search_cache_bytes,
+            search_backend=search_backend,batch_size=batch_size,batch_delay=batch_delay,
+        )
         self.database_thread.start()
-        
-        self.image_to_send = (False, None)
-
-    def receive_image(self, client_socket, image_path, image_weight):
-        image_data = b""
-        while len(image_data) < image_weight:
-            image_data += client_socket.recv(4096)
-        with open(image_path, "wb") as f:
-            f.write(image_data)
+
+    def open_upload(self, image_path):
+        # Uploads are written to a temporary file next to the destination and
+        # renamed into place once the declared size has been received, so a
+        # partial upload never replaces an existing image.
+        directory = os.path.dirname(os.path.abspath(image_path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".upload-")
+        return os.fdopen(fd, "wb"), temp_path
+
+    def finish_upload(self, temp_path, image_path, received, image_weight):
+        if received != image_weight:
+            os.remove(temp_path)
+            return {"MESSAGE": "Image size mismatch"}
+        os.replace(temp_path, image_path)
         return {"MESSAGE": "Image received"}
+
+    def abort_upload(self, temp_path):
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+
+    def receive_into(self, client_socket, f, size, buffered=b""):
+        # Writes the next size bytes of the connection, starting with those
+        # already buffered, to f. Returns how many were received.
+        buffer = bytearray(CHUNK_SIZE)
+        view = memoryview(buffer)
+        received = len(buffered)
+        f.write(buffered)
+        while received < size:
+            count = client_socket.recv_into(buffer, min(CHUNK_SIZE, size - received))
+            if not count:
+                raise ConnectionError("Connection closed during upload")
+            f.write(view[:count])
+            received += count
+        return received
+
+    def receive_frames_into(self, frames, f, size):
+        # Same over frames: a frame is never split, so more than size bytes
+        # may be received
+        received = 0
+        while received < size:
+            frame = next(frames, None)
+            if frame is None:
+                raise ConnectionError("Connection closed during upload")
+            f.write(frame[1])
+            received += len(frame[1])
+        return received
+
+    def receive_image(self, client_socket, image_path, image_weight, buffered=b""):
+        f, temp_path = self.open_upload(image_path)
+        try:
+            with f:
+                received = self.receive_into(client_socket, f, image_weight, buffered)
+            return self.finish_upload(temp_path, image_path, received, image_weight)
+        except BaseException:
+            self.abort_upload(temp_path)
+            raise
+
+    def receive_image_frames(self, frames, image_path, image_weight):
+        f, temp_path = self.open_upload(image_path)
+        try:
+            with f:
+                received = self.receive_frames_into(frames, f, image_weight)
+            return self.finish_upload(temp_path, image_path, received, image_weight)
+        except BaseException:
+            self.abort_upload(temp_path)
+            raise
+
+    def check_import(self, data):
+        if data.get("format") not in IMPORT_FORMATS:
+            return {"MESSAGE": "Invalid format"}
+        size = data.get("size")
+        if not isinstance(size, int) or isinstance(size, bool) or size < 0:
+            return {"MESSAGE": "Invalid size"}
+        if not isinstance(data.get("create", False), bool):
+            return {"MESSAGE": "Invalid create"}
+        return None
+
+    def export_header(self, compress):
+        # First frame of an EXPORT: the chunks follow, then an empty frame
+        return {"MESSAGE": "Export started", "format": "jsonl", "gzip": compress}
+
+    def import_upload(self, f, received, size, format, create):
+        # The catalog is received whole into a temporary file first, so a
+        # truncated upload imports nothing
+        if received != size:
+            return {"MESSAGE": "Import size mismatch"}
+        f.seek(0)
+        return self.database_thread.import_catalog(f, format, create)
+
+    def check_upload(self, image_path, image_weight):
+        if not isinstance(image_path, str) or not image_path:
+            return {"MESSAGE": "Invalid image path"}
+        if not os.path.isdir(os.path.dirname(os.path.abspath(image_path))):
+            return {"MESSAGE": "Invalid image path"}
+        if not isinstance(image_weight, int) or isinstance(image_weight, bool) or image_weight < 0:
+            return {"MESSAGE": "Invalid image weight"}
+        return None
+
+    def send_image(self, client_socket, image_path):
+        try:
+            with open(os.path.abspath(image_path), "rb") as f:
+                client_socket.sendfile(f)
+        except FileNotFoundError:
+            response = json.dumps({"MESSAGE": "Image not found"})
+            client_socket.sendall(response.encode("utf-8"))
+
+    def send_image_frames(self, client_socket, request_id, image_path):
+        try:
+            f = open(os.path.abspath(image_path), "rb")
+        except FileNotFoundError:
+            response = json.dumps({"MESSAGE": "Image not found"})
+            client_socket.sendall(encode_frame(request_id, response))
+            return
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            for offset in range(0, size, IMAGE_FRAME_SIZE):
+                count = min(IMAGE_FRAME_SIZE, size - offset)
+                client_socket.sendall(FRAME_HEADER.pack(count, request_id))
+                # sendfile loops over partial sends until count bytes are out
+                if client_socket.sendfile(f, offset, count) != count:
+                    raise ConnectionError("Image truncated while sending")
+
+    def negotiate(self, data):
+        protocol = data.get("protocol", "legacy")
+        if protocol not in PROTOCOLS:
+            return {"MESSAGE": "Unsupported protocol", "protocol": "legacy"}
+        return {"MESSAGE": "Protocol switched", "protocol": protocol}
+
+    def handle_command(self, data, identity, search_engine):
+        # Returns the response and the transfer (if any) that must follow it
+        # on the connection: ("SEND_IMAGE", path), ("RECEIVE_IMAGE", path,
+        # weight), ("RECEIVE_IMPORT", size, format, create), ("STREAM",
+        # pages) or ("EXPORT", chunks, gzip). The caller owns the socket I/O.
+        action = None
+        if not data:
+            return {"MESSAGE": "Invalid request"}, action
+
+        command = data.get("command")
+
+        # Authentication
+        if command == "AUTHENTICATE":
+            username = data.get("username")
+            password = data.get("password")
+            identity.authenticate(username, password)
+            response = (
+                {"MESSAGE": "Authentication successful"}
+                if identity.is_authenticated
+                else {"MESSAGE": "Authentication failed"}
+            )
+
+        elif command == "DISCONNECT":
+            identity.is_authenticated = False
+            identity.is_admin = False
+            response = {"MESSAGE": "Disconnected"}
+
+        # Commands without authentication and admin
+        elif command == "GET" and data.get("table") != "users":
+            response = self.database_thread.request("GET", data)
+            if (data["table"] == "fournitures"):
+                if response.get("image_path") is not None:
+                    image_path = response["image_path"]
+                    #ensure image exists
+                    if os.path.exists(os.path.abspath(image_path)):
+                        action = ("SEND_IMAGE", image_path)
+                        response["image_weight"] = os.path.getsize(image_path)
+                    else:
+                        response["image_path"] = None
+                        response["image_weight"] = None
+                        response["MESSAGE"] = "Image not found"
+
+        elif command == "SEARCH":
+            if data.get("stream"):
+                # Pages are sent as frames of the request; a legacy
+                # connection cannot tell them apart and gets the message
+                response = {"MESSAGE": "Streaming requires the framed protocol"}
+                action = ("STREAM", search_engine.stream(
+                    data.get("query", ""), data.get("limit", STREAM_CHUNK_SIZE), data.get("order_by")
+                ))
+            else:
+                response = search_engine.search(
+                    data.get("query", ""), data.get("limit"), data.get("cursor"),
+                    data.get("order_by"), data.get("top_k"), data.get("facets", False),
+                )
+
+        elif command == "FITS":
+            response = search_engine.fits(
+                data.get("width"), data.get("depth"), data.get("rotate", False), data.get("query"),
+                data.get("limit"), data.get("cursor"), data.get("order_by"), data.get("top_k"),
+                data.get("facets", False),
+            )
+
+        elif command == "PLACE":
+            response = self.database_thread.place(data)
+
+        elif command == "FURNISH":
+            response = self.database_thread.furnish(data)
+
+        elif command == "SUGGEST":
+            response = self.database_thread.suggest(data)
+
+        # elif command == "SET_FILTER":
+        #     filter_key = data.get("filter_key")
+        #     filter_value = data.get("filter_value")
+        #     search_engine.set_filter(filter_key, filter_value)
+        #     response = {"MESSAGE": f"Filter set: {filter_key} = {filter_value}"}
+
+        # elif command == "RESET_FILTERS":
+        #     search_engine.reset_filters()
+        #     response = {"MESSAGE": "All filters reset"}
+
+        # elif command == "GET_FILTER":
+
+        #     response = {"MESSAGE": search_engine.get_filters()}
+
+        else:
+            # Commands with authentication and admin
+            if identity.is_authenticated and identity.is_admin:
+                if command == "SET":
+                    response  = self.database_thread.request("SET", data)
+
+                elif command in ("UPDATE", "UPSERT"):
+                    response = self.database_thread.request(command, data)
+
+                elif command == "DELETE":
+                    response = {
+                        "MESSAGE": self.database_thread.request("DELETE", data)
+                    }
+                elif command == "RECIEVE_IMAGE":
+                    response = self.check_upload(data.get("image_path"), data.get("image_weight"))
+                    if response is None:
+                        action = ("RECEIVE_IMAGE", data.get("image_path"), data.get("image_weight"))
+
+                elif command == "IMPORT":
+                    response = self.check_import(data)
+                    if response is None:
+                        action = ("RECEIVE_IMPORT", data["size"], data["format"], data.get("create", False))
+
+                elif command == "EXPORT":
+                    compress = data.get("gzip", False)
+                    if not isinstance(compress, bool):
+                        response = {"MESSAGE": "Invalid gzip"}
+                    else:
+                        # Chunks are sent as frames of the request, like
+                        # SEARCH pages; a legacy connection gets the message
+                        response = {"MESSAGE": "Streaming requires the framed protocol"}
+                        action = ("EXPORT", self.database_thread.export(compress), compress)
+
+                elif command == "GET":
+                    response = self.database_thread.request("GET", data)
+
+                elif command == "STATS":
+                    response = self.database_thread.stats()
+
+                else:
+                    response = {"MESSAGE": "Invalid command"}
+            else:
+                response = {
+                    "MESSAGE": "Authentication required or admin rights required or wrong command"
+                }
+
+        return response, action
+
     def handle_client(self, client_socket):
         identity = Authenticator(self.database_thread)
         search_engine = SearchEngine(self.database_thread)
+        decoder = MessageDecoder()
         try:
             while True:
-                request = client_socket.recv(1024).decode("utf-8")
-                if not request:
-                    break
+                request = decoder.next_message()
+                if request is None:
+                    chunk = client_socket.recv(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    decoder.feed(chunk)
+                    continue
 
                 data = self.parser.parse(request)
                 print(f"Received request: {data}")
-                if not data:
-                    response = {"MESSAGE": "Invalid request"}
-                else:
-                    command = data.get("command")
-
-                    # Authentication
-                    if command == "AUTHENTICATE":
-                        username = data.get("username")
-                        password = data.get("password")
-                        identity.authenticate(username, password)
-                        response = (
-                            {"MESSAGE": "Authentication successful"}
-                            if identity.is_authenticated
-                            else {"MESSAGE": "Authentication failed"}
-                        )
-
-                    elif command == "DISCONNECT":
-                        identity.is_authenticated = False
-                        identity.is_admin = False
-                        response = {"MESSAGE": "Disconnected"}
-
-                    # Commands without authentication and admin
-                    elif command == "GET" and data.get("table") != "users":
-                        self.database_thread.request_queue.put(("GET", data))
-                        response = self.database_thread.response_queue.get()
-                        if (data["table"] == "fournitures"):
-                            if response.get("image_path") is not None:
-                                        image_path = response["image_path"]
-                                        #ensure image exists
-                                        if os.path.exists(os.path.abspath(image_path)):
-                                            self.image_to_send = (True, image_path)
-                                            response["image_weight"] = os.path.getsize(image_path)
-                                        else:
-                                            response["image_path"] = None
-                                            response["image_weight"] = None
-                                            response["MESSAGE"] = "Image not found"
-
-                    elif command == "SEARCH":
-                        response = search_engine.search(data.get("query", ""))
-
-                    # elif command == "SET_FILTER":
-                    #     filter_key = data.get("filter_key")
-                    #     filter_value = data.get("filter_value")
-                    #     search_engine.set_filter(filter_key, filter_value)
-                    #     response = {"MESSAGE": f"Filter set: {filter_key} = {filter_value}"}
-
-                    # elif command == "RESET_FILTERS":
-                    #     search_engine.reset_filters()
-                    #     response = {"MESSAGE": "All filters reset"}
-                    
-                    # elif command == "GET_FILTER":
-                        
-                    #     response = {"MESSAGE": search_engine.get_filters()}
+                if data and data.get("command") == "HELLO":
+                    response = self.negotiate(data)
+                    client_socket.sendall(self.parser.dump(response).encode("utf-8"))
+                    if response["protocol"] == "framed":
+                        buffered = decoder.take(len(decoder.buffer))
+                        self.handle_framed_client(client_socket, identity, search_engine, buffered)
+                        break
+                    continue
 
-                    else:
-                        # Commands with authentication and admin
-                        if identity.is_authenticated and identity.is_admin:
-                            if command == "SET":
-                                self.database_thread.request_queue.put(("SET", data))
-                                response  = self.database_thread.response_queue.get()
-                                
-                                    
-                            elif command == "DELETE":
-                                self.database_thread.request_queue.put(("DELETE", data))
-                                response = {
-                                    "MESSAGE": self.database_thread.response_queue.get()
-                                }
-                            elif command == "RECIEVE_IMAGE":
-                                image_path = data.get("image_path")
-                                image_weight = data.get("image_weight")
-                                
-                                response = self.receive_image(
-                                    client_socket, image_path, image_weight
-                                )
-                            
-                            elif command == "GET":
-                                self.database_thread.request_queue.put(("GET", data))
-                                response = self.database_thread.response_queue.get()
-                                
-                                
-                                
-                            else:
-                                response = {"MESSAGE": "Invalid command"}
-                        else:
-                            response = {
-                                "MESSAGE": "Authentication required or admin rights required or wrong command"
-                            }
-
-                response = json.dumps(response)
-                client_socket.send(response.encode("utf-8"))
-                if self.image_to_send[0]:
-                    try : 
-                        image_path = os.path.abspath(self.image_to_send[1])
-
-                        with open(image_path, "rb") as f:
-                            image = f.read()
-                            client_socket.send(image)
-                    except FileNotFoundError:
-                        response = {"MESSAGE": "Image not found"}
-                        response = json.dumps(response)
-                        client_socket.send(response.encode("utf-8"))
-                    self.image_to_send = (False, None)
-                    
-                    
+                response, action = self.handle_command(data, identity, search_engine)
+                if action and action[0] == "RECEIVE_IMAGE":
+                    buffered = decoder.take(action[2])
+                    response = self.receive_image(client_socket, action[1], action[2], buffered)
+                    action = None
+                elif action and action[0] == "RECEIVE_IMPORT":
+                    with tempfile.TemporaryFile() as f:
+                        received = self.receive_into(client_socket, f, action[1], decoder.take(action[1]))
+                        response = self.import_upload(f, received, *action[1:])
+                    action = None
+                elif action and action[0] in ("STREAM", "EXPORT"):
+                    action = None
+
+                response = self.parser.dump(response)
+                client_socket.sendall(response.encode("utf-8"))
+                if action:
+                    self.send_image(client_socket, action[1])
+
+        # ValueError: a message or frame over MAX_FRAME_SIZE
+        except (ConnectionError, ValueError):
+            pass
         finally:
             client_socket.close()
 
+    def handle_framed_client(self, client_socket, identity, search_engine, buffered=b""):
+        # Requests may be pipelined: the client does not wait for a response
+        # before sending the next frame. Requests are served in order and
+        # each response frame carries the id of the request it answers.
+        frames = self.parser.iter_frames(client_socket.recv, buffered=buffered)
+        for request_id, payload in frames:
+            data = self.parser.parse(payload)
+            print(f"Received request {request_id}: {data}")
+            response, action = self.handle_command(data, identity, search_engine)
+            if action and action[0] == "RECEIVE_IMAGE":
+                response = self.receive_image_frames(frames, action[1], action[2])
+                action = None
+            elif action and action[0] == "RECEIVE_IMPORT":
+                with tempfile.TemporaryFile() as f:
+                    received = self.receive_frames_into(frames, f, action[1])
+                    response = self.import_upload(f, received, *action[1:])
+                action = None
+            elif action and action[0] == "STREAM":
+                for page in action[1]:
+                    client_socket.sendall(encode_frame(request_id, self.parser.dump(page)))
+                continue
+            elif action and action[0] == "EXPORT":
+                client_socket.sendall(encode_frame(request_id, self.parser.dump(self.export_header(action[2]))))
+                # closing() releases the export's read connection if the
+                # client goes away halfway
+                with contextlib.closing(action[1]) as chunks:
+                    for chunk in chunks:
+                        client_socket.sendall(encode_frame(request_id, chunk))
+                client_socket.sendall(encode_frame(request_id, b""))
+                continue
+
+            client_socket.sendall(encode_frame(request_id, self.parser.dump(response)))
+            if action:
+                self.send_image_frames(client_socket, request_id, action[1])
+
+    async def receive_into_async(self, reader, f, size, buffered=b""):
+        loop = asyncio.get_running_loop()
+        received = len(buffered)
+        f.write(buffered)
+        while received < size:
+            chunk = await reader.read(min(CHUNK_SIZE, size - received))
+            if not chunk:
+                raise ConnectionError("Connection closed during upload")
+            await loop.run_in_executor(self.executor, f.write, chunk)
+            received += len(chunk)
+        return received
+
+    async def receive_frames_into_async(self, frames, f, size):
+        loop = asyncio.get_running_loop()
+        received = 0
+        while received < size:
+            frame = await anext(frames, None)
+            if frame is None:
+                raise ConnectionError("Connection closed during upload")
+            await loop.run_in_executor(self.executor, f.write, frame[1])
+            received += len(frame[1])
+        return received
+
+    async def receive_image_async(self, reader, image_path, image_weight, buffered=b""):
+        f, temp_path = self.open_upload(image_path)
+        try:
+            with f:
+                received = await self.receive_into_async(reader, f, image_weight, buffered)
+            return self.finish_upload(temp_path, image_path, received, image_weight)
+        except BaseException:
+            self.abort_upload(temp_path)
+            raise
+
+    async def handle_client_async(self, reader, writer):
+        # Same command set as handle_client, but every connection is a
+        # coroutine on one event loop. Anything that blocks (database queue,
+        # file access) runs on the executor so the loop keeps serving others.
+        loop = asyncio.get_running_loop()
+        identity = Authenticator(self.database_thread)
+        search_engine = SearchEngine(self.database_thread)
+        decoder = MessageDecoder()
+        try:
+            while True:
+                request = decoder.next_message()
+                if request is None:
+                    chunk = await reader.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    decoder.feed(chunk)
+                    continue
+
+                data = self.parser.parse(request)
+                print(f"Received request: {data}")
+                if data and data.get("command") == "HELLO":
+                    response = self.negotiate(data)
+                    writer.write(self.parser.dump(response).encode("utf-8"))
+                    await writer.drain()
+                    if response["protocol"] == "framed":
+                        buffered = decoder.take(len(decoder.buffer))
+                        await self.handle_framed_client_async(reader, writer, identity, search_engine, buffered)
+                        break
+                    continue
+
+                response, action = await loop.run_in_executor(
+                    self.executor, self.handle_command, data, identity, search_engine
+                )
+                if action and action[0] == "RECEIVE_IMAGE":
+                    buffered = decoder.take(action[2])
+                    response = await self.receive_image_async(reader, action[1], action[2], buffered)
+                    action = None
+                elif action and action[0] == "RECEIVE_IMPORT":
+                    with tempfile.TemporaryFile() as f:
+                        received = await self.receive_into_async(reader, f, action[1], decoder.take(action[1]))
+                        response = await loop.run_in_executor(self.executor, self.import_upload, f, received, *action[1:])
+                    action = None
+                elif action and action[0] in ("STREAM", "EXPORT"):
+                    action = None
+
+                writer.write(self.parser.dump(response).encode("utf-8"))
+                if action:
+                    await self.send_image_async(writer, action[1])
+                await writer.drain()
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def receive_image_frames_async(self, frames, image_path, image_weight):
+        f, temp_path = self.open_upload(image_path)
+        try:
+            with f:
+                received = await self.receive_frames_into_async(frames, f, image_weight)
+            return self.finish_upload(temp_path, image_path, received, image_weight)
+        except BaseException:
+            self.abort_upload(temp_path)
+            raise
+
+    async def send_image_async(self, writer, image_path):
+        loop = asyncio.get_running_loop()
+        try:
+            with open(os.path.abspath(image_path), "rb") as f:
+                await loop.sendfile(writer.transport, f)
+        except FileNotFoundError:
+            writer.write(json.dumps({"MESSAGE": "Image not found"}).encode("utf-8"))
+
+    async def send_image_frames_async(self, writer, request_id, image_path):
+        loop = asyncio.get_running_loop()
+        try:
+            f = open(os.path.abspath(image_path), "rb")
+        except FileNotFoundError:
+            response = json.dumps({"MESSAGE": "Image not found"})
+            writer.write(encode_frame(request_id, response))
+            return
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            for offset in range(0, size, IMAGE_FRAME_SIZE):
+                count = min(IMAGE_FRAME_SIZE, size - offset)
+                writer.write(FRAME_HEADER.pack(count, request_id))
+                if await loop.sendfile(writer.transport, f, offset, count) != count:
+                    raise ConnectionError("Image truncated while sending")
+
+    async def send_stream_async(self, writer, request_id, payloads):
+        # Each payload is a database round trip, fetched on the executor
+        loop = asyncio.get_running_loop()
+        with contextlib.closing(payloads):
+            while True:
+                payload = await loop.run_in_executor(self.executor, next, payloads, None)
+                if payload is None:
+                    return
+                writer.write(encode_frame(request_id, payload))
+                await writer.drain()
+
+    async def handle_framed_client_async(self, reader, writer, identity, search_engine, buffered=b""):
+        loop = asyncio.get_running_loop()
+        frames = self.parser.aiter_frames(reader, buffered=buffered)
+        async for request_id, payload in frames:
+            data = self.parser.parse(payload)
+            print(f"Received request {request_id}: {data}")
+            response, action = await loop.run_in_executor(
+                self.executor, self.handle_command, data, identity, search_engine
+            )
+            if action and action[0] == "RECEIVE_IMAGE":
+                response = await self.receive_image_frames_async(frames, action[1], action[2])
+                action = None
+            elif action and action[0] == "RECEIVE_IMPORT":
+                with tempfile.TemporaryFile() as f:
+                    received = await self.receive_frames_into_async(frames, f, action[1])
+                    response = await loop.run_in_executor(self.executor, self.import_upload, f, received, *action[1:])
+                action = None
+            elif action and action[0] == "STREAM":
+                await self.send_stream_async(writer, request_id, (self.parser.dump(page) for page in action[1]))
+                continue
+            elif action and action[0] == "EXPORT":
+                writer.write(encode_frame(request_id, self.parser.dump(self.export_header(action[2]))))
+                await self.send_stream_async(writer, request_id, action[1])
+                writer.write(encode_frame(request_id, b""))
+                await writer.drain()
+                continue
+
+            writer.write(encode_frame(request_id, self.parser.dump(response)))
+            if action:
+                await self.send_image_frames_async(writer, request_id, action[1])
+            await writer.drain()
+
+    async def serve_async(self):
+        self.executor = ThreadPoolExecutor(max_workers=self.executor_workers)
+        server = await asyncio.start_server(
+            self.handle_client_async, self.host, self.port, backlog=self.backlog
+        )
+        print(f"[*] Listening on {self.host}:{self.port} (asyncio)")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.executor.shutdown(wait=False)
+
     def start(self):
+        if self.mode == "asyncio":
+            try:
+                asyncio.run(self.serve_async())
+            finally:
+                self.database_thread.stop()
+            return
+
         server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         server.bind((self.host, self.port))
-        server.listen(5)
+        server.listen(self.backlog)
         print(f"[*] Listening on {self.host}:{self.port}")
 
         try:
@@ -162,5 +586,5 @@ class Server:
 
 
 if __name__ == "__main__":
-    server = Server()
-    server.start()
\ No newline at end of file
+    server = Server(mode=sys.argv[1] if len(sys.argv) > 1 else "threaded")
+    server.start()
@@ -0,0 +1,121 @@
+import bisect
+import heapq
+import threading
+
+from .trigram_index import normalize
+
+# Tables SUGGEST completes names from
+SUGGEST_TABLES = ("fournitures", "rooms", "types", "colors")
+
+
+class PrefixIndex:
+    # Name completion for one table. The names are kept as a sorted list of
+    # (normalized, name) keys: all the completions of a prefix are a
+    # contiguous run found with one bisect, which is what walking a trie
+    # gives, for a fraction of the memory of one dict per trie node. Names
+    # shared by several rows are counted and listed once.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.keys = []
+        self.counts = {}
+
+    def load(self, names):
+        counts = {}
+        for name in names:
+            key = (normalize(name), name)
+            counts[key] = counts.get(key, 0) + 1
+        with self.lock:
+            self.counts = counts
+            self.keys = sorted(counts)
+
+    def add(self, name):
+        key = (normalize(name), name)
+        with self.lock:
+            if key in self.counts:
+                self.counts[key] += 1
+            else:
+                self.counts[key] = 1
+                bisect.insort(self.keys, key)
+
+    def add_many(self, names):
+        # One sort of the new keys merged into the old: sort() finds the two
+        # sorted runs and merges them in linear time
+        new = []
+        with self.lock:
+            for name in names:
+                key = (normalize(name), name)
+                if key in self.counts:
+                    self.counts[key] += 1
+                else:
+                    self.counts[key] = 1
+                    new.append(key)
+            if new:
+                new.sort()
+                self.keys += new
+                self.keys.sort()
+
+    def remove(self, name):
+        key = (normalize(name), name)
+        with self.lock:
+            count = self.counts.get(key)
+            if count is None:
+                return False
+            if count > 1:
+                self.counts[key] = count - 1
+            else:
+                del self.counts[key]
+                del self.keys[bisect.bisect_left(self.keys, key)]
+        return True
+
+    def complete(self, prefix, limit=10):
+        # Returns up to limit (normalized, name) keys, in alphabetical order
+        prefix = normalize(prefix)
+        completions = []
+        with self.lock:
+            i = bisect.bisect_left(self.keys, (prefix,))
+            while i < len(self.keys) and len(completions) < limit:
+                key = self.keys[i]
+                if not key[0].startswith(prefix):
+                    break
+                completions.append(key)
+                i += 1
+        return completions
+
+    def __len__(self):
+        return len(self.keys)
+
+
+class Suggestions:
+    # One PrefixIndex per table: a suggestion never touches the database.
+    # Insertions bisect into a sorted list, so bulk loads go through
+    # add_many, which merges once.
+    def __init__(self):
+        self.indexes = {table: PrefixIndex() for table in SUGGEST_TABLES}
+
+    def load(self, database, dimension_cache):
+        self.indexes["fournitures"].load(name for id, name in database.iter_fourniture_names())
+        for table in SUGGEST_TABLES[1:]:
+            self.indexes[table].load(name for id, name in dimension_cache.items(table))
+
+    def add(self, table, name):
+        self.indexes[table].add(name)
+
+    def add_many(self, table, names):
+        self.indexes[table].add_many(names)
+
+    def remove(self, table, name):
+        return self.indexes[table].remove(name)
+
+    def suggest(self, prefix, tables=SUGGEST_TABLES, limit=10):
+        # Alphabetical across the tables
+        runs = (
+            [(key, table) for key in self.indexes[table].complete(prefix, limit)]
+            for table in tables
+        )
+        return [
+            {"name": key[1], "table": table}
+            for key, table in heapq.merge(*runs)
+        ][:limit]
+
+    def stats(self):
+        return {table: len(index) for table, index in self.indexes.items()}
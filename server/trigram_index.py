@@ -0,0 +1,141 @@
+import bisect
+import heapq
+import re
+import threading
+import unicodedata
+from array import array
+from collections import Counter
+
+
+def normalize(text):
+    # Lowercase without accents: "Canapé" and "canape" share their trigrams
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def trigrams(text):
+    # Every word is padded like in pg_trgm ("  sofa ") so that short words
+    # still have trigrams and word starts weigh more than word ends.
+    grams = set()
+    for word in re.findall(r"\w+", normalize(text)):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class TrigramIndex:
+    # In-memory trigram index over the furniture names for typo-tolerant
+    # search. Only ids are stored: one sorted array("I") of ids per trigram
+    # and the trigram count of every name, indexed by id, in an array("B").
+    # That is about 4 bytes per (name, trigram) pair plus 1 byte per id, and
+    # at most max_names names are indexed; past that the index is marked
+    # incomplete rather than growing. Names are not kept, so removing an
+    # entry takes the name it was added with.
+    def __init__(self, max_names=2_000_000):
+        self.lock = threading.Lock()
+        self.max_names = max_names
+        self.postings = {}
+        self.sizes = array("B")
+        self.count = 0
+        self.complete = True
+
+    @staticmethod
+    def _set_size(sizes, id, size):
+        if id >= len(sizes):
+            sizes.frombytes(bytes(id + 1 - len(sizes)))
+        # Similarity only needs an approximate size for very long names
+        sizes[id] = min(size, 255)
+
+    def load(self, database):
+        # Rows come in id order, so appending keeps every posting sorted
+        postings = {}
+        sizes = array("B")
+        count = 0
+        complete = True
+        for id, name in database.iter_fourniture_names():
+            if count >= self.max_names:
+                complete = False
+                break
+            grams = trigrams(name)
+            for gram in grams:
+                posting = postings.get(gram)
+                if posting is None:
+                    posting = postings[gram] = array("I")
+                posting.append(id)
+            self._set_size(sizes, id, max(len(grams), 1))
+            count += 1
+        with self.lock:
+            self.postings = postings
+            self.sizes = sizes
+            self.count = count
+            self.complete = complete
+
+    def add(self, id, name):
+        grams = trigrams(name)
+        with self.lock:
+            if self.count >= self.max_names:
+                self.complete = False
+                return False
+            for gram in grams:
+                posting = self.postings.get(gram)
+                if posting is None:
+                    posting = self.postings[gram] = array("I")
+                i = bisect.bisect_left(posting, id)
+                if i == len(posting) or posting[i] != id:
+                    posting.insert(i, id)
+            self._set_size(self.sizes, id, max(len(grams), 1))
+            self.count += 1
+        return True
+
+    def remove(self, id, name):
+        # The name is needed to find the postings: the index does not keep it
+        grams = trigrams(name)
+        with self.lock:
+            if id >= len(self.sizes) or not self.sizes[id]:
+                return False
+            for gram in grams:
+                posting = self.postings.get(gram)
+                if posting is None:
+                    continue
+                i = bisect.bisect_left(posting, id)
+                if i < len(posting) and posting[i] == id:
+                    del posting[i]
+                    if not posting:
+                        del self.postings[gram]
+            self.sizes[id] = 0
+            self.count -= 1
+        return True
+
+    def search(self, text, limit=20, min_similarity=0.3):
+        # Returns up to limit (id, similarity) pairs, best first. Similarity
+        # is the share of the query trigrams found in the name, so a name
+        # that contains the (misspelled) query scores high however long it
+        # is. Equal scores are ordered by the Jaccard index of the two sets,
+        # which favors the names closest in length.
+        grams = trigrams(text)
+        if not grams:
+            return []
+        counts = Counter()
+        with self.lock:
+            for gram in grams:
+                posting = self.postings.get(gram)
+                if posting is not None:
+                    counts.update(posting)
+            sizes = self.sizes
+            needed = min_similarity * len(grams)
+            scored = [
+                (shared, shared / (len(grams) + sizes[id] - shared), -id)
+                for id, shared in counts.items()
+                if shared >= needed
+            ]
+        return [(-id, shared / len(grams)) for shared, jaccard, id in heapq.nlargest(limit, scored)]
+
+    def stats(self):
+        with self.lock:
+            entries = sum(len(posting) for posting in self.postings.values())
+            return {
+                "names": self.count,
+                "trigrams": len(self.postings),
+                "complete": self.complete,
+                "bytes": entries * 4 + len(self.sizes),
+            }
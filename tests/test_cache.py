@@ -0,0 +1,60 @@
+import pytest
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from server.cache import FacetCounts, SearchCache
+
+def test_search_cache_hit_and_miss():
+    cache = SearchCache()
+    assert cache.get("k") is None
+    cache.put("k", cache.generation, "[]")
+    assert cache.get("k") == "[]"
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_search_cache_invalidate():
+    cache = SearchCache()
+    cache.put("k", cache.generation, "[]")
+    cache.invalidate()
+    assert cache.get("k") is None
+    assert cache.bytes == 0
+
+def test_search_cache_rejects_stale_generation():
+    cache = SearchCache()
+    generation = cache.generation
+    cache.invalidate()
+    cache.put("k", generation, "[]")
+    assert cache.get("k") is None
+
+def test_search_cache_lru_eviction():
+    cache = SearchCache(max_entries=2)
+    cache.put("a", 0, "1")
+    cache.put("b", 0, "2")
+    cache.get("a")
+    cache.put("c", 0, "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+
+def test_search_cache_memory_limit():
+    cache = SearchCache(max_bytes=10)
+    cache.put("a", 0, "x" * 6)
+    cache.put("b", 0, "y" * 6)
+    assert cache.get("a") is None
+    assert cache.get("b") == "y" * 6
+    cache.put("c", 0, "z" * 11)
+    assert cache.get("c") is None
+    assert cache.bytes == 6
+
+def test_facet_counts_add_and_remove():
+    counts = FacetCounts()
+    counts.add(1, 2, 3)
+    counts.add(1, 4, 3)
+    counts.remove(1, 2, 3)
+    assert counts.snapshot() == {"room": {1: 1}, "type": {4: 1}, "color": {3: 1}}
+
+def test_facet_counts_from_rows():
+    counts = FacetCounts.count_rows([(1, 1, 1, 2), (2, 1, 3, 5)])
+    assert counts["room"] == {1: 2, 2: 5}
+    assert counts["type"] == {1: 7}
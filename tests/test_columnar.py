@@ -0,0 +1,122 @@
+import pytest
+import random
+import json
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from server import columnar
+from server.cache import DimensionCache
+from server.columnar import ColumnarSnapshot
+from server.database_thread import DatabaseThread
+from server.search_engine import SearchEngine
+
+BACKENDS = [False, pytest.param(True, marks=pytest.mark.skipif(columnar.numpy is None, reason="numpy not installed"))]
+
+QUERIES = [
+    ({}, {}),
+    ({"room": "Salon"}, {}),
+    ({"room": "Salon", "type": "chaise"}, {}),
+    ({"color": "Vert", "max_price": 50}, {}),
+    ({"min_x_dimension": 30, "max_x_dimension": 60, "min_y_dimension": 45}, {}),
+    ({"room": "Cave"}, {}),
+    ({"type": "chaise"}, {"order_by": "-price"}),
+    ({"min_price": 20}, {"order_by": "y_dimension", "top_k": 7}),
+    ({"room": "Chambre"}, {"order_by": "price", "limit": 4}),
+    ({}, {"order_by": "-x_dimension", "limit": 5}),
+]
+
+@pytest.fixture
+def database_thread():
+    database_thread = DatabaseThread(db_name=":memory:")
+    database_thread.start()
+    for table, names in (("rooms", ("Salon", "Chambre")), ("types", ("chaise", "lit")), ("colors", ("Rouge", "Vert"))):
+        for name in names:
+            database_thread.request("SET", {"table": table, "name": name})
+    rng = random.Random(0)
+    for i in range(200):
+        database_thread.request("SET", {
+            "table": "fournitures", "name": f"Meuble{i}", "room": rng.choice(("Salon", "Chambre")),
+            "type": rng.choice(("chaise", "lit")), "color": rng.choice(("Rouge", "Vert")),
+            "x_dimension": rng.randint(10, 100), "y_dimension": rng.randint(10, 100), "image_path": "None",
+            "price": rng.choice((None, rng.randint(1, 100))),
+        })
+    for id in range(1, 200, 7):
+        database_thread.request("DELETE", {"table": "fournitures", "id": id})
+    yield database_thread
+    database_thread.stop()
+
+def sql_results(database_thread, query, options):
+    search_engine = SearchEngine(database_thread)
+    search_engine.set_query(query, options.get("order_by"))
+    data = {"filters": search_engine.filter, "filter_on": search_engine.filter_type, "ranges": search_engine.ranges,
+            "order_by": search_engine.order_by, "top_k": options.get("top_k"), "limit": options.get("limit")}
+    return data, database_thread.request("SEARCH", data)
+
+@pytest.mark.parametrize("use_numpy", BACKENDS)
+@pytest.mark.parametrize("query, options", QUERIES)
+def test_snapshot_matches_sql(database_thread, use_numpy, query, options):
+    snapshot = ColumnarSnapshot(use_numpy)
+    snapshot.load(database_thread.database)
+    data, expected = sql_results(database_thread, query, options)
+    assert snapshot.supports(data)
+    results = snapshot.search(data, database_thread.dimension_cache)
+    if "order_by" not in options:
+        # SQL returns unordered results in whatever order its index gives
+        expected = sorted(expected, key=lambda fourniture: fourniture["id"])
+    assert results == expected
+
+@pytest.mark.parametrize("use_numpy", BACKENDS)
+def test_snapshot_pages_match_sql(database_thread, use_numpy):
+    snapshot = ColumnarSnapshot(use_numpy)
+    snapshot.load(database_thread.database)
+    data, expected = sql_results(database_thread, {"type": "lit"}, {"order_by": "-price", "limit": 3})
+    last = expected["results"][-1]
+    data.update(after_id=last["id"], after_value=last["price"])
+    assert snapshot.search(data, database_thread.dimension_cache) == database_thread.request("SEARCH", data)
+
+def test_snapshot_follows_writes_and_compacts():
+    snapshot = ColumnarSnapshot(False)
+    for id in range(1, 3001):
+        snapshot.add(id, f"Meuble{id}", 1, 1, 1, 10, 10, "None", id)
+    for id in range(1, 2001):
+        snapshot.remove(id)
+    # compacted once the tombstones outnumbered the live rows
+    assert len(snapshot.ids) == 1499
+    assert snapshot.stats() == {"rows": 1000, "tombstones": 499, "usable": True, "numpy": False}
+    assert [fourniture["id"] for fourniture in snapshot.search(
+        {"filters": {}, "filter_on": {}, "ranges": {"price": (None, 2002)}}, DimensionCache())] == [2001, 2002]
+    assert not snapshot.remove(1)
+
+def test_snapshot_unsupported_filters(database_thread):
+    snapshot = ColumnarSnapshot(False)
+    filter_on = {"type": False, "room": False, "color": False, "name": True}
+    assert not snapshot.supports({"filters": {}, "filter_on": filter_on})
+    filter_on["name"] = False
+    assert not snapshot.supports({"filters": {}, "filter_on": filter_on, "text": "chaise"})
+    assert not snapshot.supports({"filters": {}, "filter_on": filter_on, "order_by": "name"})
+    assert snapshot.supports({"filters": {}, "filter_on": filter_on, "order_by": "-price"})
+    assert snapshot.prefers({"filters": {}, "filter_on": filter_on, "order_by": "-price"})
+    assert not snapshot.prefers({"filters": {}, "filter_on": filter_on, "order_by": "-price", "top_k": 5})
+    assert snapshot.prefers({"filters": {}, "filter_on": filter_on, "ranges": {"price": (1, 2)}}) == snapshot.use_numpy
+
+def test_columnar_backend(tmp_path):
+    database_thread = DatabaseThread(db_name=str(tmp_path / "columnar.db"), search_backend="columnar")
+    database_thread.start()
+    try:
+        for table, name in (("rooms", "Salon"), ("types", "chaise"), ("colors", "Rouge")):
+            database_thread.request("SET", {"table": table, "name": name})
+        database_thread.request("SET", {"table": "fournitures", "name": "Chaise1", "room": "Salon", "type": "chaise", "color": "Rouge",
+                                        "x_dimension": 40, "y_dimension": 40, "image_path": "None", "price": 30})
+        search_engine = SearchEngine(database_thread)
+        assert search_engine.search({"room": "Salon"}) == '[{"id": 1, "name": "Chaise1", "room": "Salon", "type": "chaise", "color": "Rouge", "x_dimension": 40, "y_dimension": 40, "image_path": "None", "price": 30}]'
+        assert database_thread.stats()["snapshot"]["rows"] == 1
+        database_thread.request("UPDATE", {"table": "fournitures", "id": 1, "fields": {"price": 35}})
+        assert json.loads(search_engine.search({"room": "Salon"}))[0]["price"] == 35
+        database_thread.request("DELETE", {"table": "fournitures", "id": 1})
+        assert search_engine.search({"room": "Salon"}) == "[]"
+    finally:
+        database_thread.stop()
+    with pytest.raises(ValueError):
+        DatabaseThread(db_name=":memory:", search_backend="numpy")
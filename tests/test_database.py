@@ -6,7 +6,9 @@ import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from server.database import Database
+from server import database as database_module
+from server.database import Database, FOURNITURE_DETAILS
+from server.migrations import MIGRATIONS, SCHEMA_VERSION, get_schema_version, migrate
 
 @pytest.fixture
 def db():
@@ -212,4 +214,315 @@ def test_search(db):
     filter_type = {"type": True, "room": True, "color": True,"name":True}
     results = db.search(filter_value, filter_type)
     assert len(results) == 1
-    assert results[0][1] == "Chair1"
\ No newline at end of file
+    assert results[0][1] == "Chair1"
+
+def test_get_fourniture_details(db):
+    db.add_room("Living Room")
+    db.add_type("Chair")
+    db.add_color("Red")
+    db.set_fourniture("Chair1", 1, 1, 1, 100, 200, "path/to/image",100)
+    fourniture = db.get_fourniture_details(1)
+    assert fourniture == (1, "Chair1", "Living Room", "Chair", "Red", 100, 200, "path/to/image", 100)
+    assert db.get_fourniture_details(2) is None
+
+def test_search_details(db):
+    db.add_room("Living Room")
+    db.add_room("Kitchen")
+    db.add_type("Chair")
+    db.add_color("Red")
+    db.set_fourniture("Chair1", 1, 1, 1, 100, 200, "path/to/image",100)
+    db.set_fourniture("Chair2", 2, 1, 1, 100, 200, "path/to/image",120)
+    filter_value = {"type": "Chair", "room": "Kitchen", "color": None,"name":None}
+    filter_type = {"type": True, "room": True, "color": False,"name":False}
+    results = db.search_details(filter_value, filter_type)
+    assert results == [(2, "Chair2", "Kitchen", "Chair", "Red", 100, 200, "path/to/image", 120)]
+    filter_value = {"type": None, "room": None, "color": None,"name":"Chair%"}
+    filter_type = {"type": False, "room": False, "color": False,"name":True}
+    assert [result[1] for result in db.search_details(filter_value, filter_type)] == ["Chair1", "Chair2"]
+
+def test_search_details_keyset(db):
+    db.add_room("Living Room")
+    db.add_type("Chair")
+    db.add_color("Red")
+    for i in range(5):
+        db.set_fourniture(f"Chair{i}", 1, 1, 1, 100, 200, "path/to/image", 100)
+    filter_value = {"type": None, "room": "Living Room", "color": None,"name":None}
+    filter_type = {"type": False, "room": True, "color": False,"name":False}
+    page = db.search_details(filter_value, filter_type, limit=2)
+    assert [result[0] for result in page] == [1, 2]
+    page = db.search_details(filter_value, filter_type, limit=2, after_id=2)
+    assert [result[0] for result in page] == [3, 4]
+    assert db.search_details(filter_value, filter_type, limit=2, after_id=5) == []
+
+def query_plan(db, request, values):
+    db.cursor.execute("EXPLAIN QUERY PLAN " + request, values)
+    return " ".join(row[3] for row in db.cursor.fetchall())
+
+def test_schema_version(db):
+    assert get_schema_version(db.conn) == SCHEMA_VERSION
+
+def test_migrate_is_idempotent(db):
+    assert migrate(db.conn) == SCHEMA_VERSION
+    assert get_schema_version(db.conn) == SCHEMA_VERSION
+
+def test_migrate_existing_database(tmp_path):
+    db_name = str(tmp_path / "old.db")
+    conn = sqlite3.connect(db_name)
+    conn.execute("CREATE TABLE fournitures (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, room INTEGER NOT NULL, type INTEGER NOT NULL, color INTEGER NOT NULL, image_path TEXT, x_dimension INTEGER NOT NULL, y_dimension INTEGER NOT NULL, price INTEGER)")
+    conn.execute("INSERT INTO fournitures (name, room, type, color, x_dimension, y_dimension, price) VALUES ('Chair1', 1, 1, 1, 10, 10, 5)")
+    conn.commit()
+    conn.close()
+    db = Database(db_name)
+    assert get_schema_version(db.conn) == SCHEMA_VERSION
+    assert db.get_fourniture_by_name("Chair1")[1] == "Chair1"
+    db.close()
+
+def test_failed_migration_rolls_back(db):
+    def broken(cursor):
+        cursor.execute("CREATE INDEX idx_broken ON fournitures(price)")
+        cursor.execute("SELECT * FROM missing_table")
+    with pytest.raises(sqlite3.OperationalError):
+        migrate(db.conn, MIGRATIONS + [broken])
+    assert get_schema_version(db.conn) == SCHEMA_VERSION
+    db.cursor.execute("SELECT name FROM sqlite_master WHERE name='idx_broken'")
+    assert db.cursor.fetchone() is None
+
+def test_search_by_room_uses_index(db):
+    request = FOURNITURE_DETAILS + " WHERE rooms.name = ?"
+    plan = query_plan(db, request, ("Kitchen",))
+    assert "idx_fournitures_room" in plan
+    assert "SCAN fournitures" not in plan
+
+def test_search_by_type_and_color_uses_index(db):
+    request = FOURNITURE_DETAILS + " WHERE types.name = ? AND colors.name = ?"
+    plan = query_plan(db, request, ("Chair", "Red"))
+    assert "SCAN fournitures" not in plan
+
+def test_search_by_name_uses_index(db):
+    plan = query_plan(db, FOURNITURE_DETAILS + " WHERE fournitures.name LIKE ?", ("Chair%",))
+    assert "idx_fournitures_name_nocase" in plan
+    plan = query_plan(db, "SELECT * FROM fournitures WHERE name=?", ("Chair1",))
+    assert "idx_fournitures_name" in plan
+    assert "SCAN" not in plan
+
+def test_search_by_price_uses_index(db):
+    plan = query_plan(db, "SELECT * FROM fournitures WHERE price < ?", (100,))
+    assert "idx_fournitures_price" in plan
+
+def test_search_details_ranges_and_order(db):
+    db.add_room("Living Room")
+    db.add_type("Sofa")
+    db.add_color("Red")
+    for name, x_dimension, price in (("Sofa1", 180, 900), ("Sofa2", 210, 500), ("Sofa3", 190, 700), ("Sofa4", 160, 300)):
+        db.set_fourniture(name, 1, 1, 1, x_dimension, 90, "None", price)
+    db.set_fourniture("Sofa5", 1, 1, 1, 150, 90, "None", None)
+    filter_value = {"type": "Sofa", "room": None, "color": None,"name":None}
+    filter_type = {"type": True, "room": False, "color": False,"name":False}
+    ranges = {"price": (None, 800), "x_dimension": (None, 200)}
+    results = db.search_details(filter_value, filter_type, ranges=ranges, order_by="price")
+    assert [result[1] for result in results] == ["Sofa4", "Sofa3"]
+    results = db.search_details(filter_value, filter_type, ranges={"price": (400, None)}, order_by="-price")
+    assert [result[1] for result in results] == ["Sofa1", "Sofa3", "Sofa2"]
+    page = db.search_details(filter_value, filter_type, limit=2, after_id=3, after_value=700, order_by="-price")
+    assert [result[1] for result in page] == ["Sofa2", "Sofa4"]
+    with pytest.raises(ValueError):
+        db.search_details(filter_value, filter_type, order_by="image_path")
+    with pytest.raises(ValueError):
+        db.search_details(filter_value, filter_type, ranges={"id": (1, 2)})
+
+def test_search_by_type_and_price_range_uses_index(db):
+    request = FOURNITURE_DETAILS + " WHERE types.name = ? AND fournitures.price <= ? ORDER BY fournitures.price, fournitures.id LIMIT ?"
+    plan = query_plan(db, request, ("Sofa", 800, 10))
+    assert "idx_fournitures_type_price" in plan
+    assert "TEMP B-TREE" not in plan
+
+def test_search_by_dimension_uses_index(db):
+    request = FOURNITURE_DETAILS + " WHERE fournitures.x_dimension <= ? ORDER BY fournitures.x_dimension DESC, fournitures.id DESC"
+    plan = query_plan(db, request, (200,))
+    assert "idx_fournitures_x_dimension" in plan
+    assert "TEMP B-TREE" not in plan
+
+def test_search_details_text(db):
+    db.add_room("Living Room")
+    db.add_type("Sofa")
+    db.add_color("Red")
+    for name in ("Blue Sofa", "Canapé sofa sofa", "Chair"):
+        db.set_fourniture(name, 1, 1, 1, 100, 200, "None", 100)
+    filter_value = {"type": None, "room": None, "color": None,"name":None}
+    filter_type = {"type": False, "room": False, "color": False,"name":False}
+    assert [result[1] for result in db.search_details(filter_value, filter_type, text="sof")] == ["Blue Sofa", "Canapé sofa sofa"]
+    assert [result[1] for result in db.search_details(filter_value, filter_type, text="SOF", order_by="rank")] == ["Canapé sofa sofa", "Blue Sofa"]
+    assert [result[1] for result in db.search_details(filter_value, filter_type, text="canape")] == ["Canapé sofa sofa"]
+    assert db.search_details(filter_value, filter_type, text='blue" OR chair') == []
+    with pytest.raises(ValueError):
+        db.search_details(filter_value, filter_type, text="**")
+    with pytest.raises(ValueError):
+        db.search_details(filter_value, filter_type, order_by="rank")
+
+def test_name_index_follows_writes(db):
+    db.add_room("Living Room")
+    db.add_type("Sofa")
+    db.add_color("Red")
+    db.set_fourniture("Blue Sofa", 1, 1, 1, 100, 200, "None", 100)
+    db.set_fourniture("Red Chair", 1, 1, 1, 100, 200, "None", 100)
+    filter_value = {"type": None, "room": None, "color": None,"name":None}
+    filter_type = {"type": False, "room": False, "color": False,"name":False}
+    db.delete_fourniture(1)
+    assert db.search_details(filter_value, filter_type, text="blue") == []
+    db.cursor.execute("UPDATE fournitures SET name = 'Green Chair' WHERE id = 2")
+    assert db.search_details(filter_value, filter_type, text="red") == []
+    assert [result[0] for result in db.search_details(filter_value, filter_type, text="green")] == [2]
+    db.cursor.execute("INSERT INTO fournitures_fts(fournitures_fts) VALUES ('integrity-check')")
+
+def test_name_index_built_for_existing_rows(tmp_path):
+    db_name = str(tmp_path / "old.db")
+    conn = sqlite3.connect(db_name)
+    conn.execute("CREATE TABLE fournitures (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, room INTEGER NOT NULL, type INTEGER NOT NULL, color INTEGER NOT NULL, image_path TEXT, x_dimension INTEGER NOT NULL, y_dimension INTEGER NOT NULL, price INTEGER)")
+    conn.execute("INSERT INTO fournitures (name, room, type, color, x_dimension, y_dimension, price) VALUES ('Old Chair', 1, 1, 1, 10, 10, 5)")
+    conn.commit()
+    conn.close()
+    db = Database(db_name)
+    filter_value = {"type": None, "room": None, "color": None,"name":None}
+    filter_type = {"type": False, "room": False, "color": False,"name":False}
+    assert [result[1] for result in db.search_details(filter_value, filter_type, text="old")] == ["Old Chair"]
+    db.close()
+
+def test_facet_counts(db):
+    db.add_room("Living Room")
+    db.add_room("Kitchen")
+    db.add_type("Chair")
+    db.add_color("Red")
+    db.set_fourniture("Chair1", 1, 1, 1, 100, 200, "None", 100)
+    db.set_fourniture("Chair2", 2, 1, 1, 100, 200, "None", 300)
+    db.set_fourniture("Chair3", 2, 1, 1, 100, 200, "None", 500)
+    assert sorted(db.facet_counts()) == [(1, 1, 1, 1), (2, 1, 1, 2)]
+    filter_value = {"type": None, "room": None, "color": None,"name":None}
+    filter_type = {"type": False, "room": False, "color": False,"name":False}
+    assert db.facet_counts(filter_value, filter_type, ranges={"price": (200, None)}) == [(2, 1, 1, 2)]
+
+def test_search_details_fits(db):
+    db.add_room("Living Room")
+    db.add_room("Kitchen")
+    db.add_type("Table")
+    db.add_color("Red")
+    db.set_fourniture("Table1", 1, 1, 1, 120, 80, "None", 100)
+    db.set_fourniture("Table2", 1, 1, 1, 80, 120, "None", 100)
+    db.set_fourniture("Table3", 1, 1, 1, 150, 90, "None", 100)
+    db.set_fourniture("Table4", 2, 1, 1, 60, 60, "None", 100)
+    filter_value = {"type": None, "room": "Living Room", "color": None,"name":None}
+    filter_type = {"type": False, "room": True, "color": False,"name":False}
+    assert [result[1] for result in db.search_details(filter_value, filter_type, fits=(130, 90, False))] == ["Table1"]
+    assert [result[1] for result in db.search_details(filter_value, filter_type, fits=(130, 90, True))] == ["Table1", "Table2"]
+    assert [result[1] for result in db.search_details(filter_value, filter_type, fits=(120, 80, True))] == ["Table1", "Table2"]
+    assert db.search_details(filter_value, filter_type, fits=(100, 100, True)) == []
+    filter_type["room"] = False
+    assert [result[1] for result in db.search_details(filter_value, filter_type, fits=(100, 100, True))] == ["Table4"]
+
+def test_fits_follows_writes(db):
+    db.add_room("Living Room")
+    db.add_type("Table")
+    db.add_color("Red")
+    db.set_fourniture("Table1", 1, 1, 1, 120, 80, "None", 100)
+    db.set_fourniture("Table2", 1, 1, 1, 80, 120, "None", 100)
+    filter_value = {"type": None, "room": None, "color": None,"name":None}
+    filter_type = {"type": False, "room": False, "color": False,"name":False}
+    db.delete_fourniture(1)
+    db.cursor.execute("UPDATE fournitures SET x_dimension = 200 WHERE id = 2")
+    assert db.search_details(filter_value, filter_type, fits=(150, 150, True)) == []
+    db.cursor.execute("SELECT id, max_short, max_long FROM fournitures_rtree")
+    assert db.cursor.fetchall() == [(2, 120, 200)]
+
+def test_fits_uses_rtree(db):
+    filter_value = {"type": None, "room": None, "color": None,"name":None}
+    filter_type = {"type": False, "room": False, "color": False,"name":False}
+    for rotate in (False, True):
+        joins, where_clauses, values = db.search_conditions(filter_value, filter_type, fits=(100, 50, rotate))
+        plan = query_plan(db, FOURNITURE_DETAILS + joins + " WHERE " + " AND ".join(where_clauses), values)
+        assert "fournitures_rtree VIRTUAL TABLE INDEX 2" in plan
+        assert "fournitures USING INTEGER PRIMARY KEY" in plan
+
+def test_fits_top_by_price_uses_price_index(db):
+    filter_value = {"type": "Table", "room": None, "color": None,"name":None}
+    filter_type = {"type": True, "room": False, "color": False,"name":False}
+    joins, where_clauses, values = db.search_conditions(filter_value, filter_type, fits=(100, 50, True), rtree=False)
+    request = FOURNITURE_DETAILS + joins + " WHERE " + " AND ".join(where_clauses) + " ORDER BY fournitures.price, fournitures.id LIMIT ?"
+    plan = query_plan(db, request, values + [10])
+    assert "idx_fournitures_type_price" in plan
+    assert "fournitures_rtree" not in plan
+
+def test_few_fits_top_by_price_uses_rtree(db, monkeypatch):
+    monkeypatch.setattr(database_module, "FITS_PROBE_LIMIT", 3)
+    db.add_room("Living Room")
+    db.add_type("Table")
+    db.add_color("Red")
+    for name, x_dimension, price in (("Table1", 200, 10), ("Table2", 40, 50), ("Table3", 200, 20), ("Table4", 50, 30), ("Table5", 200, 40)):
+        db.set_fourniture(name, 1, 1, 1, x_dimension, 40, "None", price)
+    filter_value = {"type": "Table", "room": None, "color": None,"name":None}
+    filter_type = {"type": True, "room": False, "color": False,"name":False}
+    statements = []
+    db.conn.set_trace_callback(statements.append)
+    # Two fit: the R-tree gives them and they are sorted
+    assert [result[1] for result in db.search_details(filter_value, filter_type, limit=1, order_by="price", fits=(100, 50, True),
+                                                   ranges={"price": (None, 100)})] == ["Table4"]
+    plan = query_plan(db, statements[-1], [])
+    assert "fournitures_rtree" in plan
+    assert "USE TEMP B-TREE FOR ORDER BY" in plan
+    # All five fit: the price index is walked instead
+    assert [result[1] for result in db.search_details(filter_value, filter_type, limit=2, order_by="-price", fits=(300, 50, True))] == ["Table2", "Table5"]
+    plan = query_plan(db, statements[-1], [])
+    assert "idx_fournitures_type_price" in plan
+    assert "fournitures_rtree" not in plan
+
+def test_batch_commits_once(db):
+    with db.batch():
+        db.add_room("Salon")
+        db.add_room("Chambre")
+        assert db.conn.in_transaction
+    assert not db.conn.in_transaction
+    assert [room[1] for room in db.get_rooms()] == ["Salon", "Chambre"]
+    with pytest.raises(RuntimeError):
+        with db.batch():
+            db.add_room("Cuisine")
+            raise RuntimeError
+    assert len(db.get_rooms()) == 2
+
+def test_savepoint_undoes_one_request(db):
+    with db.batch():
+        db.add_room("Salon")
+        with pytest.raises(sqlite3.IntegrityError):
+            with db.savepoint():
+                db.add_type("Chaise")
+                db.conn.execute("INSERT INTO rooms (name) VALUES ('Salon')")
+        with db.savepoint():
+            db.add_color("Rouge")
+    assert [room[1] for room in db.get_rooms()] == ["Salon"]
+    assert db.get_types() == []
+    assert [color[1] for color in db.get_colors()] == ["Rouge"]
+
+@pytest.mark.parametrize("returning", [True, False])
+def test_update_and_upsert_fourniture(db, monkeypatch, returning):
+    monkeypatch.setattr(database_module, "HAS_RETURNING", returning)
+    id = db.upsert_fourniture("Chaise", 1, 1, 1, 45, 50, "None", 80)[0][0][0]
+    assert db.update_fourniture(id, {"price": 90, "name": "Tabouret"}) == (id, "Tabouret", 1, 1, 1, 45, 50, "None", 90)
+    assert db.update_fourniture(id + 1, {"price": 90}) is None
+    rows, created = db.upsert_fourniture("Tabouret", 1, 1, 1, 40, 40, "None", 70)
+    assert (rows, created) == ([(id, "Tabouret", 1, 1, 1, 40, 40, "None", 70)], False)
+    rows, created = db.upsert_fourniture("Tabouret", 2, 1, 1, 40, 40, "None", 70)
+    assert created and rows[0][0] == id + 1
+
+def test_writes_return_ids_and_existence(db):
+    assert db.add_room("Salon") == 1
+    assert db.add_room("Salon") is None
+    assert db.get_room_by_id(db.add_room("Chambre"))[1] == "Chambre"
+    assert db.remove_room("Chambre") and not db.remove_room("Chambre")
+    assert db.add_type("Chaise") == 1 and db.add_color("Rouge") == 1
+    # Names may repeat: the id comes from the insert, not a lookup by name
+    first = db.set_fourniture("Chaise", 1, 1, 1, 45, 50, "None", 80)
+    second = db.set_fourniture("Chaise", 1, 1, 1, 45, 50, "None", 90)
+    assert second == first + 1 and db.get_fourniture(second)[-1] == 90
+    assert db.delete_fourniture(first) == (first, "Chaise", 1, 1, 1)
+    assert db.delete_fourniture(first) is None
+    assert db.add_user("bob", "secret", False) and not db.add_user("bob", "other", False)
+    with pytest.raises(sqlite3.IntegrityError):
+        db.add_room(None)
+    assert db.delete_user("bob") and not db.delete_user("bob")
@@ -0,0 +1,517 @@
+import pytest
+import threading
+import sqlite3
+import json
+import io
+import gzip
+import contextlib
+from concurrent.futures import Future
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from server.database import Database
+from server.database_thread import DatabaseThread
+from server.search_engine import SearchEngine, encode_cursor
+
+@pytest.fixture
+def database_thread():
+    database_thread = DatabaseThread(db_name=":memory:")
+    database_thread.start()
+    yield database_thread
+    database_thread.stop()
+
+def test_submit_returns_future(database_thread):
+    future = database_thread.submit("SET", {"table": "rooms", "name": "Salon"})
+    assert future.result(timeout=5)["MESSAGE"] == "Room added successfully"
+
+def test_request(database_thread):
+    assert database_thread.request("AUTHENTICATE", {"username": "admin", "password": "admin"}) is True
+
+def test_submit_many_and_gather(database_thread):
+    names = [f"Room{i}" for i in range(20)]
+    futures = database_thread.submit_many([("SET", {"table": "rooms", "name": name}) for name in names])
+    ids = [response["id"] for response in database_thread.gather(futures)]
+    futures = database_thread.submit_many([("GET", {"table": "rooms", "id": id}) for id in ids])
+    assert [response["name"] for response in database_thread.gather(futures)] == names
+
+def test_concurrent_callers_get_their_own_response(database_thread):
+    names = [f"Color{i}" for i in range(50)]
+    ids = {name: database_thread.request("SET", {"table": "colors", "name": name})["id"] for name in names}
+    errors = []
+
+    def worker(name):
+        for _ in range(20):
+            response = database_thread.request("GET", {"table": "colors", "id": ids[name]})
+            if response["name"] != name:
+                errors.append((name, response))
+
+    threads = [threading.Thread(target=worker, args=(name,)) for name in names]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+
+def test_exception_is_set_on_future(database_thread):
+    future = database_thread.submit("SET", {"table": "fournitures"})
+    with pytest.raises(KeyError):
+        future.result(timeout=5)
+    # the database thread survives a failing request
+    assert database_thread.request("IS_ADMIN", {"username": "admin"}) is True
+
+def test_is_admin_unknown_user(database_thread):
+    assert database_thread.request("IS_ADMIN", {"username": "nobody"}) is False
+
+@pytest.fixture
+def pooled_database_thread(tmp_path):
+    database_thread = DatabaseThread(db_name=str(tmp_path / "pool.db"), readers=4)
+    database_thread.start()
+    yield database_thread
+    database_thread.stop()
+
+def test_reader_pool_uses_wal(pooled_database_thread):
+    pooled_database_thread.database.cursor.execute("PRAGMA journal_mode")
+    assert pooled_database_thread.database.cursor.fetchone()[0] == "wal"
+    assert len(pooled_database_thread.readers) == 4
+    assert all(reader.database.read_only for reader in pooled_database_thread.readers)
+
+def test_reader_pool_sees_writes(pooled_database_thread):
+    for name in ("Salon", "Cuisine"):
+        pooled_database_thread.request("SET", {"table": "rooms", "name": name})
+    futures = pooled_database_thread.submit_many([("GET", {"table": "rooms"}) for _ in range(16)])
+    for rooms in pooled_database_thread.gather(futures):
+        assert [room["name"] for room in rooms] == ["Salon", "Cuisine"]
+
+def test_reader_connection_is_read_only(pooled_database_thread):
+    reader = pooled_database_thread.readers[0]
+    with pytest.raises(sqlite3.OperationalError):
+        reader.database.add_room("Grenier")
+
+def test_memory_database_has_no_readers():
+    database_thread = DatabaseThread(db_name=":memory:", readers=4)
+    assert database_thread.readers == []
+
+def test_dimension_cache_loaded_at_startup(tmp_path):
+    db_name = str(tmp_path / "cache.db")
+    database = Database(db_name)
+    database.add_room("Salon")
+    database.add_color("Rouge")
+    database.close()
+    database_thread = DatabaseThread(db_name=db_name)
+    assert database_thread.dimension_cache.get_id("rooms", "Salon") == 1
+    assert database_thread.dimension_cache.get_name("colors", 1) == "Rouge"
+    assert database_thread.dimension_cache.get_id("types", "chaise") is None
+    database_thread.database.close()
+
+def test_dimension_cache_follows_writes(database_thread):
+    cache = database_thread.dimension_cache
+    room_id = database_thread.request("SET", {"table": "rooms", "name": "Salon"})["id"]
+    assert cache.get_id("rooms", "Salon") == room_id
+    assert database_thread.request("GET", {"table": "rooms", "id": str(room_id)}) == {"name": "Salon"}
+    assert database_thread.request("SET", {"table": "rooms", "name": "Salon"})["MESSAGE"] == "Room already exists"
+    assert database_thread.request("DELETE", {"table": "rooms", "name": "Salon"}) == "Room deleted successfully"
+    assert cache.get_id("rooms", "Salon") is None
+    assert database_thread.request("GET", {"table": "rooms"}) == []
+    assert database_thread.request("DELETE", {"table": "rooms", "name": "Salon"}) == "Room not found"
+
+def test_set_fourniture_validated_from_cache(database_thread):
+    for table, name in (("rooms", "Salon"), ("types", "chaise"), ("colors", "Rouge")):
+        database_thread.request("SET", {"table": table, "name": name})
+    fourniture = {"table": "fournitures", "name": "Chaise1", "room": "Salon", "type": "chaise", "color": "Rouge",
+                  "x_dimension": 40, "y_dimension": 40, "image_path": "None", "price": 30}
+    hits = database_thread.dimension_cache.hits
+    assert database_thread.request("SET", fourniture)["MESSAGE"] == "Fourniture set successfully"
+    assert database_thread.dimension_cache.hits == hits + 3
+    misses = database_thread.dimension_cache.misses
+    assert database_thread.request("SET", dict(fourniture, color="Vert"))["MESSAGE"] == "Color not found"
+    assert database_thread.dimension_cache.misses == misses + 1
+    assert database_thread.stats()["dimension_cache"]["size"] == {"rooms": 1, "types": 1, "colors": 1}
+
+def test_search_cache_invalidated_by_writes(database_thread):
+    for table, name in (("rooms", "Salon"), ("types", "chaise"), ("colors", "Rouge")):
+        database_thread.request("SET", {"table": table, "name": name})
+    search_engine = SearchEngine(database_thread)
+    assert json.loads(search_engine.search({"room": "Salon"})) == []
+    assert search_engine.search({"room": "Salon"}) == "[]"
+    assert database_thread.search_cache.hits == 1
+    database_thread.request("SET", {"table": "fournitures", "name": "Chaise1", "room": "Salon", "type": "chaise", "color": "Rouge",
+                                    "x_dimension": 40, "y_dimension": 40, "image_path": "None", "price": 30})
+    assert [fourniture["name"] for fourniture in json.loads(search_engine.search({"room": "Salon"}))] == ["Chaise1"]
+
+def test_search_cache_key_is_normalized(database_thread):
+    search_engine = SearchEngine(database_thread)
+    search_engine.search({"room": "Salon", "type": "chaise"})
+    search_engine.search({"type": "chaise", "room": "Salon", "unknown": 1})
+    assert database_thread.search_cache.hits == 1
+    assert database_thread.stats()["search_cache"]["entries"] == 1
+
+def test_search_stream_pages(database_thread):
+    for table, name in (("rooms", "Salon"), ("types", "chaise"), ("colors", "Rouge")):
+        database_thread.request("SET", {"table": table, "name": name})
+    for i in range(5):
+        database_thread.request("SET", {"table": "fournitures", "name": f"Chaise{i}", "room": "Salon", "type": "chaise", "color": "Rouge",
+                                        "x_dimension": 40, "y_dimension": 40, "image_path": "None", "price": 30})
+    search_engine = SearchEngine(database_thread)
+    pages = list(search_engine.stream({"room": "Salon"}, chunk_size=2))
+    assert [len(page["results"]) for page in pages] == [2, 2, 1]
+    assert [page["done"] for page in pages] == [False, False, True]
+    assert list(search_engine.stream({"room": "Salon"}, chunk_size=0))[0]["done"]
+
+def test_search_ranges_order_and_top_k(database_thread):
+    for table, name in (("rooms", "Salon"), ("types", "canape"), ("colors", "Rouge")):
+        database_thread.request("SET", {"table": table, "name": name})
+    for name, x_dimension, price in (("Canape1", 180, 900), ("Canape2", 210, 500), ("Canape3", 190, 700), ("Canape4", 160, 300)):
+        database_thread.request("SET", {"table": "fournitures", "name": name, "room": "Salon", "type": "canape", "color": "Rouge",
+                                        "x_dimension": x_dimension, "y_dimension": 90, "image_path": "None", "price": price})
+    search_engine = SearchEngine(database_thread)
+    query = {"type": "canape", "max_price": 800, "max_x_dimension": 200}
+    assert [f["name"] for f in json.loads(search_engine.search(query, order_by="price"))] == ["Canape4", "Canape3"]
+    assert [f["name"] for f in json.loads(search_engine.search({"type": "canape"}, order_by="-price", top_k=2))] == ["Canape1", "Canape3"]
+    pages = list(search_engine.stream({"type": "canape"}, chunk_size=3, order_by="x_dimension"))
+    assert [f["name"] for page in pages for f in page["results"]] == ["Canape4", "Canape1", "Canape3", "Canape2"]
+    assert search_engine.search({"max_price": "cheap"}) == {"MESSAGE": "Invalid range for price"}
+    assert search_engine.search({}, order_by="image_path") == {"MESSAGE": "Invalid order_by"}
+    assert search_engine.search({}, limit=2, top_k=2)["MESSAGE"] == "top_k cannot be combined with limit"
+    page = json.loads(search_engine.search({"type": "canape"}, limit=2, order_by="price"))
+    assert search_engine.search({"type": "canape"}, limit=2, cursor=page["next_cursor"])["MESSAGE"] == "Invalid cursor"
+
+def test_search_rejects_tampered_cursor(database_thread):
+    for table, name in (("rooms", "Salon"), ("types", "canape"), ("colors", "Rouge")):
+        database_thread.request("SET", {"table": table, "name": name})
+    for name, price in (("Canape1", 900), ("Canape2", 500), ("Canape3", 700)):
+        database_thread.request("SET", {"table": "fournitures", "name": name, "room": "Salon", "type": "canape", "color": "Rouge",
+                                        "x_dimension": 180, "y_dimension": 90, "image_path": "None", "price": price})
+    search_engine = SearchEngine(database_thread)
+    for position in ({"id": 1, "value": {}, "order_by": "price"}, {"id": 1, "value": [500], "order_by": "price"},
+                     {"id": 1, "value": True, "order_by": "price"}, {"id": True, "value": 500, "order_by": "price"},
+                     {"id": 1, "value": 500, "order_by": "-price"}):
+        response = search_engine.search({"type": "canape"}, limit=2, order_by="price", cursor=encode_cursor(position))
+        assert response == {"MESSAGE": "Invalid cursor"}
+    page = json.loads(search_engine.search({"type": "canape"}, limit=2, order_by="price",
+                                           cursor=encode_cursor({"id": 2, "value": 500, "order_by": "price"})))
+    assert [f["name"] for f in page["results"]] == ["Canape3", "Canape1"]
+
+def test_search_text(database_thread):
+    for table, name in (("rooms", "Salon"), ("types", "canape"), ("colors", "Rouge")):
+        database_thread.request("SET", {"table": table, "name": name})
+    for name in ("Canape cuir", "Canape cuir cuir", "Chaise cuir"):
+        database_thread.request("SET", {"table": "fournitures", "name": name, "room": "Salon", "type": "canape", "color": "Rouge",
+                                        "x_dimension": 40, "y_dimension": 40, "image_path": "None", "price": 30})
+    search_engine = SearchEngine(database_thread)
+    assert [f["name"] for f in json.loads(search_engine.search({"text": "cui"}))] == ["Canape cuir cuir", "Canape cuir", "Chaise cuir"]
+    assert [f["name"] for f in json.loads(search_engine.search({"text": "cuir can"}, order_by="id"))] == ["Canape cuir", "Canape cuir cuir"]
+    page = json.loads(search_engine.search({"text": "cuir"}, limit=2))
+    assert [f["name"] for f in page["results"]] == ["Canape cuir", "Canape cuir cuir"]
+    assert search_engine.search({"text": "cuir"}, limit=2, order_by="rank")["MESSAGE"] == "Rank order cannot be paginated"
+    assert search_engine.search({}, order_by="rank")["MESSAGE"] == "Invalid order_by"
+    assert search_engine.search({"text": "?!"})["MESSAGE"] == "Invalid text"
+
+def test_search_fuzzy(tmp_path):
+    db_name = str(tmp_path / "fuzzy.db")
+    database = Database(db_name)
+    database.add_room("Salon")
+    database.add_room("Chambre")
+    database.add_type("fauteuil")
+    database.add_color("Rouge")
+    database.set_fourniture("Fauteuil velours", 1, 1, 1, 80, 80, "None", 300)
+    database.set_fourniture("Fauteuil cuir", 2, 1, 1, 80, 80, "None", 500)
+    database.close()
+
+    database_thread = DatabaseThread(db_name=db_name)
+    database_thread.start()
+    try:
+        search_engine = SearchEngine(database_thread)
+        results = json.loads(search_engine.search({"fuzzy": "fauteil"}))
+        assert [f["name"] for f in results] == ["Fauteuil cuir", "Fauteuil velours"]
+        assert results[0]["similarity"] >= results[1]["similarity"]
+        assert [f["name"] for f in json.loads(search_engine.search({"fuzzy": "fauteil", "room": "Salon"}))] == ["Fauteuil velours"]
+
+        database_thread.request("SET", {"table": "fournitures", "name": "Fauteuil rotin", "room": "Salon", "type": "fauteuil", "color": "Rouge",
+                                        "x_dimension": 80, "y_dimension": 80, "image_path": "None", "price": 200})
+        assert json.loads(search_engine.search({"fuzzy": "fauteuil rotn"}))[0]["name"] == "Fauteuil rotin"
+        database_thread.request("DELETE", {"table": "fournitures", "id": 1})
+        assert "Fauteuil velours" not in [f["name"] for f in json.loads(search_engine.search({"fuzzy": "velour"}))]
+        assert len(json.loads(search_engine.search({"fuzzy": "fauteuil"}, top_k=1))) == 1
+
+        assert search_engine.search({"fuzzy": "fauteil"}, limit=5)["MESSAGE"] == "Fuzzy search cannot be paginated"
+        assert search_engine.search({"fuzzy": "..."})["MESSAGE"] == "Invalid fuzzy"
+        assert database_thread.stats()["name_index"]["names"] == 2
+    finally:
+        database_thread.stop()
+
+def test_suggestions_follow_writes(database_thread):
+    for table, name in (("rooms", "Salon"), ("types", "chaise"), ("colors", "Rouge")):
+        database_thread.request("SET", {"table": table, "name": name})
+    database_thread.request("SET", {"table": "fournitures", "name": "Chaise longue", "room": "Salon", "type": "chaise", "color": "Rouge",
+                                    "x_dimension": 40, "y_dimension": 40, "image_path": "None", "price": 30})
+    assert database_thread.suggest({"prefix": "ch"}) == [
+        {"name": "chaise", "table": "types"},
+        {"name": "Chaise longue", "table": "fournitures"},
+    ]
+    database_thread.request("DELETE", {"table": "fournitures", "id": 1})
+    assert database_thread.suggest({"prefix": "ch", "table": "fournitures"}) == []
+    assert database_thread.suggest({"prefix": None})["MESSAGE"] == "Invalid prefix"
+
+def test_search_facets(database_thread):
+    for table, name in (("rooms", "Salon"), ("rooms", "Chambre"), ("types", "chaise"), ("types", "lit"), ("colors", "Rouge")):
+        database_thread.request("SET", {"table": table, "name": name})
+    for name, room, type, price in (("Chaise1", "Salon", "chaise", 30), ("Chaise2", "Chambre", "chaise", 60), ("Lit1", "Chambre", "lit", 300)):
+        database_thread.request("SET", {"table": "fournitures", "name": name, "room": room, "type": type, "color": "Rouge",
+                                        "x_dimension": 40, "y_dimension": 40, "image_path": "None", "price": price})
+    search_engine = SearchEngine(database_thread)
+    response = json.loads(search_engine.search({}, facets=True))
+    assert len(response["results"]) == 3
+    assert response["facets"] == {"room": {"Salon": 1, "Chambre": 2}, "type": {"chaise": 2, "lit": 1}, "color": {"Rouge": 3}}
+
+    response = json.loads(search_engine.search({"type": "chaise", "max_price": 50}, facets=True))
+    assert response["facets"] == {"room": {"Salon": 1}, "type": {"chaise": 1}, "color": {"Rouge": 1}}
+    page = json.loads(search_engine.search({"room": "Chambre"}, limit=1, facets=True))
+    assert len(page["results"]) == 1
+    assert page["facets"]["type"] == {"chaise": 1, "lit": 1}
+
+    database_thread.request("DELETE", {"table": "fournitures", "id": 3})
+    assert database_thread.facet_counts.snapshot()["type"] == {1: 2}
+    assert json.loads(search_engine.search({}, facets=True))["facets"]["room"] == {"Salon": 1, "Chambre": 1}
+    assert search_engine.search({"fuzzy": "chaise"}, facets=True)["MESSAGE"] == "Facets are not available for fuzzy search"
+
+def test_search_fits(database_thread):
+    for table, name in (("rooms", "Salon"), ("rooms", "Chambre"), ("types", "table"), ("colors", "Rouge")):
+        database_thread.request("SET", {"table": table, "name": name})
+    for name, room, x_dimension, y_dimension in (("Table1", "Salon", 120, 80), ("Table2", "Salon", 80, 120), ("Table3", "Chambre", 70, 70)):
+        database_thread.request("SET", {"table": "fournitures", "name": name, "room": room, "type": "table", "color": "Rouge",
+                                        "x_dimension": x_dimension, "y_dimension": y_dimension, "image_path": "None", "price": 100})
+    search_engine = SearchEngine(database_thread)
+    assert [result["name"] for result in json.loads(search_engine.fits(130, 90))] == ["Table1", "Table3"]
+    assert [result["name"] for result in json.loads(search_engine.fits(130, 90, True, {"room": "Salon"}))] == ["Table1", "Table2"]
+    page = json.loads(search_engine.fits(130, 90, True, limit=2, order_by="-x_dimension"))
+    assert [result["name"] for result in page["results"]] == ["Table1", "Table2"]
+    page = json.loads(search_engine.fits(130, 90, True, limit=2, cursor=page["next_cursor"], order_by="-x_dimension"))
+    assert [result["name"] for result in page["results"]] == ["Table3"]
+    response = json.loads(search_engine.fits(130, 90, True, facets=True))
+    assert response["facets"]["room"] == {"Salon": 2, "Chambre": 1}
+    assert search_engine.fits(0, 90)["MESSAGE"] == "Invalid fits"
+    assert search_engine.fits(130, "90")["MESSAGE"] == "Invalid fits"
+    assert search_engine.fits(130, 90, "yes")["MESSAGE"] == "Invalid fits"
+
+def test_place(database_thread):
+    for table, name in (("rooms", "Salon"), ("types", "table"), ("colors", "Rouge")):
+        database_thread.request("SET", {"table": table, "name": name})
+    for name, x_dimension, y_dimension in (("Table1", 120, 80), ("Table2", 80, 120)):
+        database_thread.request("SET", {"table": "fournitures", "name": name, "room": "Salon", "type": "table", "color": "Rouge",
+                                        "x_dimension": x_dimension, "y_dimension": y_dimension, "image_path": "None", "price": 100})
+    response = database_thread.place({"width": 240, "depth": 80, "ids": [1, 2, 1]})
+    assert [placement["id"] for placement in response["placements"]] == [1, 1]
+    assert response["unplaced"] == [2]
+    response = database_thread.place({"width": 240, "depth": 80, "ids": [1, 2], "rotate": True})
+    assert response["placements"][1] == {"id": 2, "x": 120, "y": 0, "width": 120, "depth": 80, "rotated": True}
+    assert database_thread.place({"width": 240, "depth": 80, "ids": [1, 9]})["MESSAGE"] == "Fournitures not found: [9]"
+    assert database_thread.place({"width": 0, "depth": 80, "ids": [1]})["MESSAGE"] == "Invalid room dimensions"
+    assert database_thread.place({"width": 240, "depth": 80, "ids": []})["MESSAGE"].startswith("Invalid ids")
+
+def test_furnish(database_thread):
+    for table, name in (("rooms", "Salon"), ("rooms", "Chambre"), ("types", "canape"), ("types", "chaise"), ("colors", "Rouge")):
+        database_thread.request("SET", {"table": table, "name": name})
+    for name, room, type, x_dimension, price in (("Canape1", "Salon", "canape", 200, 900), ("Canape2", "Salon", "canape", 250, 700),
+                                                 ("Chaise1", "Salon", "chaise", 40, 100), ("Chaise2", "Salon", "chaise", 50, 60),
+                                                 ("Chaise3", "Chambre", "chaise", 40, 10)):
+        database_thread.request("SET", {"table": "fournitures", "name": name, "room": room, "type": type, "color": "Rouge",
+                                        "x_dimension": x_dimension, "y_dimension": 50, "image_path": "None", "price": price})
+    response = database_thread.furnish({"room": "Salon", "types": {"canape": 1, "chaise": 2}, "budget": 900, "top_k": 3})
+    assert response["complete"]
+    assert [combination["price"] for combination in response["combinations"]] == [820, 860, 900]
+    assert [(item["name"], item["quantity"]) for item in response["combinations"][0]["items"]] == [("Canape2", 1), ("Chaise2", 2)]
+    response = database_thread.furnish({"room": "Salon", "types": {"canape": 1, "chaise": 2}, "budget": 2000, "width": 220, "depth": 60})
+    assert [(item["name"], item["quantity"]) for item in response["combinations"][0]["items"]] == [("Canape1", 1), ("Chaise2", 2)]
+    assert database_thread.furnish({"room": "Salon", "types": {"canape": 0}, "budget": 900})["MESSAGE"].startswith("Invalid types")
+    assert database_thread.furnish({"room": "Salon", "types": {"canape": 1}, "budget": "900"})["MESSAGE"] == "Invalid budget"
+
+def test_import_catalog(database_thread):
+    database_thread.request("SET", {"table": "rooms", "name": "Salon"})
+    database_thread.request("SET", {"table": "types", "name": "chaise"})
+    data = ("name,room,type,color,x_dimension,y_dimension,price\n"
+            "Chaise1,Salon,chaise,Rouge,45,50,80\n"
+            "Chaise2,Cuisine,chaise,Rouge,45,50,60\n"
+            "Chaise3,Salon,chaise,Rouge,,50,60\n").encode()
+    response = database_thread.import_catalog(io.BytesIO(data), "csv")
+    assert response["imported"] == 0
+    assert response["error_count"] == 3
+    assert sorted((error["line"], error["MESSAGE"]) for error in response["errors"]) == [
+        (2, "Color not found"), (3, "Room not found"), (4, "Missing x_dimension")]
+    response = database_thread.import_catalog(io.BytesIO(data), "csv", create=True)
+    assert (response["imported"], response["error_count"]) == (2, 1)
+    results = json.loads(SearchEngine(database_thread).search({"type": "chaise"}))
+    assert sorted((result["name"], result["room"], result["color"], result["price"]) for result in results) == [
+        ("Chaise1", "Salon", "Rouge", 80), ("Chaise2", "Cuisine", "Rouge", 60)]
+    assert [suggestion["name"] for suggestion in database_thread.suggest({"prefix": "Chai", "table": "fournitures"})] == ["Chaise1", "Chaise2"]
+
+def test_export(tmp_path):
+    database_thread = DatabaseThread(db_name=str(tmp_path / "export.db"))
+    database_thread.start()
+    try:
+        for table, name in (("rooms", "Salon"), ("types", "chaise"), ("colors", "Rouge")):
+            database_thread.request("SET", {"table": table, "name": name})
+        for i in range(2500):
+            database_thread.request("SET", {"table": "fournitures", "name": f"Chaise{i}", "room": "Salon", "type": "chaise",
+                                            "color": "Rouge", "x_dimension": 45, "y_dimension": 50, "image_path": "None", "price": i})
+        chunks = list(database_thread.export())
+        # One chunk per EXPORT_CHUNK_SIZE rows
+        assert len(chunks) == 3
+        rows = [json.loads(line) for line in b"".join(chunks).decode().splitlines()]
+        assert len(rows) == 2500
+        assert rows[0] == {"id": 1, "name": "Chaise0", "room": "Salon", "type": "chaise", "color": "Rouge",
+                           "x_dimension": 45, "y_dimension": 50, "image_path": "None", "price": 0}
+        assert gzip.decompress(b"".join(database_thread.export(compress=True))) == b"".join(chunks)
+    finally:
+        database_thread.stop()
+
+def test_update_and_upsert(database_thread):
+    for table, name in (("rooms", "Salon"), ("rooms", "Chambre"), ("types", "chaise"), ("colors", "Rouge")):
+        database_thread.request("SET", {"table": table, "name": name})
+    chaise = {"table": "fournitures", "name": "Chaise", "room": "Salon", "type": "chaise", "color": "Rouge",
+              "x_dimension": 45, "y_dimension": 50, "image_path": "None", "price": 80}
+    id = database_thread.request("SET", chaise)["id"]
+    search_engine = SearchEngine(database_thread)
+    assert json.loads(search_engine.search({"room": "Salon"}))[0]["price"] == 80
+
+    response = database_thread.request("UPDATE", {"table": "fournitures", "id": id, "fields": {"price": 95, "room": "Chambre", "name": "Fauteuil"}})
+    assert response["MESSAGE"] == "Fourniture updated successfully"
+    assert response["fourniture"] == {"id": id, "name": "Fauteuil", "room": "Chambre", "type": "chaise", "color": "Rouge",
+                                      "x_dimension": 45, "y_dimension": 50, "image_path": None, "price": 95}
+    # The search cache, facets and suggestions follow the update
+    assert json.loads(search_engine.search({"room": "Salon"})) == []
+    assert json.loads(search_engine.search({"room": "Chambre"}, facets=True))["facets"]["room"] == {"Chambre": 1}
+    assert [suggestion["name"] for suggestion in database_thread.suggest({"prefix": "Fau"})] == ["Fauteuil"]
+    assert database_thread.suggest({"prefix": "Chaise", "table": "fournitures"}) == []
+
+    assert database_thread.request("UPDATE", {"table": "fournitures", "id": id + 1, "fields": {"price": 1}})["MESSAGE"] == "Fourniture not found"
+    assert database_thread.request("UPDATE", {"table": "fournitures", "id": id, "fields": {"room": "Cuisine"}})["MESSAGE"] == "Room not found"
+    assert database_thread.request("UPDATE", {"table": "fournitures", "id": id, "fields": {"id": 3}})["MESSAGE"] == "Invalid field: id"
+    assert database_thread.request("UPDATE", {"table": "fournitures", "id": id, "fields": {"price": "1"}})["MESSAGE"] == "Invalid price"
+
+    response = database_thread.request("UPSERT", dict(chaise, name="Fauteuil", room="Chambre", price=120))
+    assert response == {"MESSAGE": "Fourniture updated successfully", "ids": [id]}
+    response = database_thread.request("UPSERT", dict(chaise, price=60))
+    assert response["MESSAGE"] == "Fourniture set successfully"
+    new_id = response["ids"][0]
+
+    response = database_thread.request("UPDATE", {"table": "fournitures", "items": [
+        {"id": id, "fields": {"price": 100}}, {"id": new_id, "fields": {"price": 50}}, {"id": 999, "fields": {"price": 1}},
+    ]})
+    assert [result["MESSAGE"] for result in response["results"]] == [
+        "Fourniture updated successfully", "Fourniture updated successfully", "Fourniture not found"]
+    results = json.loads(search_engine.search({"type": "chaise"}, order_by="price"))
+    assert [(result["name"], result["price"]) for result in results] == [("Chaise", 50), ("Fauteuil", 100)]
+
+def test_group_commit(tmp_path):
+    db_name = str(tmp_path / "batch.db")
+    database_thread = DatabaseThread(db_name=db_name, batch_size=64, batch_delay=0.01)
+    database_thread.start()
+    try:
+        futures = database_thread.submit_many(
+            [("SET", {"table": "rooms", "name": f"Room{i}"}) for i in range(100)] + [("SET", {"table": "fournitures"})]
+        )
+        for future in futures[:100]:
+            assert future.result(timeout=5)["MESSAGE"] == "Room added successfully"
+        with pytest.raises(KeyError):
+            futures[100].result(timeout=5)
+        # Acknowledged writes are committed: another connection sees them
+        reader = Database(db_name, read_only=True)
+        assert len(reader.get_rooms()) == 100
+        reader.close()
+    finally:
+        database_thread.stop()
+
+def test_group_commit_rollback_undoes_memory(tmp_path):
+    # Not started: batches are run by hand
+    database_thread = DatabaseThread(db_name=str(tmp_path / "batch.db"), batch_size=64, search_backend="columnar")
+    for table, name in (("rooms", "Salon"), ("types", "chaise"), ("colors", "Rouge")):
+        database_thread.handle_request("SET", {"table": table, "name": name})
+    id = database_thread.handle_request("SET", {"table": "fournitures", "name": "Chaise", "room": "Salon", "type": "chaise",
+                                                "color": "Rouge", "x_dimension": 45, "y_dimension": 50, "image_path": "None", "price": 80})["id"]
+
+    def run(*requests):
+        batch = [(command, data, Future()) for command, data in requests]
+        database_thread.execute_batch(batch)
+        return [future.exception() or future.result() for command, data, future in batch]
+
+    # The second item overflows SQLite: the whole UPDATE rolls back, the
+    # rename of the first one included
+    results = run(("SET", {"table": "rooms", "name": "Chambre"}),
+                  ("UPDATE", {"table": "fournitures", "items": [{"id": id, "fields": {"name": "Fauteuil", "room": "Chambre"}},
+                                                                {"id": id, "fields": {"price": 2 ** 70}}]}))
+    assert results[0]["MESSAGE"] == "Room added successfully"
+    assert isinstance(results[1], OverflowError)
+    assert [suggestion["name"] for suggestion in database_thread.suggest({"prefix": "Chaise", "table": "fournitures"})] == ["Chaise"]
+    assert database_thread.suggest({"prefix": "Fauteuil"}) == []
+    assert database_thread.facet_counts.snapshot()["room"] == {1: 1}
+    assert database_thread.dimension_cache.get_id("rooms", "Chambre") is not None
+
+    # A failed commit undoes every request of the batch
+    original = database_thread.database.batch
+
+    @contextlib.contextmanager
+    def failing_commit():
+        with original():
+            yield
+            raise sqlite3.OperationalError("disk I/O error")
+
+    database_thread.database.batch = failing_commit
+    results = run(("SET", {"table": "rooms", "name": "Cuisine"}), ("DELETE", {"table": "fournitures", "id": id}))
+    assert all(isinstance(result, sqlite3.OperationalError) for result in results)
+    assert database_thread.dimension_cache.get_id("rooms", "Cuisine") is None
+    assert database_thread.suggest({"prefix": "Cuisine"}) == []
+    assert [row["name"] for row in database_thread.snapshot.search(
+        {"filters": {}, "filter_on": {}}, database_thread.dimension_cache)] == ["Chaise"]
+    assert database_thread.name_index.search("Chaise")[0][0] == id
+
+    # A batch that cannot start still answers every request
+    def failing_start():
+        raise sqlite3.OperationalError("database is locked")
+        yield
+
+    database_thread.database.batch = contextlib.contextmanager(failing_start)
+    results = run(("SET", {"table": "rooms", "name": "Cuisine"}), ("SET", {"table": "rooms", "name": "Bureau"}))
+    assert all(isinstance(result, sqlite3.OperationalError) for result in results)
+    database_thread.database.close()
+
+def test_import_failed_chunk_is_reported_and_undone(database_thread, monkeypatch):
+    data = b'{"name": "Chaise", "room": "Veranda", "type": "chaise", "color": "Rouge", "x_dimension": 45, "y_dimension": 50}\n' * 2
+
+    def failing_insert(rows):
+        raise sqlite3.OperationalError("disk I/O error")
+
+    monkeypatch.setattr(database_thread.database, "insert_fournitures", failing_insert)
+    response = database_thread.import_catalog(io.BytesIO(data), "jsonl", create=True)
+    assert (response["imported"], response["error_count"]) == (0, 2)
+    assert response["errors"][0] == {"line": 1, "MESSAGE": "Import failed: disk I/O error"}
+    # The names created for the chunk went with it
+    assert database_thread.dimension_cache.get_id("rooms", "Veranda") is None
+    assert database_thread.database.get_rooms() == []
+    assert database_thread.suggest({"prefix": "Veranda"}) == []
+
+def test_import_in_group_commit_invalidates_after_commit(tmp_path):
+    database_thread = DatabaseThread(db_name=str(tmp_path / "batch.db"), batch_size=64)
+    row = ("Chaise", "Salon", "chaise", "Rouge", 45, 50, "None", 80)
+    committed = []
+    invalidate = database_thread.search_cache.invalidate
+
+    def spy():
+        committed.append(not database_thread.database.conn.in_transaction)
+        invalidate()
+
+    database_thread.search_cache.invalidate = spy
+    future = Future()
+    database_thread.execute_batch([("IMPORT", {"rows": [(2, row)], "create": True}, future)])
+    assert future.result()["imported"] == 1
+    # Readers may have cached pre-import results until the commit
+    assert committed[-1]
+    database_thread.database.close()
+
+def test_set_null_name_fails(database_thread):
+    with pytest.raises(sqlite3.IntegrityError):
+        database_thread.request("SET", {"table": "rooms", "name": None})
+    with pytest.raises(sqlite3.IntegrityError):
+        database_thread.request("SET", {"table": "users", "username": None, "password": "secret", "is_admin": False})
+    assert database_thread.request("SET", {"table": "rooms", "name": "Salon"})["MESSAGE"] == "Room added successfully"
@@ -0,0 +1,47 @@
+import pytest
+
+import sys
+import os
+import time
+from itertools import combinations_with_replacement, product
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from server.furnish import cheapest_multisets, solve
+
+def candidates(*prices):
+    return sorted(((price, 1), id) for id, price in enumerate(prices))
+
+def test_cheapest_multisets_repeats_candidates():
+    options = cheapest_multisets(candidates(100, 150, 400), 2, 320, 5, time.monotonic() + 10)
+    assert options == [((200, 2), (0, 0)), ((250, 2), (0, 1)), ((300, 2), (1, 1))]
+
+def test_solve_within_budget():
+    groups = [(candidates(900, 700), 1), (candidates(300, 250), 1), (candidates(100, 60), 2)]
+    combinations, complete = solve(groups, 1200, top_k=3)
+    assert complete
+    assert combinations == [((1070, 4), (1, 1, 1, 1)), ((1110, 4), (1, 1, 1, 0)), ((1120, 4), (1, 0, 1, 1))]
+    assert solve(groups, 1100, top_k=3)[0] == [((1070, 4), (1, 1, 1, 1))]
+    assert solve(groups, 1000, top_k=3) == ([], True)
+    assert solve(groups + [([], 1)], 5000) == ([], True)
+
+def test_solve_matches_exhaustive_search():
+    import random
+    rng = random.Random(0)
+    for _ in range(100):
+        groups = [(sorted(((rng.randint(50, 900), rng.randint(1, 50)), id) for id in range(rng.randint(1, 5))), rng.randint(1, 3))
+                  for _ in range(rng.randint(1, 3))]
+        budget = rng.randint(100, 4000)
+        keys = []
+        for choice in product(*(combinations_with_replacement(candidates, count) for candidates, count in groups)):
+            items = [item for group in choice for item in group]
+            key = (sum(item[0][0] for item in items), sum(item[0][1] for item in items))
+            if key[0] <= budget:
+                keys.append(key)
+        combinations, complete = solve(groups, budget, top_k=4, deadline=time.monotonic() + 10)
+        assert [key for key, ids in combinations] == sorted(keys)[:4]
+
+def test_solve_past_deadline_returns_cheapest():
+    groups = [(candidates(*range(100, 150)), 10) for _ in range(10)]
+    combinations, complete = solve(groups, 10 ** 6, top_k=50, deadline=time.monotonic())
+    assert not complete
+    assert combinations == [((10 * 10 * 100, 100), (0,) * 100)]
@@ -0,0 +1,32 @@
+import io
+import pytest
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from server.importer import iter_rows, validate_row
+
+def test_validate_row():
+    row = {"name": "Chaise", "room": "Salon", "type": "chaise", "color": "Rouge", "x_dimension": "45", "y_dimension": "50.5"}
+    assert validate_row(row) == ("Chaise", "Salon", "chaise", "Rouge", 45, 50.5, "None", None)
+    assert validate_row(dict(row, price=80, image_path="chaise.png"))[6:] == ("chaise.png", 80)
+    assert validate_row(dict(row, price=2 ** 63 - 1))[7] == 2 ** 63 - 1
+    for bad, message in (({"color": ""}, "Missing color"), ({"x_dimension": "wide"}, "Invalid dimensions"),
+                         ({"y_dimension": "nan"}, "Invalid dimensions"), ({"price": "cheap"}, "Invalid price"),
+                         ({"name": 12}, "Invalid name"), ({"price": "1e30"}, "Invalid price"),
+                         ({"x_dimension": 2 ** 63}, "Invalid dimensions")):
+        with pytest.raises(ValueError, match=message):
+            validate_row(dict(row, **bad))
+
+def test_iter_rows_csv():
+    data = b"name,room,type,color,x_dimension,y_dimension,price\nChaise,Salon,chaise,Rouge,45,50,80\nTable,Salon,table,Rouge,,80,\n"
+    rows = list(iter_rows(io.BytesIO(data), "csv"))
+    assert rows[0] == (2, ("Chaise", "Salon", "chaise", "Rouge", 45, 50, "None", 80))
+    assert rows[1][0] == 3 and str(rows[1][1]) == "Missing x_dimension"
+
+def test_iter_rows_jsonl():
+    data = b'{"name": "Chaise", "room": "Salon", "type": "chaise", "color": "Rouge", "x_dimension": 45, "y_dimension": 50}\n\n{oops\n[1]\n'
+    rows = list(iter_rows(io.BytesIO(data), "jsonl"))
+    assert rows[0] == (1, ("Chaise", "Salon", "chaise", "Rouge", 45, 50, "None", None))
+    assert [(line, str(error)) for line, error in rows[1:]] == [(3, "Invalid JSON"), (4, "Row is not an object")]
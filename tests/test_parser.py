@@ -0,0 +1,72 @@
+import pytest
+import json
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from server.parser import FrameDecoder, MessageDecoder, Parser, encode_frame, FRAME_HEADER, MAX_FRAME_SIZE
+
+@pytest.fixture
+def parser():
+    return Parser()
+
+def test_parse_json(parser):
+    assert parser.parse('{"command": "GET"}') == {"command": "GET"}
+    assert parser.parse(b'{"command": "GET"}') == {"command": "GET"}
+
+def test_parse_invalid(parser):
+    assert parser.parse("not json") is None
+    assert parser.parse(b"\xff\xfe") is None
+
+def test_encode_frame_header():
+    frame = encode_frame(7, "abc")
+    assert FRAME_HEADER.unpack_from(frame) == (3, 7)
+    assert frame[FRAME_HEADER.size:] == b"abc"
+
+def test_decoder_split_frame():
+    decoder = FrameDecoder()
+    frame = encode_frame(1, json.dumps({"command": "SEARCH"}))
+    assert decoder.feed(frame[:3]) == []
+    assert decoder.feed(frame[3:10]) == []
+    assert decoder.feed(frame[10:]) == [(1, b'{"command": "SEARCH"}')]
+    assert decoder.buffer == bytearray()
+
+def test_decoder_merged_frames():
+    decoder = FrameDecoder()
+    data = encode_frame(1, "a") + encode_frame(2, "") + encode_frame(3, "ccc")
+    assert decoder.feed(data + encode_frame(4, "dd")[:5]) == [(1, b"a"), (2, b""), (3, b"ccc")]
+    assert decoder.feed(encode_frame(4, "dd")[5:]) == [(4, b"dd")]
+
+def test_decoder_rejects_oversized_frame():
+    decoder = FrameDecoder()
+    with pytest.raises(ValueError):
+        decoder.feed(FRAME_HEADER.pack(MAX_FRAME_SIZE + 1, 1))
+
+def test_iter_frames(parser):
+    data = encode_frame(1, "one") + encode_frame(2, "two")
+    chunks = [data[i:i + 4] for i in range(0, len(data), 4)] + [b""]
+    frames = list(parser.iter_frames(lambda bufsize: chunks.pop(0)))
+    assert frames == [(1, b"one"), (2, b"two")]
+
+def test_message_decoder_split_message():
+    decoder = MessageDecoder()
+    message = json.dumps({"command": "SET", "name": "a}\"[b", "tags": [1, {"x": 2}]}).encode("utf-8")
+    decoder.feed(message[:10])
+    assert decoder.next_message() is None
+    decoder.feed(message[10:])
+    assert decoder.next_message() == message
+
+def test_message_decoder_keeps_trailing_bytes():
+    decoder = MessageDecoder()
+    decoder.feed(b'{"command": "RECIEVE_IMAGE"}\x00\x01\x02{"command": "GET"}')
+    assert decoder.next_message() == b'{"command": "RECIEVE_IMAGE"}'
+    assert decoder.take(3) == b"\x00\x01\x02"
+    assert decoder.next_message() == b'{"command": "GET"}'
+    assert decoder.next_message() is None
+
+def test_message_decoder_invalid_message():
+    decoder = MessageDecoder()
+    decoder.feed(b"  not json")
+    assert decoder.next_message() == b"not json"
+    assert decoder.buffer == bytearray()
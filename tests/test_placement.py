@@ -0,0 +1,43 @@
+import pytest
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from server.placement import SpatialHash, place
+
+def overlaps(a, b):
+    return (a["x"] < b["x"] + b["width"] and b["x"] < a["x"] + a["width"]
+            and a["y"] < b["y"] + b["depth"] and b["y"] < a["y"] + a["depth"])
+
+def test_spatial_hash_collides():
+    index = SpatialHash(10)
+    index.insert(0, 0, 25, 10)
+    assert index.collides(20, 5, 10, 10)
+    assert not index.collides(25, 0, 10, 10)
+    assert not index.collides(0, 10, 25, 10)
+    assert index.collides(-5, -5, 10, 10)
+
+def test_place_bottom_left():
+    placements, unplaced = place(100, 50, [(1, 40, 30), (2, 60, 50), (3, 50, 20)])
+    assert unplaced == [3]
+    assert [(p["id"], p["x"], p["y"]) for p in placements] == [(2, 0, 0), (1, 60, 0)]
+
+def test_place_rotate():
+    items = [(1, 50, 100), (2, 50, 100)]
+    assert place(200, 50, items)[1] == [1, 2]
+    placements, unplaced = place(200, 50, items, rotate=True)
+    assert unplaced == []
+    assert [(p["x"], p["y"], p["width"], p["depth"], p["rotated"]) for p in placements] == [(0, 0, 100, 50, True), (100, 0, 100, 50, True)]
+
+def test_place_never_overlaps():
+    import random
+    rng = random.Random(0)
+    items = [(i, rng.randint(10, 80), rng.randint(10, 80)) for i in range(300)]
+    placements, unplaced = place(500, 400, items, rotate=True)
+    assert sorted([p["id"] for p in placements] + unplaced) == list(range(300))
+    for p in placements:
+        assert 0 <= p["x"] and p["x"] + p["width"] <= 500
+        assert 0 <= p["y"] and p["y"] + p["depth"] <= 400
+    for i, a in enumerate(placements):
+        assert not any(overlaps(a, b) for b in placements[i + 1:])
@@ -5,9 +5,12 @@ import json
 import sys
 import os
 import time
+import gzip
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from server.server import Server
+from server.client import Client
+from server.parser import encode_frame, FRAME_HEADER, MAX_FRAME_SIZE
 
 server_port = 10012
 
@@ -530,3 +533,460 @@ def test_send_image(server, client):
         os.remove("images/test2.jpg")
         
 
+
+
+
+async_server_port = server_port + 1
+
+@pytest.fixture(scope="module")
+def async_server(tmp_path_factory):
+    db_name = str(tmp_path_factory.mktemp("async") / "database_async_test.db")
+    server = Server(port=async_server_port,new_database=True,db_name=db_name,mode="asyncio")
+    server_thread = threading.Thread(target=server.start)
+    server_thread.daemon = True
+    server_thread.start()
+    time.sleep(1)
+
+    yield server
+    server.database_thread.stop()
+
+@pytest.fixture
+def async_client(async_server):
+    client = RealClient("127.0.0.1", async_server_port)
+    yield client
+    client.close()
+
+def test_invalid_server_mode():
+    with pytest.raises(ValueError):
+        Server(port=async_server_port + 1, db_name=":memory:", mode="forking")
+
+def test_async_authenticate_user(async_client):
+    response = async_client.send_request({
+        "command": "AUTHENTICATE",
+        "username": "admin",
+        "password": "admin"
+    })
+    assert response["MESSAGE"] == "Authentication successful"
+    response = async_client.send_request({
+        "command": "DISCONNECT"
+    })
+    assert response["MESSAGE"] == "Disconnected"
+
+def test_async_admin_required(async_client):
+    response = async_client.send_request({
+        "command": "SET",
+        "table": "rooms",
+        "name": "Salon"
+    })
+    assert response["MESSAGE"] == "Authentication required or admin rights required or wrong command"
+
+def test_async_set_and_search_fourniture(async_client):
+    async_client.send_request({
+        "command": "AUTHENTICATE",
+        "username": "admin",
+        "password": "admin"
+    })
+    for table, name in (("rooms", "Salon"), ("types", "canape"), ("colors", "Vert")):
+        async_client.send_request({"command": "SET", "table": table, "name": name})
+    response = async_client.send_request({
+        "command": "SET",
+        "table": "fournitures",
+        "name": "Sofa1",
+        "room": "Salon",
+        "type": "canape",
+        "color": "Vert",
+        "x_dimension": 200,
+        "y_dimension": 90,
+        "image_path": "None",
+        "price": 700
+    })
+    assert response["MESSAGE"] == "Fourniture set successfully"
+
+    response = async_client.send_request({
+        "command": "SEARCH",
+        "query": {"room": "Salon"}
+    })
+    assert [fourniture["name"] for fourniture in response] == ["Sofa1"]
+
+def test_async_many_connections(async_client):
+    clients = [RealClient("127.0.0.1", async_server_port) for _ in range(50)]
+    try:
+        for client in clients:
+            response = client.send_request({"command": "DISCONNECT"})
+            assert response["MESSAGE"] == "Disconnected"
+    finally:
+        for client in clients:
+            client.close()
+
+def test_framed_pipelined_requests(server):
+    client = Client("127.0.0.1", server_port, framed=True)
+    try:
+        assert client.framed
+        responses = client.send_requests([
+            {"command": "AUTHENTICATE", "username": "admin", "password": "admin"},
+            {"command": "SET", "table": "rooms", "name": "Garage"},
+            {"command": "GET", "table": "rooms"},
+            {"command": "DISCONNECT"},
+        ])
+        assert responses[0]["MESSAGE"] == "Authentication successful"
+        assert responses[1]["MESSAGE"] == "Room added successfully"
+        assert "Garage" in [room["name"] for room in responses[2]]
+        assert responses[3]["MESSAGE"] == "Disconnected"
+    finally:
+        client.close()
+
+def test_framed_large_payload(server):
+    client = Client("127.0.0.1", server_port, framed=True)
+    try:
+        client.send_request({"command": "AUTHENTICATE", "username": "admin", "password": "admin"})
+        name = "x" * 20000
+        response = client.send_request({"command": "SET", "table": "types", "name": name})
+        assert response["MESSAGE"] == "Type added successfully"
+        response = client.send_request({"command": "GET", "table": "types"})
+        assert name in [type_["name"] for type_ in response]
+    finally:
+        client.close()
+
+def test_framed_image_roundtrip(server, tmp_path):
+    image_path = str(tmp_path / "upload.bmp")
+    with open(os.path.join(os.path.dirname(__file__), "..", "server", "test.bmp"), "rb") as f:
+        image_data = f.read()
+    client = Client("127.0.0.1", server_port, framed=True)
+    try:
+        client.send_request({"command": "AUTHENTICATE", "username": "admin", "password": "admin"})
+        response = client.send_image(image_path, image_data)
+        assert response["MESSAGE"] == "Image received"
+        with open(image_path, "rb") as f:
+            assert f.read() == image_data
+
+        for table, name in (("rooms", "Atelier"), ("types", "etabli"), ("colors", "Gris")):
+            client.send_request({"command": "SET", "table": table, "name": name})
+        fourniture_id = client.send_request({
+            "command": "SET", "table": "fournitures", "name": "Bench1", "room": "Atelier",
+            "type": "etabli", "color": "Gris", "x_dimension": 150, "y_dimension": 60,
+            "image_path": image_path, "price": 90,
+        })["id"]
+        response = client.send_request({"command": "GET", "table": "fournitures", "id": fourniture_id})
+        assert response["image_weight"] == len(image_data)
+        assert client.recv_image(response["image_weight"]) == image_data
+    finally:
+        client.close()
+
+def test_negotiate_unknown_protocol(server, client):
+    response = client.send_request({"command": "HELLO", "protocol": "carrier-pigeon"})
+    assert response["protocol"] == "legacy"
+    response = client.send_request({"command": "DISCONNECT"})
+    assert response["MESSAGE"] == "Disconnected"
+
+def test_async_framed_pipelined_requests(async_server):
+    client = Client("127.0.0.1", async_server_port, framed=True)
+    try:
+        responses = client.send_requests([
+            {"command": "AUTHENTICATE", "username": "admin", "password": "admin"},
+            {"command": "GET", "table": "rooms"},
+        ])
+        assert responses[0]["MESSAGE"] == "Authentication successful"
+        assert isinstance(responses[1], list)
+    finally:
+        client.close()
+
+def test_stats_requires_admin(server, client):
+    response = client.send_request({"command": "STATS"})
+    assert response["MESSAGE"] == "Authentication required or admin rights required or wrong command"
+    client.send_request({"command": "AUTHENTICATE", "username": "admin", "password": "admin"})
+    response = client.send_request({"command": "STATS"})
+    assert response["dimension_cache"]["hits"] >= 0
+
+TEST_IMAGE = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "server", "test.bmp"))
+
+def set_fourniture_with_image(client, name, image_path):
+    client.send_request({"command": "AUTHENTICATE", "username": "admin", "password": "admin"})
+    for table, value in (("rooms", "Studio"), ("types", "lampe"), ("colors", "Jaune")):
+        client.send_request({"command": "SET", "table": table, "name": value})
+    return client.send_request({
+        "command": "SET", "table": "fournitures", "name": name, "room": "Studio",
+        "type": "lampe", "color": "Jaune", "x_dimension": 30, "y_dimension": 30,
+        "image_path": image_path, "price": 45,
+    })["id"]
+
+@pytest.mark.parametrize("port", [server_port, async_server_port])
+def test_image_download_legacy(server, async_server, port):
+    client = Client("127.0.0.1", port)
+    try:
+        fourniture_id = set_fourniture_with_image(client, "Lamp1", TEST_IMAGE)
+        response = client.send_request({"command": "GET", "table": "fournitures", "id": fourniture_id})
+        assert response["image_weight"] == os.path.getsize(TEST_IMAGE)
+        with open(TEST_IMAGE, "rb") as f:
+            assert client.recv_image(response["image_weight"]) == f.read()
+        # the connection is still usable after the image
+        assert client.send_request({"command": "DISCONNECT"})["MESSAGE"] == "Disconnected"
+    finally:
+        client.close()
+
+def test_image_download_framed_async(async_server, tmp_path):
+    image_path = str(tmp_path / "large.bin")
+    image_data = os.urandom(3 * 1024 * 1024 + 17)
+    with open(image_path, "wb") as f:
+        f.write(image_data)
+    client = Client("127.0.0.1", async_server_port, framed=True)
+    try:
+        fourniture_id = set_fourniture_with_image(client, "Lamp2", image_path)
+        response = client.send_request({"command": "GET", "table": "fournitures", "id": fourniture_id})
+        assert client.recv_image(response["image_weight"]) == image_data
+        assert client.send_request({"command": "DISCONNECT"})["MESSAGE"] == "Disconnected"
+    finally:
+        client.close()
+
+@pytest.mark.parametrize("port", [server_port, async_server_port])
+def test_image_upload_streamed(server, async_server, port, tmp_path):
+    image_path = str(tmp_path / "upload.bmp")
+    client = Client("127.0.0.1", port)
+    try:
+        client.send_request({"command": "AUTHENTICATE", "username": "admin", "password": "admin"})
+        response = client.send_image_file(TEST_IMAGE, image_path)
+        assert response["MESSAGE"] == "Image received"
+        with open(TEST_IMAGE, "rb") as f, open(image_path, "rb") as g:
+            assert f.read() == g.read()
+        assert os.listdir(tmp_path) == ["upload.bmp"]
+    finally:
+        client.close()
+
+@pytest.mark.parametrize("port", [server_port, async_server_port])
+def test_image_upload_interrupted(server, async_server, port, tmp_path):
+    image_path = tmp_path / "existing.bmp"
+    image_path.write_bytes(b"original")
+    client = Client("127.0.0.1", port)
+    client.send_request({"command": "AUTHENTICATE", "username": "admin", "password": "admin"})
+    client.client_socket.send(json.dumps({
+        "command": "RECIEVE_IMAGE", "image_path": str(image_path), "image_weight": 1000
+    }).encode("utf-8"))
+    client.client_socket.sendall(b"x" * 10)
+    time.sleep(0.2)
+    client.close()
+    time.sleep(0.2)
+    assert image_path.read_bytes() == b"original"
+    assert os.listdir(tmp_path) == ["existing.bmp"]
+
+def test_image_upload_size_mismatch(server, tmp_path):
+    image_path = str(tmp_path / "upload.bin")
+    client = Client("127.0.0.1", server_port, framed=True)
+    try:
+        client.send_request({"command": "AUTHENTICATE", "username": "admin", "password": "admin"})
+        request_id = client.send_frame({"command": "RECIEVE_IMAGE", "image_path": image_path, "image_weight": 5})
+        client.client_socket.sendall(encode_frame(request_id, b"abc") + encode_frame(request_id, b"def"))
+        assert json.loads(client.recv_frame(request_id))["MESSAGE"] == "Image size mismatch"
+        assert os.listdir(tmp_path) == []
+    finally:
+        client.close()
+
+def test_image_upload_invalid_request(server, client, tmp_path):
+    client.send_request({"command": "AUTHENTICATE", "username": "admin", "password": "admin"})
+    response = client.send_request({"command": "RECIEVE_IMAGE", "image_path": str(tmp_path / "a.bin"), "image_weight": -1})
+    assert response["MESSAGE"] == "Invalid image weight"
+    response = client.send_request({"command": "RECIEVE_IMAGE", "image_path": str(tmp_path / "missing" / "a.bin"), "image_weight": 1})
+    assert response["MESSAGE"] == "Invalid image path"
+
+def test_client_download_image(server, tmp_path):
+    client = Client("127.0.0.1", server_port)
+    try:
+        fourniture_id = set_fourniture_with_image(client, "Lamp3", TEST_IMAGE)
+        response = client.send_request({"command": "GET", "table": "fournitures", "id": fourniture_id})
+        target = tmp_path / "received.bmp"
+        client.download_image(response["image_weight"], str(target))
+        with open(TEST_IMAGE, "rb") as f:
+            assert target.read_bytes() == f.read()
+        assert os.listdir(tmp_path) == ["received.bmp"]
+    finally:
+        client.close()
+
+def set_searchable_fournitures(client, room, count):
+    client.send_request({"command": "AUTHENTICATE", "username": "admin", "password": "admin"})
+    for table, value in (("rooms", room), ("types", "carton"), ("colors", "Brun")):
+        client.send_request({"command": "SET", "table": table, "name": value})
+    return client.send_requests([{
+        "command": "SET", "table": "fournitures", "name": f"Box{i}", "room": room,
+        "type": "carton", "color": "Brun", "x_dimension": 40, "y_dimension": 40,
+        "image_path": "None", "price": i,
+    } for i in range(count)])
+
+def test_search_pages(server):
+    client = Client("127.0.0.1", server_port)
+    try:
+        set_searchable_fournitures(client, "Grenier", 7)
+        names, cursor = [], None
+        while True:
+            response = client.send_request({"command": "SEARCH", "query": {"room": "Grenier"}, "limit": 3, "cursor": cursor})
+            assert len(response["results"]) <= 3
+            names += [fourniture["name"] for fourniture in response["results"]]
+            cursor = response["next_cursor"]
+            if cursor is None:
+                break
+        assert names == [f"Box{i}" for i in range(7)]
+
+        response = client.send_request({"command": "SEARCH", "query": {"room": "Grenier"}, "limit": 3, "cursor": "nope"})
+        assert response["MESSAGE"] == "Invalid cursor"
+        response = client.send_request({"command": "SEARCH", "query": {"room": "Grenier"}, "limit": 0})
+        assert response["MESSAGE"].startswith("Invalid limit")
+    finally:
+        client.close()
+
+@pytest.mark.parametrize("port", [server_port, async_server_port])
+def test_search_stream(server, async_server, port):
+    client = Client("127.0.0.1", port, framed=True)
+    try:
+        set_searchable_fournitures(client, "Cave", 5)
+        names = [fourniture["name"] for fourniture in client.iter_search({"room": "Cave"}, chunk_size=2)]
+        assert names == [f"Box{i}" for i in range(5)]
+        # the connection is still usable after the stream
+        assert client.send_request({"command": "DISCONNECT"})["MESSAGE"] == "Disconnected"
+    finally:
+        client.close()
+
+def test_search_stream_requires_framed(server, client):
+    response = client.send_request({"command": "SEARCH", "query": {"room": "Grenier"}, "stream": True})
+    assert response["MESSAGE"] == "Streaming requires the framed protocol"
+
+def test_search_pages_ordered_by_price(server):
+    client = Client("127.0.0.1", server_port)
+    try:
+        set_searchable_fournitures(client, "Buanderie", 5)
+        query = {"room": "Buanderie", "min_price": 1}
+        response = client.send_request({"command": "SEARCH", "query": query, "order_by": "-price", "limit": 3})
+        assert [fourniture["price"] for fourniture in response["results"]] == [4, 3, 2]
+        response = client.send_request({"command": "SEARCH", "query": query, "order_by": "-price", "limit": 3, "cursor": response["next_cursor"]})
+        assert [fourniture["price"] for fourniture in response["results"]] == [1]
+        assert response["next_cursor"] is None
+        response = client.send_request({"command": "SEARCH", "query": query, "order_by": "price", "top_k": 2})
+        assert [fourniture["price"] for fourniture in response] == [1, 2]
+    finally:
+        client.close()
+
+def test_suggest(server):
+    client = Client("127.0.0.1", server_port)
+    try:
+        client.send_request({"command": "AUTHENTICATE", "username": "admin", "password": "admin"})
+        client.send_request({"command": "SET", "table": "rooms", "name": "Veranda"})
+        response = client.send_request({"command": "SUGGEST", "prefix": "vera"})
+        assert {"name": "Veranda", "table": "rooms"} in response
+        client.send_request({"command": "DELETE", "table": "rooms", "name": "Veranda"})
+        assert client.send_request({"command": "SUGGEST", "prefix": "vera", "table": "rooms"}) == []
+        assert client.send_request({"command": "SUGGEST", "prefix": "v", "table": "users"})["MESSAGE"] == "Invalid table"
+        assert client.send_request({"command": "SUGGEST", "prefix": "v", "limit": 0})["MESSAGE"].startswith("Invalid limit")
+    finally:
+        client.close()
+
+def test_search_facets(server):
+    client = Client("127.0.0.1", server_port)
+    try:
+        set_searchable_fournitures(client, "Bibliotheque", 3)
+        response = client.send_request({"command": "SEARCH", "query": {"room": "Bibliotheque"}, "facets": True})
+        assert len(response["results"]) == 3
+        assert response["facets"]["room"] == {"Bibliotheque": 3}
+    finally:
+        client.close()
+
+def test_fits(server):
+    client = Client("127.0.0.1", server_port)
+    try:
+        set_searchable_fournitures(client, "Cellier", 2)
+        response = client.send_request({"command": "FITS", "width": 50, "depth": 45, "query": {"room": "Cellier"}})
+        assert [result["name"] for result in response] == ["Box0", "Box1"]
+        assert client.send_request({"command": "FITS", "width": 50, "depth": 30, "rotate": True, "query": {"room": "Cellier"}}) == []
+        assert client.send_request({"command": "FITS", "width": 50})["MESSAGE"] == "Invalid fits"
+    finally:
+        client.close()
+
+def test_place(server):
+    client = Client("127.0.0.1", server_port)
+    try:
+        set_searchable_fournitures(client, "Debarras", 3)
+        ids = [result["id"] for result in client.send_request({"command": "SEARCH", "query": {"room": "Debarras"}})]
+        response = client.send_request({"command": "PLACE", "width": 100, "depth": 40, "ids": ids})
+        assert [(placement["x"], placement["y"]) for placement in response["placements"]] == [(0, 0), (40, 0)]
+        assert response["unplaced"] == ids[2:]
+    finally:
+        client.close()
+
+def test_furnish(server):
+    client = Client("127.0.0.1", server_port)
+    try:
+        set_searchable_fournitures(client, "Mansarde", 4)
+        response = client.send_request({"command": "FURNISH", "room": "Mansarde", "types": {"carton": 2}, "budget": 2, "top_k": 5})
+        assert response["complete"]
+        combinations = [[(item["name"], item["quantity"]) for item in combination["items"]] for combination in response["combinations"]]
+        assert combinations == [[("Box0", 2)], [("Box0", 1), ("Box1", 1)], [("Box0", 1), ("Box2", 1)], [("Box1", 2)]]
+    finally:
+        client.close()
+
+def test_import(server, tmp_path):
+    path = tmp_path / "catalog.jsonl"
+    path.write_text("".join(
+        json.dumps({"name": f"Etagere{i}", "room": "Remise", "type": "etagere", "color": "Gris", "x_dimension": 80, "y_dimension": 30, "price": i}) + "\n"
+        for i in range(3)
+    ) + "{broken\n")
+    for framed in (False, True):
+        client = Client("127.0.0.1", server_port, framed=framed)
+        try:
+            client.send_request({"command": "AUTHENTICATE", "username": "admin", "password": "admin"})
+            response = client.import_catalog(str(path), create=True)
+            assert (response["imported"], response["errors"]) == (3, [{"line": 4, "MESSAGE": "Invalid JSON"}])
+            # The connection is usable after the upload
+            assert len(client.send_request({"command": "SEARCH", "query": {"room": "Remise"}})) == 3 * (framed + 1)
+        finally:
+            client.close()
+
+def test_export(server, tmp_path):
+    client = Client("127.0.0.1", server_port, framed=True)
+    try:
+        set_searchable_fournitures(client, "Veranda", 3)
+        path = tmp_path / "catalog.jsonl.gz"
+        assert client.export_catalog(str(path), gzip=True) == path.stat().st_size
+        rows = [json.loads(line) for line in gzip.decompress(path.read_bytes()).splitlines()]
+        assert [row["name"] for row in rows if row["room"] == "Veranda"] == ["Box0", "Box1", "Box2"]
+        # The connection is usable after the export
+        assert len(client.send_request({"command": "SEARCH", "query": {"room": "Veranda"}})) == 3
+    finally:
+        client.close()
+    client = Client("127.0.0.1", server_port)
+    try:
+        client.send_request({"command": "AUTHENTICATE", "username": "admin", "password": "admin"})
+        assert client.send_request({"command": "EXPORT"})["MESSAGE"] == "Streaming requires the framed protocol"
+    finally:
+        client.close()
+
+def test_export_async(async_server):
+    client = Client("127.0.0.1", async_server_port, framed=True)
+    try:
+        set_searchable_fournitures(client, "Veranda", 2)
+        rows = [json.loads(line) for line in b"".join(client.iter_export()).splitlines()]
+        assert [row["name"] for row in rows if row["room"] == "Veranda"] == ["Box0", "Box1"]
+    finally:
+        client.close()
+
+def test_update(server):
+    client = Client("127.0.0.1", server_port)
+    try:
+        set_searchable_fournitures(client, "Vestibule", 2)
+        ids = [result["id"] for result in client.send_request({"command": "SEARCH", "query": {"room": "Vestibule"}})]
+        response = client.send_request({"command": "UPDATE", "table": "fournitures", "items": [
+            {"id": id, "fields": {"price": 10 + i}} for i, id in enumerate(ids)
+        ]})
+        assert [result["fourniture"]["price"] for result in response["results"]] == [10, 11]
+        response = client.send_request({"command": "UPSERT", "table": "fournitures", "name": "Box0", "room": "Vestibule",
+                                        "type": "carton", "color": "Brun", "x_dimension": 40, "y_dimension": 40, "price": 5})
+        assert response == {"MESSAGE": "Fourniture updated successfully", "ids": ids[:1]}
+        results = client.send_request({"command": "SEARCH", "query": {"room": "Vestibule"}})
+        assert [result["price"] for result in results] == [5, 11]
+    finally:
+        client.close()
+
+def test_oversized_frame_closes_connection(server):
+    server_socket, client_socket = socket.socketpair()
+    try:
+        client_socket.sendall(json.dumps({"command": "HELLO", "protocol": "framed"}).encode("utf-8"))
+        client_socket.sendall(FRAME_HEADER.pack(MAX_FRAME_SIZE + 1, 1))
+        # Returns instead of raising in the connection thread
+        server.handle_client(server_socket)
+        assert client_socket.recv(4096)
+    finally:
+        client_socket.close()
@@ -0,0 +1,40 @@
+import pytest
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from server.suggestions import PrefixIndex, Suggestions
+
+def test_complete_prefix():
+    index = PrefixIndex()
+    index.load(["Chaise", "chaise bleue", "Canapé", "Table", "Chaise"])
+    assert [name for key, name in index.complete("ch")] == ["Chaise", "chaise bleue"]
+    assert [name for key, name in index.complete("CANAPE")] == ["Canapé"]
+    assert [name for key, name in index.complete("")] == ["Canapé", "Chaise", "chaise bleue", "Table"]
+    assert [name for key, name in index.complete("c", limit=1)] == ["Canapé"]
+    assert index.complete("z") == []
+
+def test_add_and_remove_count_duplicates():
+    index = PrefixIndex()
+    index.add("Lampe")
+    index.add("Lampe")
+    assert len(index) == 1
+    assert index.remove("Lampe")
+    assert [name for key, name in index.complete("la")] == ["Lampe"]
+    assert index.remove("Lampe")
+    assert index.complete("la") == []
+    assert not index.remove("Lampe")
+
+def test_suggest_merges_tables():
+    suggestions = Suggestions()
+    suggestions.add("fournitures", "Salon de jardin")
+    suggestions.add("rooms", "Salon")
+    suggestions.add("colors", "Saumon")
+    assert suggestions.suggest("sa") == [
+        {"name": "Salon", "table": "rooms"},
+        {"name": "Salon de jardin", "table": "fournitures"},
+        {"name": "Saumon", "table": "colors"},
+    ]
+    assert suggestions.suggest("sa", ("colors",)) == [{"name": "Saumon", "table": "colors"}]
+    assert len(suggestions.suggest("sa", limit=2)) == 2
@@ -0,0 +1,42 @@
+import pytest
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from server.trigram_index import TrigramIndex, trigrams
+
+def test_trigrams_are_normalized():
+    assert trigrams("Canapé") == trigrams("CANAPE")
+    assert "  s" in trigrams("sofa")
+    assert trigrams("!!") == set()
+
+def test_search_tolerates_typos():
+    index = TrigramIndex()
+    for id, name in enumerate(("Fauteuil velours", "Table basse", "Fauteuil cuir", "Tabouret"), start=1):
+        index.add(id, name)
+    results = index.search("fauteil velour")
+    assert results[0][0] == 1
+    assert [id for id, similarity in index.search("fauteil velour", min_similarity=0.1)] == [1, 3]
+    assert index.search("tabl basse")[0][0] == 2
+    assert index.search("zzz") == []
+
+def test_remove():
+    index = TrigramIndex()
+    index.add(1, "Fauteuil")
+    index.add(2, "Fauteuil")
+    assert index.remove(1, "Fauteuil")
+    assert not index.remove(1, "Fauteuil")
+    assert [id for id, similarity in index.search("fauteuil")] == [2]
+    index.remove(2, "Fauteuil")
+    assert index.postings == {}
+    assert index.stats()["names"] == 0
+
+def test_memory_is_bounded():
+    index = TrigramIndex(max_names=2)
+    assert index.add(1, "Lampe")
+    assert index.add(2, "Lit")
+    assert not index.add(3, "Miroir")
+    assert index.search("miroir") == []
+    assert index.stats()["complete"] is False
+    assert index.stats()["names"] == 2